@@ -0,0 +1,70 @@
+"""
+Benchmark of the startup cost paid by short-lived processes: the package import and the ``instrument()`` call.
+
+Every sample runs in a fresh interpreter so the import caches of one sample do not leak into the next one.
+
+.. code-block:: bash
+    python -m benchmarks.bench_startup --samples 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess  # noqa: S404
+import sys
+
+_SAMPLE_CODE = """
+import json
+import time
+
+start = time.perf_counter()
+from opentelemetry_instrumentation_django_outbox_pattern import DjangoOutboxPatternInstrumentor
+imported = time.perf_counter()
+
+import django
+
+django.setup()
+from opentelemetry.sdk.trace import TracerProvider
+
+tracer_provider = TracerProvider()
+ready = time.perf_counter()
+DjangoOutboxPatternInstrumentor().instrument(tracer_provider=tracer_provider, **{options})
+instrumented = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - start) * 1000, "instrument_ms": (instrumented - ready) * 1000}}))
+"""
+
+SCENARIOS = {
+    "both sides": {},
+    "publisher only": {"instrument_consumer": False},
+    "consumer only": {"instrument_publisher": False},
+}
+
+
+def run_sample(options: dict) -> dict:
+    environment = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "tests.settings")}
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", _SAMPLE_CODE.format(options=repr(options))],
+        check=True,
+        capture_output=True,
+        env=environment,
+        text=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=10, help="Fresh interpreters started per scenario")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<16} {'import p50 (ms)':>16} {'instrument p50 (ms)':>20}")
+    for name, options in SCENARIOS.items():
+        samples = [run_sample(options) for _ in range(args.samples)]
+        import_ms = statistics.median(sample["import_ms"] for sample in samples)
+        instrument_ms = statistics.median(sample["instrument_ms"] for sample in samples)
+        print(f"{name:<16} {import_ms:>16.2f} {instrument_ms:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+End-to-end throughput of the instrumented ``publish`` and ``subscribe`` flows through an in-process STOMP broker stub.
+
+Messages are saved in batches as ``Published`` rows and sent by ``Producer.publish_message_from_database`` while a
+``Consumer`` subscribed to the same destination processes them, both over real STOMP connections to the stub. The
+report has the throughput, the send to process latency percentiles and the number of exported spans per operation.
+
+.. code-block:: bash
+    python -m benchmarks.bench_throughput --messages 5000 --batch-size 500 --mode sampled
+"""
+
+import argparse
+import collections
+import statistics
+import threading
+import time
+import typing
+
+from benchmarks.support import TELEMETRY_MODES
+from benchmarks.support import setup_django
+from benchmarks.support import teardown_django
+from benchmarks.support import telemetry
+
+DESTINATION = "/exchange/throughput/throughput.v1"
+SENT_AT_HEADER = "x-throughput-sent-ns"
+
+
+def percentile(values: typing.List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)] if ordered else float("nan")
+
+
+class Results:
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.latencies_ns: typing.List[int] = []
+        self.finished = threading.Event()
+        self.finished_at = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, headers: dict) -> None:
+        latency = time.perf_counter_ns() - int(headers[SENT_AT_HEADER])
+        with self._lock:
+            self.latencies_ns.append(latency)
+            if len(self.latencies_ns) >= self.expected:
+                self.finished_at = time.perf_counter()
+                self.finished.set()
+
+
+def run(args, mode) -> dict:
+    from django_outbox_pattern.consumers import Consumer
+    from django_outbox_pattern.models import Published
+    from django_outbox_pattern.producers import Producer
+    from stomp.connect import StompConnection12
+
+    from tests.support.stomp_broker import StompBrokerStub
+
+    class TimestampedStompConnection(StompConnection12):
+        def send(self, destination, body, content_type=None, headers=None, **keyword_headers):
+            headers = headers if headers is not None else {}
+            headers[SENT_AT_HEADER] = str(time.perf_counter_ns())
+            return super().send(destination, body, content_type, headers, **keyword_headers)
+
+    results = Results(expected=args.messages)
+
+    def callback(payload):
+        payload.save() if args.callback == "save" else payload.ack()
+        results.record(payload.headers)
+
+    with StompBrokerStub() as broker, telemetry(mode, batch=True) as (tracer_provider, exporter):
+        consumer = Consumer(StompConnection12([broker.host_and_port]), "guest", "guest")
+        consumer.start(callback, DESTINATION)
+        producer = Producer(TimestampedStompConnection([broker.host_and_port]), "guest", "guest")
+        producer._waiting = lambda: None
+
+        started_at = time.perf_counter()
+        remaining = args.messages
+        while remaining:
+            batch_size = min(args.batch_size, remaining)
+            for index in range(batch_size):
+                Published.objects.create(
+                    destination=DESTINATION, body={"index": index, "payload": "x" * args.body_size}
+                )
+            producer.publish_message_from_database()
+            remaining -= batch_size
+        published_at = time.perf_counter()
+
+        completed = results.finished.wait(timeout=args.timeout)
+        consumer.stop()
+        tracer_provider.force_flush()
+        spans_by_operation = collections.Counter(span.name.split(" ")[0] for span in exporter.get_finished_spans())
+        Published.objects.all().delete()
+        consumer.received_class.objects.all().delete()
+
+    consumed = len(results.latencies_ns)
+    elapsed = (results.finished_at if completed else time.perf_counter()) - started_at
+    latencies_ms = [latency / 1_000_000 for latency in results.latencies_ns]
+    return {
+        "mode": mode.name,
+        "consumed": consumed,
+        "publish_msg_per_s": args.messages / (published_at - started_at),
+        "end_to_end_msg_per_s": consumed / elapsed,
+        "latency_p50_ms": statistics.median(latencies_ms) if latencies_ms else float("nan"),
+        "latency_p99_ms": percentile(latencies_ms, 99),
+        "spans": dict(spans_by_operation),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500, help="Messages saved before each publish cycle")
+    parser.add_argument("--body-size", type=int, default=256, help="Approximate body size in bytes")
+    parser.add_argument("--callback", choices=("save", "ack"), default="save", help="What the consumer callback does")
+    parser.add_argument("--mode", nargs="+", choices=[mode.name for mode in TELEMETRY_MODES], default=["sampled"])
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the consumer to finish")
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        reports = [run(args, mode) for mode in TELEMETRY_MODES if mode.name in args.mode]
+    finally:
+        teardown_django()
+
+    print(f"{'mode':<15} {'consumed':>8} {'publish msg/s':>14} {'e2e msg/s':>10} {'p50 ms':>8} {'p99 ms':>8}  spans")
+    for report in reports:
+        spans = ", ".join(f"{operation}={count}" for operation, count in sorted(report["spans"].items()))
+        print(
+            f"{report['mode']:<15} {report['consumed']:>8} {report['publish_msg_per_s']:>14.0f} "
+            f"{report['end_to_end_msg_per_s']:>10.0f} {report['latency_p50_ms']:>8.2f} {report['latency_p99_ms']:>8.2f}"
+            f"  {spans or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
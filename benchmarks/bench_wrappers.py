@@ -0,0 +1,177 @@
+"""
+Per-message overhead of the publisher and consumer wrappers.
+
+Drives ``Producer._send_with_retry``, ``get_message_headers`` and ``Consumer.message_handler`` against an in-process
+fake STOMP connection, uninstrumented, instrumented with every span dropped by the sampler and instrumented with every
+span exported to memory. Timing and allocation are measured in separate passes because ``tracemalloc`` distorts the
+timing.
+
+.. code-block:: bash
+    python -m benchmarks.bench_wrappers --iterations 2000 --body-sizes 64 4096 --header-counts 5 50
+"""
+
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+import typing
+import uuid
+
+from benchmarks.support import TELEMETRY_MODES
+from benchmarks.support import fake_stomp_connection
+from benchmarks.support import setup_django
+from benchmarks.support import teardown_django
+from benchmarks.support import telemetry
+
+DESTINATION = "/exchange/benchmark/benchmark.v1"
+
+
+def make_body(size: int) -> dict:
+    return {"payload": "x" * max(size - 16, 0)}
+
+
+def make_headers(count: int) -> dict:
+    headers = {"dop-correlation-id": str(uuid.uuid4()), "destination": DESTINATION}
+    headers.update({f"x-benchmark-{index}": f"value-{index}" for index in range(max(count - len(headers), 0))})
+    return headers
+
+
+def publisher_send(body: dict, headers: dict) -> typing.Callable[[], None]:
+    from django_outbox_pattern.producers import Producer
+
+    producer = Producer(fake_stomp_connection(), "guest", "guest")
+    encoded_body = json.dumps(body)
+
+    def operation():
+        producer._send_with_retry(body=encoded_body, destination=DESTINATION, headers=dict(headers))
+
+    return operation
+
+
+def save_headers(body: dict, headers: dict) -> typing.Callable[[], None]:
+    from django_outbox_pattern import headers as outbox_headers_module
+    from django_outbox_pattern.models import Published
+
+    def operation():
+        outbox_headers_module.get_message_headers(Published(destination=DESTINATION, body=body, headers=dict(headers)))
+
+    return operation
+
+
+def consumer_handler(body: dict, headers: dict) -> typing.Callable[[], None]:
+    from django_outbox_pattern.consumers import Consumer
+
+    consumer = Consumer(fake_stomp_connection(), "guest", "guest")
+    consumer.callback = lambda payload: payload.ack()
+    encoded_body = json.dumps(body)
+    counter = iter(range(1 << 62))
+
+    def operation():
+        consumer.message_handler(encoded_body, {**headers, "message-id": f"benchmark-{next(counter)}"})
+
+    return operation
+
+
+OPERATIONS = {
+    "send": publisher_send,
+    "save": save_headers,
+    "process": consumer_handler,
+}
+
+
+def time_per_message(operation: typing.Callable[[], None], iterations: int, repeats: int, exporter) -> float:
+    """Median over ``repeats`` runs of the mean nanoseconds per call"""
+    for _ in range(max(iterations // 10, 1)):
+        operation()
+    samples = []
+    for _ in range(repeats):
+        exporter.clear()
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            operation()
+        samples.append((time.perf_counter_ns() - start) / iterations)
+    return statistics.median(samples)
+
+
+def allocated_per_message(operation: typing.Callable[[], None], iterations: int, exporter) -> float:
+    """Mean ``tracemalloc`` peak, in bytes, allocated above the baseline by one call"""
+    exporter.clear()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return statistics.fmean(peaks)
+
+
+def run(args) -> typing.List[dict]:
+    results = []
+    for operation_name in args.operations:
+        for body_size in args.body_sizes:
+            for header_count in args.header_counts:
+                body, headers = make_body(body_size), make_headers(header_count)
+                baseline_ns = None
+                for mode in TELEMETRY_MODES:
+                    with telemetry(mode) as (_, exporter):
+                        operation = OPERATIONS[operation_name](body, headers)
+                        ns_per_message = time_per_message(operation, args.iterations, args.repeats, exporter)
+                        bytes_per_message = allocated_per_message(operation, args.allocation_iterations, exporter)
+                    baseline_ns = ns_per_message if baseline_ns is None else baseline_ns
+                    results.append(
+                        {
+                            "operation": operation_name,
+                            "body_size": body_size,
+                            "header_count": header_count,
+                            "mode": mode.name,
+                            "ns_per_message": ns_per_message,
+                            "overhead_ns_per_message": ns_per_message - baseline_ns,
+                            "allocated_bytes_per_message": bytes_per_message,
+                        }
+                    )
+    return results
+
+
+def print_table(results: typing.List[dict]) -> None:
+    header = f"{'operation':<9} {'body':>6} {'headers':>7} {'mode':<15} {'ns/msg':>10} {'overhead ns':>12}"
+    print(f"{header} {'alloc B/msg':>12}")
+    for result in results:
+        print(
+            f"{result['operation']:<9} {result['body_size']:>6} {result['header_count']:>7} {result['mode']:<15} "
+            f"{result['ns_per_message']:>10.0f} {result['overhead_ns_per_message']:>12.0f} "
+            f"{result['allocated_bytes_per_message']:>12.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--operations", nargs="+", choices=sorted(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument("--body-sizes", nargs="+", type=int, default=[64, 1024, 16384])
+    parser.add_argument("--header-counts", nargs="+", type=int, default=[5, 20])
+    parser.add_argument("--iterations", type=int, default=1000, help="Calls per timing run")
+    parser.add_argument("--repeats", type=int, default=5, help="Timing runs, the median is reported")
+    parser.add_argument("--allocation-iterations", type=int, default=200, help="Calls measured with tracemalloc")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON lines")
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        results = run(args)
+    finally:
+        teardown_django()
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Memory stability soak test of the publisher and consumer wrappers for long-running processes.
+
+Pushes synthetic messages through ``Producer._send_with_retry`` and ``Consumer.message_handler`` against an
+in-process fake STOMP connection, with a share of publisher hooks, consumer hooks, consumer callbacks and broker sends
+raising. Every ``--sample-every`` messages it reports the RSS, the memory traced by ``tracemalloc``, the context
+depth, the number of attached OpenTelemetry context tokens not detached yet, and the messages that left a different
+current context behind. At the end it lists the top allocators grown since the first sample and exits with 1 when a
+growth exceeds its bound.
+
+.. code-block:: bash
+    python -m benchmarks.soak --messages 1000000 --max-rss-growth-mb 32
+"""
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import tracemalloc
+import typing
+
+from opentelemetry import context as otel_context
+from opentelemetry.context.context import _RuntimeContext
+
+from benchmarks.support import TELEMETRY_MODES
+from benchmarks.support import fake_stomp_connection
+from benchmarks.support import setup_django
+from benchmarks.support import teardown_django
+from benchmarks.support import telemetry
+
+DESTINATION = "/exchange/soak/soak.v1"
+# The in-memory exporter is cleared this often, so finished spans do not grow the RSS between samples
+EXPORTED_SPANS_KEPT = 100
+
+
+class SoakFailure(Exception):
+    pass
+
+
+class DepthCountingRuntimeContext(_RuntimeContext):
+    """Runtime context that counts the attached tokens that were not detached yet"""
+
+    def __init__(self, runtime_context: _RuntimeContext):
+        self._runtime_context = runtime_context
+        self.depth = 0
+
+    def attach(self, context):
+        token = self._runtime_context.attach(context)
+        self.depth += 1
+        return token
+
+    def get_current(self):
+        return self._runtime_context.get_current()
+
+    def detach(self, token) -> None:
+        self._runtime_context.detach(token)
+        self.depth -= 1
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak instead of current RSS where /proc is not available, still enough to detect a steady growth
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def failing_every(every: int, message: str) -> typing.Callable[[int], None]:
+    def maybe_raise(index: int) -> None:
+        if every and index % every == 0:
+            raise SoakFailure(message)
+
+    return maybe_raise
+
+
+def make_messages(args) -> typing.Callable[[int], None]:
+    """One synthetic message, sent by the producer and then handled by the consumer"""
+    from django_outbox_pattern.consumers import Consumer
+    from django_outbox_pattern.producers import Producer
+
+    callback_failure = failing_every(args.callback_failure_every, "callback failure")
+    send_failure = failing_every(args.send_failure_every, "send failure")
+
+    producer_connection = fake_stomp_connection()
+    send_frame = producer_connection.send_frame
+
+    def failing_send_frame(cmd, headers=None, body=""):
+        send_failure(int(headers["x-soak-index"]))
+        return send_frame(cmd, headers, body)
+
+    producer_connection.send_frame = failing_send_frame
+    producer = Producer(producer_connection, "guest", "guest")
+
+    consumer = Consumer(fake_stomp_connection(), "guest", "guest")
+
+    def callback(payload):
+        callback_failure(int(payload.headers["x-soak-index"]))
+        payload.ack()
+
+    consumer.callback = callback
+    encoded_body = json.dumps({"payload": "x" * args.body_size})
+
+    def message(index: int) -> None:
+        # Saved messages carry the traceparent of their save span, the send span continues that trace
+        headers = {
+            "dop-correlation-id": f"soak-{index}",
+            "x-soak-index": str(index),
+            "traceparent": f"00-{abs(index):032x}-{abs(index):016x}-01",
+        }
+        try:
+            producer._send_with_retry(body=encoded_body, destination=DESTINATION, headers=headers)
+        except SoakFailure:
+            pass
+        consumer.message_handler(encoded_body, {**headers, "destination": DESTINATION, "message-id": f"soak-{index}"})
+
+    return message
+
+
+def format_mb(size: float) -> str:
+    return f"{size / (1 << 20):>10.2f}"
+
+
+def run(args, mode) -> typing.List[str]:
+    """Soak one telemetry mode, returns the exceeded bounds"""
+    publisher_hook_failure = failing_every(args.hook_failure_every, "publisher hook failure")
+    consumer_hook_failure = failing_every(args.hook_failure_every, "consumer hook failure")
+
+    def publisher_hook(span, body, headers):
+        publisher_hook_failure(int(headers["x-soak-index"]))
+
+    def consumer_hook(span, body, headers):
+        consumer_hook_failure(int(headers["x-soak-index"]))
+
+    runtime_context = DepthCountingRuntimeContext(otel_context._RUNTIME_CONTEXT)
+    previous_runtime_context, otel_context._RUNTIME_CONTEXT = otel_context._RUNTIME_CONTEXT, runtime_context
+    if args.tracemalloc:
+        tracemalloc.start(args.traceback_frames)
+    try:
+        with telemetry(mode, publisher_hook=publisher_hook, consumer_hook=consumer_hook) as (_, exporter):
+            message = make_messages(args)
+            for index in range(1, args.warmup + 1):
+                message(-index)
+                if index % EXPORTED_SPANS_KEPT == 0:
+                    exporter.clear()
+            exporter.clear()
+
+            print(f"\n{mode.name}")
+            print(f"{'messages':>10} {'rss MB':>10} {'traced MB':>10} {'context depth':>14} {'leaked contexts':>16}")
+            leaked_contexts = 0
+            baseline = None
+            snapshot = None
+            sample = None
+            for index in itertools.count(1):
+                if index % args.sample_every == 1 or index > args.messages:
+                    exporter.clear()
+                    traced = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+                    sample = (current_rss_bytes(), traced, runtime_context.depth, leaked_contexts)
+                    print(
+                        f"{index - 1:>10} {format_mb(sample[0])} {format_mb(sample[1])} {sample[2]:>14} {sample[3]:>16}"
+                    )
+                    if baseline is None:
+                        baseline = sample
+                        snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+                if index > args.messages:
+                    break
+                current_context = otel_context.get_current()
+                message(index)
+                leaked_contexts += otel_context.get_current() is not current_context
+                if index % EXPORTED_SPANS_KEPT == 0:
+                    exporter.clear()
+
+            if snapshot is not None:
+                print(f"top {args.top} allocators grown since the first sample")
+                statistics = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                for statistic in statistics[: args.top]:
+                    print(f"  {statistic}")
+    finally:
+        if args.tracemalloc:
+            tracemalloc.stop()
+        otel_context._RUNTIME_CONTEXT = previous_runtime_context
+
+    exceeded = []
+    if sample[0] - baseline[0] > args.max_rss_growth_mb * (1 << 20):
+        exceeded.append(f"{mode.name}: RSS grew {format_mb(sample[0] - baseline[0]).strip()} MB")
+    if sample[1] - baseline[1] > args.max_traced_growth_mb * (1 << 20):
+        exceeded.append(f"{mode.name}: traced memory grew {format_mb(sample[1] - baseline[1]).strip()} MB")
+    if sample[2] != baseline[2]:
+        exceeded.append(f"{mode.name}: context depth went from {baseline[2]} to {sample[2]}")
+    if sample[3]:
+        exceeded.append(f"{mode.name}: {sample[3]} messages left a different current context")
+    return exceeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--warmup", type=int, default=1000, help="Messages handled before the first sample")
+    parser.add_argument("--sample-every", type=int, default=50_000)
+    parser.add_argument("--body-size", type=int, default=256)
+    parser.add_argument("--mode", nargs="+", choices=[mode.name for mode in TELEMETRY_MODES], default=["sampled"])
+    parser.add_argument("--hook-failure-every", type=int, default=10, help="Every Nth hook call raises, 0 never")
+    parser.add_argument("--callback-failure-every", type=int, default=7, help="Every Nth callback raises, 0 never")
+    parser.add_argument("--send-failure-every", type=int, default=13, help="Every Nth broker send raises, 0 never")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=32)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=8)
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false", help="Faster, RSS only")
+    parser.add_argument("--traceback-frames", type=int, default=1, help="Frames kept by tracemalloc per allocation")
+    parser.add_argument("--top", type=int, default=10, help="Allocators listed at the end")
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        exceeded = [bound for mode in TELEMETRY_MODES if mode.name in args.mode for bound in run(args, mode)]
+    finally:
+        teardown_django()
+
+    for bound in exceeded:
+        print(f"FAILED {bound}")
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Shared helpers to run the instrumented django-outbox-pattern code paths without a broker."""
+
+import contextlib
+import logging
+import os
+import typing
+
+import django
+
+_test_database_name = None
+
+
+def setup_django() -> None:
+    """Configure Django with the test settings and create a throwaway test database"""
+    global _test_database_name
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    # Warnings are still created and handled, only not written, so their cost stays in the measurements
+    logging.basicConfig(level=logging.WARNING, handlers=[logging.NullHandler()])
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+
+    # The throughput harness writes from the publishing and the consuming threads at the same time, immediate
+    # transactions make SQLite wait for the write lock instead of failing when a read transaction is upgraded
+    settings.DATABASES["default"].setdefault("OPTIONS", {}).update({"timeout": 30, "transaction_mode": "IMMEDIATE"})
+
+    if _test_database_name is None:
+        _test_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def teardown_django() -> None:
+    global _test_database_name
+
+    from django.db import connection
+
+    if _test_database_name is not None:
+        connection.creation.destroy_test_db(_test_database_name, verbosity=0)
+        _test_database_name = None
+
+
+def fake_stomp_connection():
+    """StompConnection12 that encodes frames in memory instead of sending them to a broker"""
+    from stomp import utils
+    from stomp.connect import StompConnection12
+
+    class FakeStompConnection(StompConnection12):
+        def __init__(self):
+            super().__init__(host_and_ports=[("localhost", 61613)])
+            self.frames_sent = 0
+
+        def send_frame(self, cmd, headers=None, body=""):
+            self.frames_sent += 1
+            return utils.convert_frame(utils.Frame(cmd, headers or {}, body))
+
+        def is_connected(self):
+            return True
+
+    return FakeStompConnection()
+
+
+class TelemetryMode(typing.NamedTuple):
+    name: str
+    instrumented: bool
+    sampled: bool
+
+
+TELEMETRY_MODES = (
+    TelemetryMode("uninstrumented", instrumented=False, sampled=False),
+    TelemetryMode("unsampled", instrumented=True, sampled=False),
+    TelemetryMode("sampled", instrumented=True, sampled=True),
+)
+
+
+@contextlib.contextmanager
+def telemetry(mode: TelemetryMode, batch: bool = False, **instrument_options):
+    """
+    Instrument django-outbox-pattern for ``mode`` with an in-memory exporter, yields the tracer provider and the
+    exporter so callers can flush, count and clear the finished spans. With ``batch`` the spans are exported by a
+    ``BatchSpanProcessor`` as in production, otherwise synchronously.
+    """
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from opentelemetry.sdk.trace.sampling import ALWAYS_OFF
+    from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+
+    from opentelemetry_instrumentation_django_outbox_pattern import DjangoOutboxPatternInstrumentor
+
+    exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider(sampler=ALWAYS_ON if mode.sampled else ALWAYS_OFF)
+    tracer_provider.add_span_processor(BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter))
+    instrumentor = DjangoOutboxPatternInstrumentor()
+    instrumentor.uninstrument()
+    if mode.instrumented:
+        instrumentor.instrument(tracer_provider=tracer_provider, **instrument_options)
+    try:
+        yield tracer_provider, exporter
+    finally:
+        instrumentor.uninstrument()
+        tracer_provider.shutdown()
@@ -48,23 +48,29 @@ and the instrumentor can include a span with telemetry data in this function uti
    python manage.py publish
 """
 
-import threading
+import tracemalloc
 import typing
 
 from django.conf import settings
+from opentelemetry import metrics
 from opentelemetry import trace
 from opentelemetry.instrumentation.instrumentor import BaseInstrumentor
+from opentelemetry.metrics import MeterProvider
 from opentelemetry.trace import TracerProvider
 
-from .instrumentors.consumer_instrument import ConsumerInstrument
-from .instrumentors.publisher_instrument import PublisherInstrument
 from .package import _instruments
+from .utils.runtime_control import CONSUMER
+from .utils.runtime_control import PUBLISHER
+from .utils.runtime_control import SIDES
+from .utils.runtime_control import instrumentation_switch
+from .utils.shared_types import BatchHookT
 from .utils.shared_types import CallbackHookT
 from .version import __version__
 
-_CTX_KEY = "__otel_django_outbox_pattern_span"
+if typing.TYPE_CHECKING:
+    from .utils.traced_greenlet_executor import SpawnT
 
-local_threading = threading.local()
+_CTX_KEY = "__otel_django_outbox_pattern_span"
 
 
 class DjangoOutboxPatternInstrumentor(BaseInstrumentor):
@@ -74,14 +80,68 @@ class DjangoOutboxPatternInstrumentor(BaseInstrumentor):
         """
         return _instruments
 
+    @staticmethod
+    def disable_tracing(side: str, destination: typing.Optional[str] = None) -> None:
+        """
+        Stop tracing a side ("publisher" or "consumer") at runtime, the wrapped functions fall through to the original
+        call. When ``destination`` is given only that destination, as it appears in the span names, is disabled.
+        """
+        instrumentation_switch.disable(side, destination)
+
+    @staticmethod
+    def enable_tracing(side: str, destination: typing.Optional[str] = None) -> None:
+        """
+        Resume tracing a destination of a side, or the whole side and all its destinations when ``destination`` is
+        omitted.
+        """
+        instrumentation_switch.enable(side, destination)
+
+    @staticmethod
+    def is_tracing_enabled(side: str, destination: typing.Optional[str] = None) -> bool:
+        return instrumentation_switch.is_enabled(side, destination)
+
+    def get_hook_stats(self) -> typing.Dict[str, typing.Any]:
+        """
+        In-process hook statistics. ``hooks`` has the count, total, mean and max duration in milliseconds and the calls
+        over budget by hook and destination, ``background`` has the submitted, completed, failed, dropped and queued
+        counters of the background hook executor, or is None when no hook runs in the background.
+        """
+        hook_stats = getattr(self, "_hook_stats", None)
+        hook_executor = getattr(self, "_hook_executor", None)
+        return {
+            "hooks": hook_stats.snapshot() if hook_stats else [],
+            "background": hook_executor.stats() if hook_executor else None,
+        }
+
+    def reset_hook_stats(self) -> None:
+        hook_stats = getattr(self, "_hook_stats", None)
+        if hook_stats:
+            hook_stats.clear()
+
     def _uninstrument(self, **kwargs):
         """
         Function to unwrap publisher and consumer functions from django-outbox-pattern
         """
-        if hasattr(self, "__opentelemetry_tracer_provider"):
-            delattr(self, "__opentelemetry_tracer_provider")
-        ConsumerInstrument().uninstrument()
-        PublisherInstrument().uninstrument()
+        self._tracer_provider = None
+        if getattr(self, "_tracemalloc_started", False):
+            tracemalloc.stop()
+            self._tracemalloc_started = False
+        if getattr(self, "_hook_executor", None) is not None:
+            self._hook_executor.shutdown(timeout=5)
+            self._hook_executor = None
+        if getattr(self, "_watchdog", None) is not None:
+            self._watchdog.shutdown(timeout=5)
+            self._watchdog = None
+        instrumented_sides = getattr(self, "_instrumented_sides", (CONSUMER, PUBLISHER))
+        if CONSUMER in instrumented_sides:
+            from .instrumentors.consumer_instrument import ConsumerInstrument
+
+            ConsumerInstrument().uninstrument()
+        if PUBLISHER in instrumented_sides:
+            from .instrumentors.publisher_instrument import PublisherInstrument
+
+            PublisherInstrument().uninstrument()
+        self._instrumented_sides = ()
 
     def _instrument(self, **kwargs) -> None:
         """
@@ -90,10 +150,63 @@ class DjangoOutboxPatternInstrumentor(BaseInstrumentor):
         Args:
             kwargs (typing.Dict[str, typing.Any]):
                 trace_provider (Optional[TracerProvider]): The tracer provider to use in open-telemetry spans.
+                meter_provider (Optional[MeterProvider]): The meter provider to use in open-telemetry metrics.
                 publisher_hook (CallbackHookT): The callable function to call before original function call, use
                 this to override or enrich the span created in main project.
                 consumer_hook (CallbackHookT): The callable function to call before original function call, use
                 this to override or enrich the span created in main project.
+                track_db_queries (bool): Aggregate the database queries executed by the consumer callback in the
+                process span.
+                db_query_repeat_threshold (int): How many executions of the same normalized statement inside one
+                message flag the process span as a N+1 pattern.
+                profile_cpu_time (bool): Record the thread CPU time of the consumer callback and the broker send in
+                sampled spans.
+                profile_memory (bool): Record the ``tracemalloc`` peak allocation of the same calls, ``tracemalloc`` is
+                started when it is not tracing yet.
+                instrument_publisher (bool): Wrap the publisher functions, disable it in processes that only consume.
+                instrument_consumer (bool): Wrap the consumer functions, disable it in processes that only publish.
+                background_hooks (Collection[str]): Sides ("publisher", "consumer") whose hook runs on a background
+                thread with a read-only snapshot of the span context, body and headers instead of inline. Keep the
+                hooks that change the headers or the span out of it.
+                hook_queue_size (int): Calls the background hook queue holds before dropping.
+                hook_drop_policy (str): "drop_new" discards the call that does not fit, "drop_oldest" the oldest
+                queued call.
+                publisher_batch_hook (BatchHookT): Called once per publishing cycle of the publish command with the
+                ``(span, body, headers, end_time)`` items of the messages sent, before their send spans are ended.
+                publisher_batch_size (int): Items after which the batch hook is called within a long cycle.
+                hook_time_budget_ms (Optional[float]): Hook calls longer than this get a "hook.slow" span event and a
+                rate-limited warning log.
+                consistent_sampling (bool): Propagate the trace context of unsampled messages too and skip the process
+                span of messages whose ``ot=th`` tracestate threshold rejects their trace, use it with the
+                ``ConsistentProbabilitySampler`` in both services.
+                track_redeliveries (bool): Count the deliveries of each consumed message by message id and correlation
+                id, recorded in the process span with a redelivery counter per destination.
+                redelivery_tracker_size (int): Messages whose deliveries are remembered, the least recently delivered
+                are forgotten first.
+                redelivery_ttl_s (float): Seconds after its last delivery a message is forgotten.
+                poison_message_threshold (int): Deliveries after which the process span gets a "message.poison" event.
+                watchdog_deadline_s (Optional[float]): Consumer callbacks running longer than this get a
+                "handler.stuck" event on their process span, a stuck handler count and a warning log.
+                watchdog_interval_s (float): Seconds between two scans of the handlers in progress.
+                watchdog_dump_stack (bool): Log the stack of the stuck worker thread as well.
+                track_pipeline_latency (bool): Stamp the save and send times in the message headers when publishing,
+                and record the send to receive and save to receive latencies when consuming.
+                track_acknowledgements (bool): Record the receive to ack and receive to nack durations and the count
+                of messages not acknowledged yet per listener.
+                destination_templates (Sequence[Tuple[str, str]]): ``(pattern, replacement)`` pairs applied in order
+                with ``re.sub`` to the destinations before they name spans, attributes and metrics, e.g.
+                ``(r"\\.\\d+$", ".{id}")`` to collapse a trailing id of the routing key.
+                max_destination_names (Optional[int]): Distinct destinations kept, the next ones are named "other".
+                measure_overhead_every (Optional[int]): Record the time one call in this many of each wrapper spends
+                in the instrumentation, without the wrapped call, in the instrumentation overhead histogram.
+                worker_executor (str): "thread" runs the messages of a listener on a worker thread, "greenlet" in
+                greenlets for gevent deployments, each in a copy of the context of the listener.
+                greenlet_spawn (Optional[Callable]): Function that starts a greenlet, ``gevent.spawn`` by default.
+                greenlet_concurrency (int): Messages of a listener handled at the same time in greenlet mode.
+                aggregate_saves (bool): The messages saved in one transaction share one "save published" span with
+                their count and total body size per destination, instead of a span per message.
+                track_commit_delay (bool): End the save spans of the messages saved in a transaction when it commits
+                or rolls back, and record the save to commit delay and the rolled back messages per destination.
 
         Returns:
         """
@@ -101,12 +214,185 @@ class DjangoOutboxPatternInstrumentor(BaseInstrumentor):
         if not instrument_django_outbox_pattern:
             return None
 
+        # The helpers load the semantic conventions, the Django database layer and the metrics instruments, they are
+        # imported here so importing the package stays cheap in processes that never instrument
+        from .utils.acknowledgements import AcknowledgementTracker
+        from .utils.formatters import DestinationTemplater
+        from .utils.hooks import DROP_NEW
+        from .utils.hooks import BackgroundHookExecutor
+        from .utils.hooks import HookStats
+        from .utils.hooks import HookTimer
+        from .utils.latency import PipelineLatencyRecorder
+        from .utils.metrics import create_commit_delay_histogram
+        from .utils.metrics import create_hook_duration_histogram
+        from .utils.metrics import create_instrumentation_overhead_histogram
+        from .utils.metrics import create_pipeline_duration_histogram
+        from .utils.metrics import create_receive_to_ack_histogram
+        from .utils.metrics import create_receive_to_nack_histogram
+        from .utils.metrics import create_redelivery_counter
+        from .utils.metrics import create_rolled_back_messages_counter
+        from .utils.metrics import create_stuck_handler_counter
+        from .utils.metrics import create_transit_duration_histogram
+        from .utils.metrics import create_unacked_messages_counter
+        from .utils.overhead import OverheadMeter
+        from .utils.redelivery import DeliveryTracker
+        from .utils.redelivery import RedeliveryMonitor
+        from .utils.traced_greenlet_executor import GREENLET
+        from .utils.traced_greenlet_executor import THREAD
+        from .utils.traced_greenlet_executor import WORKER_EXECUTORS
+        from .utils.transactions import CommitDelayRecorder
+        from .utils.transactions import TransactionWatcher
+        from .utils.watchdog import HandlerWatchdog
+
         tracer_provider: typing.Optional[TracerProvider] = kwargs.get("tracer_provider", None)
+        meter_provider: typing.Optional[MeterProvider] = kwargs.get("meter_provider", None)
         publisher_hook: CallbackHookT = kwargs.get("publisher_hook", None)
         consumer_hook: CallbackHookT = kwargs.get("consumer_hook", None)
+        publisher_batch_hook: BatchHookT = kwargs.get("publisher_batch_hook", None)
+        publisher_batch_size: int = kwargs.get("publisher_batch_size", 500)
+        track_db_queries: bool = kwargs.get("track_db_queries", False)
+        db_query_repeat_threshold: int = kwargs.get("db_query_repeat_threshold", 10)
+        profile_cpu_time: bool = kwargs.get("profile_cpu_time", False)
+        profile_memory: bool = kwargs.get("profile_memory", False)
+        instrument_publisher: bool = kwargs.get("instrument_publisher", True)
+        instrument_consumer: bool = kwargs.get("instrument_consumer", True)
+        background_hooks: typing.Collection[str] = kwargs.get("background_hooks", ())
+        hook_queue_size: int = kwargs.get("hook_queue_size", 1000)
+        hook_drop_policy: str = kwargs.get("hook_drop_policy", DROP_NEW)
+        hook_time_budget_ms: typing.Optional[float] = kwargs.get("hook_time_budget_ms", None)
+        consistent_sampling: bool = kwargs.get("consistent_sampling", False)
+        track_redeliveries: bool = kwargs.get("track_redeliveries", False)
+        redelivery_tracker_size: int = kwargs.get("redelivery_tracker_size", 10_000)
+        redelivery_ttl_s: float = kwargs.get("redelivery_ttl_s", 3600)
+        poison_message_threshold: int = kwargs.get("poison_message_threshold", 5)
+        watchdog_deadline_s: typing.Optional[float] = kwargs.get("watchdog_deadline_s", None)
+        watchdog_interval_s: float = kwargs.get("watchdog_interval_s", 10)
+        watchdog_dump_stack: bool = kwargs.get("watchdog_dump_stack", False)
+        track_pipeline_latency: bool = kwargs.get("track_pipeline_latency", False)
+        track_acknowledgements: bool = kwargs.get("track_acknowledgements", False)
+        destination_templates: typing.Sequence[typing.Tuple[str, str]] = kwargs.get("destination_templates", ())
+        max_destination_names: typing.Optional[int] = kwargs.get("max_destination_names", None)
+        measure_overhead_every: typing.Optional[int] = kwargs.get("measure_overhead_every", None)
+        worker_executor: str = kwargs.get("worker_executor", THREAD)
+        greenlet_spawn: typing.Optional["SpawnT"] = kwargs.get("greenlet_spawn", None)
+        greenlet_concurrency: int = kwargs.get("greenlet_concurrency", 1)
+        aggregate_saves: bool = kwargs.get("aggregate_saves", False)
+        track_commit_delay: bool = kwargs.get("track_commit_delay", False)
+
+        if worker_executor not in WORKER_EXECUTORS:
+            raise ValueError(f"Invalid worker executor {worker_executor!r}, expected one of {WORKER_EXECUTORS}")
+        for side in background_hooks:
+            if side not in SIDES:
+                raise ValueError(f"Invalid side {side!r} in background_hooks, expected one of {SIDES}")
+        self._hook_executor = None
+        if background_hooks:
+            self._hook_executor = BackgroundHookExecutor(max_queue_size=hook_queue_size, drop_policy=hook_drop_policy)
+
+        if profile_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_started = True
 
-        self.__setattr__("__opentelemetry_tracer_provider", tracer_provider)
+        self._tracer_provider = tracer_provider
         tracer = trace.get_tracer(__name__, __version__, tracer_provider)
+        meter = metrics.get_meter(__name__, __version__, meter_provider)
+        hook_duration_histogram = create_hook_duration_histogram(meter)
+        self._hook_stats = HookStats()
+        redelivery_monitor = None
+        if track_redeliveries:
+            redelivery_monitor = RedeliveryMonitor(
+                DeliveryTracker(max_size=redelivery_tracker_size, ttl_s=redelivery_ttl_s),
+                create_redelivery_counter(meter),
+                poison_message_threshold,
+            )
+        latency_recorder = None
+        if track_pipeline_latency:
+            latency_recorder = PipelineLatencyRecorder(
+                create_transit_duration_histogram(meter), create_pipeline_duration_histogram(meter)
+            )
+        self._destination_templater = None
+        if destination_templates or max_destination_names is not None:
+            self._destination_templater = DestinationTemplater(
+                destination_templates, max_names=max_destination_names or 1000
+            )
+        overhead_meter = None
+        if measure_overhead_every is not None:
+            overhead_meter = OverheadMeter(create_instrumentation_overhead_histogram(meter), measure_overhead_every)
+        acknowledgement_tracker = None
+        if track_acknowledgements:
+            acknowledgement_tracker = AcknowledgementTracker(
+                create_receive_to_ack_histogram(meter),
+                create_receive_to_nack_histogram(meter),
+                create_unacked_messages_counter(meter),
+            )
+        transaction_watcher = None
+        if aggregate_saves or track_commit_delay:
+            transaction_watcher = TransactionWatcher()
+        commit_delay_recorder = None
+        if track_commit_delay:
+            commit_delay_recorder = CommitDelayRecorder(
+                transaction_watcher,
+                create_commit_delay_histogram(meter),
+                create_rolled_back_messages_counter(meter),
+            )
+        self._watchdog = None
+        if watchdog_deadline_s is not None and instrument_consumer:
+            current_greenlet = None
+            if worker_executor == GREENLET and watchdog_dump_stack:
+                from greenlet import getcurrent as current_greenlet
+            self._watchdog = HandlerWatchdog(
+                deadline_s=watchdog_deadline_s,
+                scan_interval_s=watchdog_interval_s,
+                counter=create_stuck_handler_counter(meter),
+                dump_stack=watchdog_dump_stack,
+                current_greenlet=current_greenlet,
+            )
+
+        # The instrumentors are imported here so processes that never instrument, or only instrument one side,
+        # do not pay the import of the consumer, the producer and stomp modules.
+        instrumented_sides = []
+        if instrument_consumer:
+            from .instrumentors.consumer_instrument import ConsumerInstrument
+
+            ConsumerInstrument().instrument(
+                tracer=tracer,
+                callback_hook=consumer_hook,
+                track_db_queries=track_db_queries,
+                db_query_repeat_threshold=db_query_repeat_threshold,
+                profile_cpu_time=profile_cpu_time,
+                profile_memory=profile_memory,
+                hook_executor=self._hook_executor if CONSUMER in background_hooks else None,
+                hook_timer=HookTimer(CONSUMER, self._hook_stats, hook_duration_histogram, hook_time_budget_ms),
+                consistent_sampling=consistent_sampling,
+                redelivery_monitor=redelivery_monitor,
+                watchdog=self._watchdog,
+                latency_recorder=latency_recorder,
+                acknowledgement_tracker=acknowledgement_tracker,
+                destination_templater=self._destination_templater,
+                overhead_meter=overhead_meter,
+                worker_executor=worker_executor,
+                greenlet_spawn=greenlet_spawn,
+                greenlet_concurrency=greenlet_concurrency,
+            )
+            instrumented_sides.append(CONSUMER)
+        if instrument_publisher:
+            from .instrumentors.publisher_instrument import PublisherInstrument
 
-        ConsumerInstrument().instrument(tracer=tracer, callback_hook=consumer_hook)
-        PublisherInstrument().instrument(tracer=tracer, callback_hook=publisher_hook)
+            PublisherInstrument().instrument(
+                tracer=tracer,
+                callback_hook=publisher_hook,
+                profile_cpu_time=profile_cpu_time,
+                profile_memory=profile_memory,
+                hook_executor=self._hook_executor if PUBLISHER in background_hooks else None,
+                hook_timer=HookTimer(PUBLISHER, self._hook_stats, hook_duration_histogram, hook_time_budget_ms),
+                batch_hook=publisher_batch_hook,
+                batch_size=publisher_batch_size,
+                consistent_sampling=consistent_sampling,
+                stamp_latency_headers=track_pipeline_latency,
+                destination_templater=self._destination_templater,
+                overhead_meter=overhead_meter,
+                transaction_watcher=transaction_watcher,
+                aggregate_saves=aggregate_saves,
+                commit_delay_recorder=commit_delay_recorder,
+            )
+            instrumented_sides.append(PUBLISHER)
+        self._instrumented_sides = tuple(instrumented_sides)
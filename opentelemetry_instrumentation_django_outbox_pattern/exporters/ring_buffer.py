@@ -0,0 +1,256 @@
+"""
+Flight recorder for spans: a fixed-size memory-mapped ring file that keeps the most recent spans on local disk.
+
+The file is a header followed by ``capacity`` bytes of records written one after the other, wrapping around at the
+end. Each record is a sync marker, the length, the span encoded as compact JSON and a CRC32 of the length and the
+payload. The header holds the total of bytes ever written, so a reader knows where the oldest surviving record starts
+and skips the records overwritten or still being written. The writes land in the page cache of the shared mapping, so
+they survive a crash of the process.
+
+Decode a ring to JSON lines with:
+
+.. code-block:: bash
+    python -m opentelemetry_instrumentation_django_outbox_pattern.exporters.ring_buffer /var/tmp/outbox-spans.ring
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import typing
+import zlib
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from ..utils.fork_safety import register_after_fork
+
+_logger = logging.getLogger(__name__)
+
+_MAGIC = b"OTRB"
+_VERSION = 1
+# magic, version, reserved, capacity, bytes written
+_HEADER = struct.Struct("<4sHHQQ")
+_CURSOR_OFFSET = 16
+_CURSOR = struct.Struct("<Q")
+_RECORD_MARKER = b"\xb5\xa7"
+_RECORD_LENGTH = struct.Struct("<I")
+_RECORD_CRC = struct.Struct("<I")
+_RECORD_OVERHEAD = len(_RECORD_MARKER) + _RECORD_LENGTH.size + _RECORD_CRC.size
+
+
+def encode_span(span: ReadableSpan) -> bytes:
+    parent = span.parent
+    return json.dumps(
+        {
+            "n": span.name,
+            "t": f"{span.context.trace_id:032x}",
+            "s": f"{span.context.span_id:016x}",
+            "p": f"{parent.span_id:016x}" if parent is not None else None,
+            "k": span.kind.name,
+            "st": span.start_time,
+            "et": span.end_time,
+            "sc": span.status.status_code.name,
+            "sd": span.status.description,
+            "a": dict(span.attributes or {}),
+            "e": [[event.name, event.timestamp, dict(event.attributes or {})] for event in span.events],
+        },
+        separators=(",", ":"),
+        default=str,
+    ).encode()
+
+
+def decode_span(payload: bytes) -> typing.Dict[str, typing.Any]:
+    span = json.loads(payload)
+    return {
+        "name": span["n"],
+        "trace_id": span["t"],
+        "span_id": span["s"],
+        "parent_span_id": span["p"],
+        "kind": span["k"],
+        "start_time": span["st"],
+        "end_time": span["et"],
+        "status": {"status_code": span["sc"], "description": span["sd"]},
+        "attributes": span["a"],
+        "events": [
+            {"name": name, "timestamp": timestamp, "attributes": attributes}
+            for name, timestamp, attributes in span["e"]
+        ],
+    }
+
+
+def _encode_record(payload: bytes) -> bytes:
+    length = _RECORD_LENGTH.pack(len(payload))
+    return _RECORD_MARKER + length + payload + _RECORD_CRC.pack(zlib.crc32(length + payload))
+
+
+class RingBufferSpanExporter(SpanExporter):
+    """
+    Writes spans to the ring file at ``path`` of ``capacity`` bytes, the oldest spans are overwritten.
+
+    An existing ring of the same capacity is appended to, any other file at ``path`` is replaced. Threads only hold a
+    lock to reserve the bytes of their record, the encoding and the copy into the mapping run concurrently. Spans larger
+    than the ring are counted in ``dropped`` and not written.
+
+    The write position is not shared between processes, a forked child writes to the ring of the first free worker
+    slot, ``{path}.{slot}`` with a slot below ``max_workers``, held by a ``flock`` on ``{path}.{slot}.lock`` until the
+    child exits. A new worker appends to the ring of the worker that had its slot, so the disk use stays bounded however
+    often the workers are recycled. A child that finds no free slot writes nothing.
+    """
+
+    def __init__(self, path: typing.Union[str, os.PathLike], capacity: int = 16 * 1024 * 1024, max_workers: int = 64):
+        if capacity <= _RECORD_OVERHEAD:
+            raise ValueError(f"Invalid capacity {capacity!r}, expected more than {_RECORD_OVERHEAD} bytes")
+        self.base_path = self.path = os.fspath(path)
+        self.capacity = capacity
+        self.max_workers = max_workers
+        self._slot_fd: typing.Optional[int] = None
+        self._lock = threading.Lock()
+        self._map = self._open()
+        self._cursor = _CURSOR.unpack_from(self._map, _CURSOR_OFFSET)[0]
+        self.dropped = 0
+        register_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        if self._map.closed:
+            return
+        # Closing the inherited mapping and slot lock in the child leaves the parent's mapping, file and lock untouched
+        self._map.close()
+        self._release_slot()
+        self._lock = threading.Lock()
+        slot = self._claim_slot()
+        if slot is None:
+            _logger.warning(
+                "All the %s worker rings of %r are in use, the spans are not recorded.",
+                self.max_workers,
+                self.base_path,
+            )
+            return
+        self.path = f"{self.base_path}.{slot}"
+        self._map = self._open()
+        self._cursor = _CURSOR.unpack_from(self._map, _CURSOR_OFFSET)[0]
+
+    def _claim_slot(self) -> typing.Optional[int]:
+        for slot in range(self.max_workers):
+            fd = os.open(f"{self.base_path}.{slot}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            self._slot_fd = fd
+            return slot
+        return None
+
+    def _release_slot(self) -> None:
+        if self._slot_fd is not None:
+            os.close(self._slot_fd)
+            self._slot_fd = None
+
+    def _open(self) -> mmap.mmap:
+        size = _HEADER.size + self.capacity
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            reuse = False
+            if len(header) == _HEADER.size and os.fstat(fd).st_size == size:
+                magic, version, _, capacity, _ = _HEADER.unpack(header)
+                reuse = magic == _MAGIC and version == _VERSION and capacity == self.capacity
+            if not reuse:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, _VERSION, 0, self.capacity, 0), 0)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _reserve(self, length: int) -> int:
+        with self._lock:
+            offset = self._cursor
+            self._cursor += length
+            _CURSOR.pack_into(self._map, _CURSOR_OFFSET, self._cursor)
+        return offset
+
+    def _write(self, offset: int, record: bytes) -> None:
+        position = offset % self.capacity
+        first = min(len(record), self.capacity - position)
+        start = _HEADER.size + position
+        self._map[start : start + first] = record[:first]
+        if first < len(record):
+            self._map[_HEADER.size : _HEADER.size + len(record) - first] = record[first:]
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._map.closed:
+            return SpanExportResult.FAILURE
+        for span in spans:
+            record = _encode_record(encode_span(span))
+            if len(record) > self.capacity:
+                self.dropped += 1
+                continue
+            self._write(self._reserve(len(record)), record)
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if not self._map.closed:
+            self._map.flush()
+        return True
+
+    def shutdown(self) -> None:
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+        self._release_slot()
+
+
+def read_ring(path: typing.Union[str, os.PathLike]) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Decoded spans of the ring file at ``path``, oldest first, damaged or partly written records are skipped"""
+    with open(path, "rb") as ring_file:
+        data = ring_file.read()
+    magic, version, _, capacity, cursor = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"{os.fspath(path)!r} is not a span ring file")
+    region = data[_HEADER.size : _HEADER.size + capacity]
+    if cursor <= capacity:
+        records = region[:cursor]
+    else:
+        # The oldest surviving bytes follow the write position, the first record there was usually cut in half
+        position = cursor % capacity
+        records = region[position:] + region[:position]
+
+    index = records.find(_RECORD_MARKER)
+    while index != -1:
+        payload_start = index + len(_RECORD_MARKER) + _RECORD_LENGTH.size
+        if payload_start <= len(records):
+            (length,) = _RECORD_LENGTH.unpack_from(records, index + len(_RECORD_MARKER))
+            end = payload_start + length
+            if end + _RECORD_CRC.size <= len(records):
+                payload = records[payload_start:end]
+                (crc,) = _RECORD_CRC.unpack_from(records, end)
+                if crc == zlib.crc32(records[index + len(_RECORD_MARKER) : end]):
+                    try:
+                        yield decode_span(payload)
+                    except (ValueError, KeyError) as unmapped_exception:
+                        _logger.warning(
+                            "An exception occurred while decoding a span record.", exc_info=unmapped_exception
+                        )
+                    index = records.find(_RECORD_MARKER, end + _RECORD_CRC.size)
+                    continue
+        index = records.find(_RECORD_MARKER, index + 1)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Decode a span ring file to JSON lines, oldest span first.")
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+    for span in read_ring(args.path):
+        sys.stdout.write(json.dumps(span) + "\n")
+
+
+if __name__ == "__main__":
+    main()
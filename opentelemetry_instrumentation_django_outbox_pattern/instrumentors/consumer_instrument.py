@@ -1,5 +1,6 @@
+import contextlib
+import contextvars
 import logging
-import threading
 import typing
 
 import wrapt
@@ -9,34 +10,87 @@ from opentelemetry import context
 from opentelemetry import propagate
 from opentelemetry import trace
 from opentelemetry.instrumentation.utils import unwrap
-from opentelemetry.sdk.trace import Tracer
 from opentelemetry.semconv.trace import MessagingOperationValues
 from opentelemetry.trace import SpanKind
 from opentelemetry.trace import Status
 from opentelemetry.trace import StatusCode
+from opentelemetry.trace import Tracer
 from stomp.connect import StompConnection12
 
+from ..utils.acknowledgements import ACK
+from ..utils.acknowledgements import NACK
+from ..utils.acknowledgements import AcknowledgementTracker
+from ..utils.db_queries import track_queries
 from ..utils.django_outbox_pattern_getter import DjangoOutboxPatternGetter
+from ..utils.formatters import DestinationTemplater
 from ..utils.formatters import format_consumer_destination
+from ..utils.hooks import BackgroundHookExecutor
+from ..utils.hooks import HookRunner
+from ..utils.hooks import HookTimer
+from ..utils.hooks import use_span
+from ..utils.latency import PipelineLatencyRecorder
+from ..utils.overhead import OverheadMeter
+from ..utils.profiling import profile_call
+from ..utils.redelivery import RedeliveryMonitor
+from ..utils.runtime_control import CONSUMER
+from ..utils.runtime_control import is_tracing_enabled
+from ..utils.sampling import is_sampled_out
+from ..utils.sampling import sampled_out_span
 from ..utils.shared_types import CallbackHookT
+from ..utils.span import MessageTelemetry
+from ..utils.span import current_message
 from ..utils.span import get_messaging_ack_nack_span
-from ..utils.span import get_span
+from ..utils.span import span_name
+from ..utils.span import start_message_span
+from ..utils.traced_greenlet_executor import GREENLET
+from ..utils.traced_greenlet_executor import THREAD
+from ..utils.traced_greenlet_executor import SpawnT
+from ..utils.traced_greenlet_executor import TracedGreenletExecutor
 from ..utils.traced_thread_pool_executor import TracedThreadPoolExecutor
+from ..utils.watchdog import HandlerWatchdog
 
 _django_outbox_pattern_getter = DjangoOutboxPatternGetter()
 
 _logger = logging.getLogger(__name__)
 
-_thread_local = threading.local()
+_RECEIVE = str(MessagingOperationValues.RECEIVE.value)
+
+# Set while the callback of a message whose destination is disabled runs, its ack and nack are not traced either. Only
+# the wrappers of this module read it, the instrumented calls made by the callback keep their spans
+_untraced_message: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "otel_django_outbox_pattern_untraced_message", default=False
+)
 
 
 class ConsumerInstrument:
     @staticmethod
-    def instrument(tracer: Tracer, callback_hook: CallbackHookT = None):
+    def instrument(
+        tracer: Tracer,
+        callback_hook: CallbackHookT = None,
+        track_db_queries: bool = False,
+        db_query_repeat_threshold: int = 10,
+        profile_cpu_time: bool = False,
+        profile_memory: bool = False,
+        hook_executor: typing.Optional[BackgroundHookExecutor] = None,
+        hook_timer: typing.Optional[HookTimer] = None,
+        consistent_sampling: bool = False,
+        redelivery_monitor: typing.Optional[RedeliveryMonitor] = None,
+        watchdog: typing.Optional[HandlerWatchdog] = None,
+        latency_recorder: typing.Optional[PipelineLatencyRecorder] = None,
+        acknowledgement_tracker: typing.Optional[AcknowledgementTracker] = None,
+        destination_templater: typing.Optional[DestinationTemplater] = None,
+        overhead_meter: typing.Optional[OverheadMeter] = None,
+        worker_executor: str = THREAD,
+        greenlet_spawn: typing.Optional[SpawnT] = None,
+        greenlet_concurrency: int = 1,
+    ):
         """Instrumentor function to create span and instrument consumer"""
+        run_hook = HookRunner(callback_hook, _logger, hook_executor, hook_timer)
 
         def common_ack_or_nack_span(span_event_name: str, span_status: Status, wrapped_function: typing.Callable):
             try:
+                if acknowledgement_tracker is not None:
+                    acknowledgement_tracker.acknowledged(ACK if span_event_name == "message.ack" else NACK)
                 process_span = trace.get_current_span()
                 if process_span and process_span.is_recording():
                     process_span.add_event(span_event_name)
@@ -46,6 +100,7 @@ class ConsumerInstrument:
                     tracer=tracer,
                     operation="ack" if span_event_name == "message.ack" else "nack",
                     process_span=process_span,
+                    message=current_message.get(),
                 )
                 if ack_nack_span and ack_nack_span.is_recording():
                     ack_nack_span.add_event(span_event_name)
@@ -56,53 +111,119 @@ class ConsumerInstrument:
             return wrapped_function
 
         def wrapper_nack(wrapped, instance, args, kwargs):
+            if _untraced_message.get() or not is_tracing_enabled(CONSUMER):
+                return wrapped(*args, **kwargs)
             return common_ack_or_nack_span("message.nack", Status(StatusCode.ERROR), wrapped(*args, **kwargs))
 
         def wrapper_ack(wrapped, instance, args, kwargs):
+            if _untraced_message.get() or not is_tracing_enabled(CONSUMER):
+                return wrapped(*args, **kwargs)
             return common_ack_or_nack_span("message.ack", Status(StatusCode.OK), wrapped(*args, **kwargs))
 
         def wrapped_message_handler(wrapped, instance, args, kwargs):
+            token = None
             try:
                 body = args[0]
                 headers = args[1]
                 destination = format_consumer_destination(headers)
-                ctx = propagate.extract(headers, getter=_django_outbox_pattern_getter)
-                if not ctx:
-                    ctx = context.get_current()
-                token = context.attach(ctx)
-
-                span = get_span(
-                    tracer=tracer,
-                    destination=destination,
-                    span_kind=SpanKind.CONSUMER,
-                    headers=headers,
-                    body=body,
-                    span_name=f"process {destination}",
-                    operation=str(MessagingOperationValues.RECEIVE.value),
-                )
+                if destination_templater is not None:
+                    destination = destination_templater(destination)
+                tracing_enabled = is_tracing_enabled(CONSUMER, destination)
+                if tracing_enabled:
+                    ctx = propagate.extract(headers, getter=_django_outbox_pattern_getter)
+                    if not ctx:
+                        ctx = context.get_current()
+                    token = context.attach(ctx)
+
+                    message = MessageTelemetry.from_message(destination, headers, body, operation=_RECEIVE)
+                    parent_span_context = trace.get_current_span(ctx).get_span_context()
+                    if consistent_sampling and is_sampled_out(parent_span_context):
+                        # The publisher dropped this message trace, whatever the sampler of this service decides
+                        span = sampled_out_span(parent_span_context)
+                    else:
+                        span = start_message_span(tracer, message, SpanKind.CONSUMER, span_name("process", destination))
 
             except Exception as unmapped_exception:
+                if token is not None:
+                    context.detach(token)
                 _logger.warning("An exception occurred in the instrument_callback wrap.", exc_info=unmapped_exception)
                 return wrapped(*args, **kwargs)
 
+            if not tracing_enabled:
+                # The ack and nack wrappers of this message must fall through as well
+                untraced_token = _untraced_message.set(True)
+                try:
+                    return wrapped(*args, **kwargs)
+                finally:
+                    _untraced_message.reset(untraced_token)
+
+            watchdog_key = None
+            message_token = None
+            delivery_token = None
             try:
-                with trace.use_span(span, end_on_exit=True):
-                    if callback_hook:
+                with use_span(span, end_on_exit=True):
+                    # Inside the try, so the context is detached and the span ended whatever fails here
+                    try:
+                        message_token = current_message.set(message)
+                        if watchdog is not None:
+                            watchdog_key = watchdog.track(span, destination)
+                        if acknowledgement_tracker is not None:
+                            delivery_token = acknowledgement_tracker.received(
+                                destination, getattr(instance, "listener_name", "")
+                            )
+                    except Exception as unmapped_exception:
+                        _logger.warning(
+                            "An exception occurred while tracking the message in progress.",
+                            exc_info=unmapped_exception,
+                        )
+                    if latency_recorder is not None:
                         try:
-                            callback_hook(span, body, headers)
-                        except Exception as hook_exception:
-                            _logger.warning("An exception occurred in the callback hook.", exc_info=hook_exception)
-                    return wrapped(*args, **kwargs)
+                            latency_recorder.record(span, destination, headers)
+                        except Exception as unmapped_exception:
+                            _logger.warning(
+                                "An exception occurred while recording the message latency.",
+                                exc_info=unmapped_exception,
+                            )
+                    if redelivery_monitor is not None:
+                        try:
+                            redelivery_monitor.record(span, destination, headers)
+                        except Exception as unmapped_exception:
+                            _logger.warning(
+                                "An exception occurred while tracking the message deliveries.",
+                                exc_info=unmapped_exception,
+                            )
+                    if run_hook:
+                        run_hook(span, body, headers, destination)
+                    with contextlib.ExitStack() as stack:
+                        if span.is_recording():
+                            if track_db_queries:
+                                stack.enter_context(track_queries(span, db_query_repeat_threshold))
+                            if profile_cpu_time or profile_memory:
+                                stack.enter_context(profile_call(span, profile_cpu_time, profile_memory))
+                        return wrapped(*args, **kwargs)
             finally:
+                if watchdog_key is not None:
+                    watchdog.untrack(watchdog_key)
+                if delivery_token is not None:
+                    acknowledgement_tracker.finished(delivery_token)
+                if message_token is not None:
+                    current_message.reset(message_token)
                 context.detach(token)
 
         def wrapper_create_new_worker_executor(wrapped, instance, *args, **kwargs):
+            if worker_executor == GREENLET:
+                return TracedGreenletExecutor(spawn=greenlet_spawn, max_concurrency=greenlet_concurrency)
             return TracedThreadPoolExecutor(
                 tracer=trace.get_tracer(__name__),
                 max_workers=1,
                 thread_name_prefix=instance.listener_name,
             )
 
+        if overhead_meter is not None:
+            wrapped_message_handler = overhead_meter.wrap(wrapped_message_handler)
+            wrapper_ack = overhead_meter.wrap(wrapper_ack)
+            wrapper_nack = overhead_meter.wrap(wrapper_nack)
+
         wrapt.wrap_function_wrapper(Consumer, "message_handler", wrapped_message_handler)
         wrapt.wrap_function_wrapper(Consumer, "_create_new_worker_executor", wrapper_create_new_worker_executor)
         wrapt.wrap_function_wrapper(StompConnection12, "ack", wrapper_ack)
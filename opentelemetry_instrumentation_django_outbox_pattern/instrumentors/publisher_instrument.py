@@ -1,91 +1,229 @@
+import contextvars
 import json
 import logging
+import sys
+import typing
 
 import wrapt
 
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.db import transaction
 from django_outbox_pattern import headers as outbox_headers_module
 from django_outbox_pattern.producers import Producer
 from opentelemetry import context
 from opentelemetry import propagate
 from opentelemetry import trace
 from opentelemetry.instrumentation.utils import unwrap
-from opentelemetry.sdk.trace import Tracer
 from opentelemetry.semconv.trace import MessagingOperationValues
 from opentelemetry.trace import SpanKind
+from opentelemetry.trace import Tracer
 
 from ..utils.django_outbox_pattern_getter import DjangoOutboxPatternGetter
+from ..utils.formatters import DestinationTemplater
 from ..utils.formatters import format_publisher_destination
+from ..utils.hooks import BackgroundHookExecutor
+from ..utils.hooks import HookRunner
+from ..utils.hooks import HookTimer
+from ..utils.hooks import SpanBatch
+from ..utils.hooks import use_span
+from ..utils.latency import SAVED_TIME_HEADER
+from ..utils.latency import SENT_TIME_HEADER
+from ..utils.latency import stamp_time
+from ..utils.overhead import OverheadMeter
+from ..utils.profiling import profile_call
+from ..utils.runtime_control import PUBLISHER
+from ..utils.runtime_control import is_tracing_enabled
+from ..utils.save_summary import TransactionSaveSummaries
+from ..utils.save_summary import current_save_summary
+from ..utils.shared_types import BatchHookT
 from ..utils.shared_types import CallbackHookT
-from ..utils.span import get_span
+from ..utils.span import MessageTelemetry
+from ..utils.span import span_name
+from ..utils.span import start_message_span
+from ..utils.transactions import CommitDelayRecorder
+from ..utils.transactions import TransactionWatcher
 
 _django_outbox_pattern_getter = DjangoOutboxPatternGetter()
 
+_OUTBOX_MODELS_MODULE = "django_outbox_pattern.models"
+
 _logger = logging.getLogger(__name__)
 
+# Publishing cycle of the publish command in progress, a context variable so it stays with the greenlet under gevent
+_current_span_batch: contextvars.ContextVar[typing.Optional[SpanBatch]] = contextvars.ContextVar(
+    "otel_django_outbox_pattern_span_batch", default=None
+)
+
+_PUBLISH = str(MessagingOperationValues.PUBLISH.value)
+
+
+def _decode_body(encoded_body: str) -> typing.Any:
+    """Body handed to the hooks, the encoded body when it is not JSON"""
+    try:
+        return json.loads(encoded_body)
+    except (TypeError, ValueError) as unmapped_exception:
+        _logger.warning("An exception occurred while decoding the message body.", exc_info=unmapped_exception)
+        return encoded_body
+
 
 class PublisherInstrument:
     @staticmethod
-    def instrument(tracer: Tracer, callback_hook: CallbackHookT = None):
+    def instrument(
+        tracer: Tracer,
+        callback_hook: CallbackHookT = None,
+        profile_cpu_time: bool = False,
+        profile_memory: bool = False,
+        hook_executor: typing.Optional[BackgroundHookExecutor] = None,
+        hook_timer: typing.Optional[HookTimer] = None,
+        batch_hook: BatchHookT = None,
+        batch_size: int = 500,
+        consistent_sampling: bool = False,
+        stamp_latency_headers: bool = False,
+        destination_templater: typing.Optional[DestinationTemplater] = None,
+        overhead_meter: typing.Optional[OverheadMeter] = None,
+        transaction_watcher: typing.Optional[TransactionWatcher] = None,
+        aggregate_saves: bool = False,
+        commit_delay_recorder: typing.Optional[CommitDelayRecorder] = None,
+    ):
         """Instrumentor to create span and instrument publisher"""
+        run_hook = HookRunner(callback_hook, _logger, hook_executor, hook_timer)
+        transaction_save_summaries = None
+        if aggregate_saves and transaction_watcher is not None:
+            transaction_save_summaries = TransactionSaveSummaries(tracer, transaction_watcher)
+
+        def should_inject(span) -> bool:
+            # With consistent sampling the drop decision and its threshold travel with the message as well, so the
+            # consumer does not start a new trace for a message whose trace was dropped
+            return span.is_recording() or (consistent_sampling and span.get_span_context().is_valid)
 
         def on_send_message(wrapped, instance, args, kwargs):
             try:
                 destination = format_publisher_destination(destination=kwargs.get("destination"))
+                if destination_templater is not None:
+                    destination = destination_templater(destination)
+                tracing_enabled = is_tracing_enabled(PUBLISHER, destination)
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred in the on_send_message wrap.", exc_info=unmapped_exception)
+                return wrapped(**kwargs)
+
+            if not tracing_enabled:
+                return wrapped(**kwargs)
+
+            try:
                 message_headers = kwargs.get("headers", {})
-                body = json.loads(kwargs.get("body", {}))
+                if stamp_latency_headers:
+                    stamp_time(message_headers, SENT_TIME_HEADER)
+                message = MessageTelemetry.from_message(
+                    destination, message_headers, kwargs.get("body", "{}"), operation=_PUBLISH
+                )
 
                 ctx = propagate.extract(message_headers, getter=_django_outbox_pattern_getter)
                 if not ctx:
                     ctx = context.get_current()
                 token = context.attach(ctx)
-
-                span = get_span(
-                    tracer=tracer,
-                    destination=destination,
-                    span_kind=SpanKind.PRODUCER,
-                    headers=message_headers,
-                    body=body,
-                    span_name=f"send {destination}",
-                    operation=str(MessagingOperationValues.PUBLISH.value),
-                )
-                with trace.use_span(span, end_on_exit=True):
-                    if span.is_recording():
-                        propagate.inject(message_headers)
-                        if callback_hook:
-                            try:
-                                callback_hook(span, body, message_headers)
-                            except Exception as hook_exception:
-                                _logger.warning("An exception occurred in the callback hook.", exc_info=hook_exception)
-                    if token:
-                        context.detach(token)
-                    return wrapped(**kwargs)
+                try:
+                    span = start_message_span(tracer, message, SpanKind.PRODUCER, span_name("send", destination))
+                finally:
+                    context.detach(token)
             except Exception as unmapped_exception:
                 _logger.warning("An exception occurred in the on_send_message wrap.", exc_info=unmapped_exception)
                 return wrapped(**kwargs)
 
+            # The original call is made exactly once and outside the handlers above, so a failing send is recorded
+            # in the span and raised to the producer retry instead of being sent a second time
+            # Inside a publishing cycle with a batch hook the span is ended by the batch, after the hook ran
+            span_batch = _current_span_batch.get() if span.is_recording() else None
+            # Only the hooks read the decoded body, unsampled messages are never decoded
+            decode = span.is_recording() and (run_hook or span_batch is not None)
+            body = _decode_body(kwargs.get("body", "{}")) if decode else None
+            with use_span(span, end_on_exit=span_batch is None):
+                if should_inject(span):
+                    try:
+                        propagate.inject(message_headers)
+                    except Exception as unmapped_exception:
+                        _logger.warning(
+                            "An exception occurred in the on_send_message wrap.", exc_info=unmapped_exception
+                        )
+                if span.is_recording():
+                    if run_hook:
+                        run_hook(span, body, message_headers, destination)
+                try:
+                    if span.is_recording() and (profile_cpu_time or profile_memory):
+                        with profile_call(span, profile_cpu_time, profile_memory):
+                            return wrapped(**kwargs)
+                    return wrapped(**kwargs)
+                finally:
+                    if span_batch is not None:
+                        span_batch.add(span, body, message_headers)
+
+        def on_publish_message_from_database(wrapped, instance, args, kwargs):
+            span_batch = SpanBatch(batch_hook, _logger, batch_size)
+            token = _current_span_batch.set(span_batch)
+            try:
+                return wrapped(*args, **kwargs)
+            finally:
+                _current_span_batch.reset(token)
+                span_batch.flush()
+
+        def on_waiting(wrapped, instance, args, kwargs):
+            # The cycle is over when the producer starts waiting, do not hold the spans during the sleep
+            span_batch = _current_span_batch.get()
+            if span_batch is not None:
+                span_batch.flush()
+            return wrapped(*args, **kwargs)
+
         def on_get_message_headers(wrapped, instance, args, kwargs):
             message_headers = wrapped(*args, **kwargs)
             try:
                 published = args[0]
+                # The switch knows the destinations as the send spans name them, one switch covers both spans
+                switch_destination = published.destination
+                if "/" in switch_destination:
+                    switch_destination = format_publisher_destination(switch_destination)
+                if destination_templater is not None:
+                    switch_destination = destination_templater(switch_destination)
+                if not is_tracing_enabled(PUBLISHER, switch_destination):
+                    return message_headers
                 destination = published.destination
-                body = json.loads(json.dumps(published.body, cls=DjangoJSONEncoder))
-                span = get_span(
-                    tracer=tracer,
-                    destination=destination,
-                    span_kind=SpanKind.PRODUCER,
-                    headers=message_headers,
-                    body=body,
-                    span_name=f"save published {destination}",
+                if destination_templater is not None:
+                    destination = destination_templater(destination)
+                if stamp_latency_headers:
+                    # Published.save regenerates the headers on every save, keep the time of the first one
+                    stamp_time(message_headers, SAVED_TIME_HEADER, overwrite=False)
+                encoded_body = json.dumps(published.body, cls=DjangoJSONEncoder)
+                message = MessageTelemetry.from_message(destination, message_headers, encoded_body)
+                # Later saves, e.g. the status updates of the producer, are not new messages of the transaction
+                inserting = published._state.adding
+                using = None
+                if inserting and (transaction_save_summaries is not None or commit_delay_recorder is not None):
+                    using = router.db_for_write(type(published), instance=published)
+                summary = current_save_summary(tracer, message) if inserting else None
+                if summary is None and inserting and transaction_save_summaries is not None:
+                    summary = transaction_save_summaries.get(message, using)
+                if summary is not None:
+                    if commit_delay_recorder is not None:
+                        commit_delay_recorder.track(message, using)
+                    # The message joins the summary span, its headers still carry the context for the send span
+                    span = summary.add(message)
+                    if should_inject(span):
+                        propagate.inject(message_headers, context=trace.set_span_in_context(span))
+                    if span.is_recording() and run_hook:
+                        run_hook(span, json.loads(encoded_body), message_headers, destination)
+                    return message_headers
+                span = start_message_span(tracer, message, SpanKind.PRODUCER, span_name("save published", destination))
+                # Inside a transaction the span is ended by the commit or the rollback
+                deferred = (
+                    inserting
+                    and commit_delay_recorder is not None
+                    and commit_delay_recorder.track(message, using, span)
                 )
-                with trace.use_span(span, end_on_exit=True):
-                    if span.is_recording():
+                with use_span(span, end_on_exit=not deferred):
+                    if should_inject(span):
                         propagate.inject(message_headers)
-                        if callback_hook:
-                            try:
-                                callback_hook(span, body, message_headers)
-                            except Exception as hook_exception:
-                                _logger.warning("An exception occurred in the callback hook.", exc_info=hook_exception)
+                    if span.is_recording():
+                        if run_hook:
+                            run_hook(span, json.loads(encoded_body), message_headers, destination)
                     return message_headers
             except Exception as unmapped_exception:
                 _logger.warning(
@@ -93,11 +231,36 @@ class PublisherInstrument:
                 )
                 return message_headers
 
+        def on_atomic_exit(wrapped, instance, args, kwargs):
+            try:
+                return wrapped(*args, **kwargs)
+            finally:
+                transaction_watcher.resolve(instance.using)
+
+        if overhead_meter is not None:
+            on_send_message = overhead_meter.wrap(on_send_message)
+            on_get_message_headers = overhead_meter.wrap(on_get_message_headers)
+
         wrapt.wrap_function_wrapper(Producer, "_send_with_retry", on_send_message)
+        if batch_hook:
+            wrapt.wrap_function_wrapper(Producer, "publish_message_from_database", on_publish_message_from_database)
+            wrapt.wrap_function_wrapper(Producer, "_waiting", on_waiting)
         wrapt.wrap_function_wrapper(outbox_headers_module, "get_message_headers", on_get_message_headers)
+        # Published.save calls the name imported in the models module, when the apps are already loaded that
+        # reference was taken before the wrap above
+        if _OUTBOX_MODELS_MODULE in sys.modules:
+            wrapt.wrap_function_wrapper(_OUTBOX_MODELS_MODULE, "get_message_headers", on_get_message_headers)
+        if transaction_watcher is not None:
+            # Django discards the on_commit callbacks of a rollback silently, the watcher looks for them on every exit
+            wrapt.wrap_function_wrapper(transaction.Atomic, "__exit__", on_atomic_exit)
 
     @staticmethod
     def uninstrument():
         """Uninstrument publisher functions from django-outbox-pattern"""
         unwrap(Producer, "_send_with_retry")
+        unwrap(Producer, "publish_message_from_database")
+        unwrap(Producer, "_waiting")
         unwrap(outbox_headers_module, "get_message_headers")
+        if _OUTBOX_MODELS_MODULE in sys.modules:
+            unwrap(sys.modules[_OUTBOX_MODELS_MODULE], "get_message_headers")
+        unwrap(transaction.Atomic, "__exit__")
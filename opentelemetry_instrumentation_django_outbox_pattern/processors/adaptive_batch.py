@@ -0,0 +1,212 @@
+import collections
+import logging
+import threading
+import time
+import typing
+
+from opentelemetry.context import Context
+from opentelemetry.instrumentation.utils import suppress_instrumentation
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace import Span
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.trace import StatusCode
+
+from ..utils.fork_safety import register_after_fork
+
+_logger = logging.getLogger(__name__)
+
+ERROR = "error"
+NACK = "nack"
+OTHER = "other"
+ACK = "ack"
+# Under back-pressure a span only replaces queued spans of a later category
+CATEGORIES = (ERROR, NACK, OTHER, ACK)
+_PRIORITIES = {category: priority for priority, category in enumerate(CATEGORIES)}
+_SHUTDOWN_DRAIN_TIMEOUT_S = 30
+
+
+def span_category(span: ReadableSpan) -> str:
+    # nack spans always have the error status, the name is checked first so they get a category of their own
+    if span.name.startswith("nack "):
+        return NACK
+    if span.status.status_code == StatusCode.ERROR:
+        return ERROR
+    if span.name.startswith("ack "):
+        return ACK
+    return OTHER
+
+
+class AdaptiveBatchSpanProcessor(SpanProcessor):
+    """
+    Batch span processor whose batch size and flush interval follow the observed span rate.
+
+    The rate is an exponentially weighted moving average of the spans queued between exports. A batch holds what
+    arrives in ``max_schedule_delay_ms`` at that rate, between ``min_batch_size`` and ``max_batch_size``, and is
+    exported when it is full or after the time the rate needs to fill it, so bursts are exported in large batches
+    without waiting and quiet periods do not wake the exporter for a handful of spans.
+
+    When the queue is full an errored or nack span replaces the oldest queued span of a later category, ack spans
+    last, and the spans that cannot be queued are counted by category in ``stats()["dropped"]``.
+    """
+
+    def __init__(
+        self,
+        span_exporter: SpanExporter,
+        max_queue_size: int = 8192,
+        min_batch_size: int = 64,
+        max_batch_size: int = 2048,
+        min_schedule_delay_ms: float = 100,
+        max_schedule_delay_ms: float = 5000,
+        rate_smoothing: float = 0.3,
+    ):
+        if not 0 < min_batch_size <= max_batch_size <= max_queue_size:
+            raise ValueError("Expected 0 < min_batch_size <= max_batch_size <= max_queue_size")
+        if not 0 < min_schedule_delay_ms <= max_schedule_delay_ms:
+            raise ValueError("Expected 0 < min_schedule_delay_ms <= max_schedule_delay_ms")
+        self.span_exporter = span_exporter
+        self.max_queue_size = max_queue_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_schedule_delay = min_schedule_delay_ms / 1000
+        self.max_schedule_delay = max_schedule_delay_ms / 1000
+        self.rate_smoothing = rate_smoothing
+        self._condition = threading.Condition(threading.Lock())
+        self._export_lock = threading.Lock()
+        self._queues: typing.Dict[str, typing.Deque[ReadableSpan]] = {
+            category: collections.deque() for category in CATEGORIES
+        }
+        self._queued = 0
+        self._arrived = 0
+        self._rate = 0.0
+        self._last_export = time.monotonic()
+        self._shutdown = False
+        self.exported = 0
+        self.dropped = {category: 0 for category in CATEGORIES}
+        self._start_worker()
+        register_after_fork(self._reset_after_fork)
+
+    def _start_worker(self) -> None:
+        self._worker = threading.Thread(target=self._run, name="otel-outbox-adaptive-batch", daemon=True)
+        self._worker.start()
+
+    def _reset_after_fork(self) -> None:
+        """The spans queued by the parent are exported by the parent, the child starts an empty queue and its worker"""
+        self._condition = threading.Condition(threading.Lock())
+        self._export_lock = threading.Lock()
+        self._queues = {category: collections.deque() for category in CATEGORIES}
+        self._queued = 0
+        self._arrived = 0
+        self._last_export = time.monotonic()
+        if not self._shutdown:
+            self._start_worker()
+
+    @property
+    def batch_size(self) -> int:
+        return min(max(int(self._rate * self.max_schedule_delay), self.min_batch_size), self.max_batch_size)
+
+    @property
+    def schedule_delay(self) -> float:
+        if self._rate <= 0:
+            return self.max_schedule_delay
+        return min(max(self.batch_size / self._rate, self.min_schedule_delay), self.max_schedule_delay)
+
+    def on_start(self, span: Span, parent_context: typing.Optional[Context] = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown or not span.context.trace_flags.sampled:
+            return
+        category = span_category(span)
+        with self._condition:
+            self._arrived += 1
+            if self._queued >= self.max_queue_size and not self._make_room(category):
+                self.dropped[category] += 1
+                return
+            self._queues[category].append(span)
+            self._queued += 1
+            if self._queued >= self.batch_size:
+                self._condition.notify()
+
+    def _make_room(self, category: str) -> bool:
+        """Drop the oldest queued span of the latest category after ``category``, False when there is none"""
+        for later in reversed(CATEGORIES[_PRIORITIES[category] + 1 :]):
+            if self._queues[later]:
+                self._queues[later].popleft()
+                self._queued -= 1
+                self.dropped[later] += 1
+                return True
+        return False
+
+    def _take_batch(self, size: int) -> typing.List[ReadableSpan]:
+        batch: typing.List[ReadableSpan] = []
+        for category in CATEGORIES:
+            spans = self._queues[category]
+            while spans and len(batch) < size:
+                batch.append(spans.popleft())
+        self._queued -= len(batch)
+        return batch
+
+    def _update_rate(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_export
+        if elapsed > 0:
+            observed = self._arrived / elapsed
+            self._rate = self.rate_smoothing * observed + (1 - self.rate_smoothing) * self._rate
+        self._arrived = 0
+        self._last_export = now
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._shutdown or self._queued >= self.batch_size, timeout=self.schedule_delay
+                )
+                if self._shutdown:
+                    return
+                self._update_rate()
+                batch = self._take_batch(self.batch_size)
+            self._export(batch)
+
+    def _export(self, batch: typing.List[ReadableSpan]) -> None:
+        if not batch:
+            return
+        try:
+            with self._export_lock, suppress_instrumentation():
+                self.span_exporter.export(batch)
+                self.exported += len(batch)
+        except Exception as unmapped_exception:
+            _logger.warning("An exception occurred while exporting a batch of spans.", exc_info=unmapped_exception)
+
+    def _drain(self, deadline: float) -> bool:
+        while time.monotonic() < deadline:
+            with self._condition:
+                batch = self._take_batch(self.max_batch_size)
+            if not batch:
+                return True
+            self._export(batch)
+        return False
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        with self._condition:
+            return {
+                "queued": self._queued,
+                "exported": self.exported,
+                "dropped": dict(self.dropped),
+                "rate": self._rate,
+                "batch_size": self.batch_size,
+                "schedule_delay_ms": self.schedule_delay * 1000,
+            }
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._drain(time.monotonic() + timeout_millis / 1000)
+
+    def shutdown(self) -> None:
+        with self._condition:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            self._condition.notify_all()
+        self._worker.join()
+        self._drain(time.monotonic() + _SHUTDOWN_DRAIN_TIMEOUT_S)
+        self.span_exporter.shutdown()
@@ -0,0 +1,207 @@
+import collections
+import threading
+import time
+import typing
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace import Span
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.trace import SpanKind
+from opentelemetry.trace import StatusCode
+
+from ..utils.fork_safety import register_after_fork
+
+_INSTRUMENTATION_SCOPE = __name__.split(".", maxsplit=1)[0]
+_RANDOMNESS_MASK = (1 << 56) - 1
+
+
+def is_process_span(span: ReadableSpan) -> bool:
+    """The consumer span of one message created by this instrumentation"""
+    scope = span.instrumentation_scope
+    return (
+        span.kind == SpanKind.CONSUMER
+        and span.name.startswith("process ")
+        and scope is not None
+        and scope.name.startswith(_INSTRUMENTATION_SCOPE)
+    )
+
+
+class _BufferedTrace:
+    __slots__ = ("started_ns", "open_messages", "spans", "keep")
+
+    def __init__(self, started_ns: int):
+        self.started_ns = started_ns
+        self.open_messages = 0
+        self.spans: typing.List[ReadableSpan] = []
+        self.keep = False
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Keeps only the consumer traces worth looking at and hands them to ``span_processor``, e.g. a
+    ``BatchSpanProcessor``.
+
+    The spans of a trace with a ``process`` span in progress, the ``process``, ``ack`` and ``nack`` spans and the spans
+    of the callback, are buffered by trace id. When the last ``process`` span of the trace ends the trace is exported if
+    a message was nacked, a span errored, a ``process`` span took ``latency_threshold_ms`` or more, or the trace id
+    falls in the ``baseline_ratio`` sample, otherwise it is dropped. Spans of other traces are passed through.
+
+    At most ``max_buffered_spans`` spans are buffered, the oldest traces are dropped to make room. Traces still in
+    progress after ``max_trace_age_s`` are exported as slow, a worker looks for them every ``expiry_interval_s`` so a
+    quiet consumer does not hold them. Spans that end after the decision of their trace follow it.
+    """
+
+    def __init__(
+        self,
+        span_processor: SpanProcessor,
+        latency_threshold_ms: float = 1000,
+        baseline_ratio: float = 0.0,
+        max_buffered_spans: int = 10_000,
+        max_trace_age_s: float = 60,
+        decision_cache_size: int = 10_000,
+        expiry_interval_s: float = 1.0,
+    ):
+        if not 0.0 <= baseline_ratio <= 1.0:
+            raise ValueError(f"Invalid baseline ratio {baseline_ratio!r}, expected a value between 0 and 1")
+        self.span_processor = span_processor
+        self.latency_threshold_ns = int(latency_threshold_ms * 1_000_000)
+        self.baseline_bound = round(baseline_ratio * (1 << 56))
+        self.max_buffered_spans = max_buffered_spans
+        self.max_trace_age_ns = int(max_trace_age_s * 1_000_000_000)
+        self.decision_cache_size = decision_cache_size
+        self.expiry_interval_s = expiry_interval_s
+        self._lock = threading.Lock()
+        self._traces: "collections.OrderedDict[int, _BufferedTrace]" = collections.OrderedDict()
+        self._decisions: "collections.OrderedDict[int, bool]" = collections.OrderedDict()
+        self._buffered_spans = 0
+        self.kept_traces = 0
+        self.dropped_traces = 0
+        self.evicted_traces = 0
+        self.expired_traces = 0
+        self._shutdown = threading.Event()
+        self._start_worker()
+        register_after_fork(self._reset_after_fork)
+
+    def _start_worker(self) -> None:
+        self._worker = threading.Thread(target=self._run, name="otel-outbox-tail-sampling", daemon=True)
+        self._worker.start()
+
+    def _reset_after_fork(self) -> None:
+        """The traces buffered by the parent do not end in the child, which starts its own worker"""
+        self._lock = threading.Lock()
+        self._traces = collections.OrderedDict()
+        self._decisions = collections.OrderedDict()
+        self._buffered_spans = 0
+        if not self._shutdown.is_set():
+            self._start_worker()
+
+    def _run(self) -> None:
+        while not self._shutdown.wait(self.expiry_interval_s):
+            self.expire()
+
+    def expire(self) -> None:
+        """Export the traces in progress for longer than the max age"""
+        with self._lock:
+            export = self._expire(time.monotonic_ns())
+        for item in export:
+            self.span_processor.on_end(item)
+
+    def on_start(self, span: Span, parent_context: typing.Optional[Context] = None) -> None:
+        if is_process_span(span):
+            trace_id = span.context.trace_id
+            now = time.monotonic_ns()
+            with self._lock:
+                buffered_trace = self._traces.get(trace_id)
+                if buffered_trace is None:
+                    buffered_trace = self._traces[trace_id] = _BufferedTrace(now)
+                    self._decisions.pop(trace_id, None)
+                buffered_trace.open_messages += 1
+        self.span_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        now = time.monotonic_ns()
+        export: typing.List[ReadableSpan] = []
+        with self._lock:
+            buffered_trace = self._traces.get(trace_id)
+            if buffered_trace is None:
+                if self._decisions.get(trace_id, True):
+                    export.append(span)
+            else:
+                self._buffer(buffered_trace, span)
+                if is_process_span(span):
+                    buffered_trace.open_messages -= 1
+                    if buffered_trace.open_messages <= 0:
+                        export.extend(self._decide(trace_id, buffered_trace))
+            export.extend(self._expire(now))
+            self._evict()
+        for item in export:
+            self.span_processor.on_end(item)
+
+    def _buffer(self, buffered_trace: _BufferedTrace, span: ReadableSpan) -> None:
+        buffered_trace.spans.append(span)
+        self._buffered_spans += 1
+        if span.status.status_code == StatusCode.ERROR or span.name.startswith("nack "):
+            buffered_trace.keep = True
+        elif is_process_span(span) and span.end_time - span.start_time >= self.latency_threshold_ns:
+            buffered_trace.keep = True
+
+    def _decide(self, trace_id: int, buffered_trace: _BufferedTrace) -> typing.List[ReadableSpan]:
+        keep = buffered_trace.keep or (trace_id & _RANDOMNESS_MASK) < self.baseline_bound
+        self._remove(trace_id, buffered_trace, keep)
+        if keep:
+            self.kept_traces += 1
+            return buffered_trace.spans
+        self.dropped_traces += 1
+        return []
+
+    def _expire(self, now: int) -> typing.List[ReadableSpan]:
+        """Traces in progress for longer than the max age are slow, export what was buffered so far"""
+        export = []
+        while self._traces:
+            trace_id, buffered_trace = next(iter(self._traces.items()))
+            if now - buffered_trace.started_ns < self.max_trace_age_ns:
+                break
+            self._remove(trace_id, buffered_trace, True)
+            self.expired_traces += 1
+            export.extend(buffered_trace.spans)
+        return export
+
+    def _evict(self) -> None:
+        while self._buffered_spans > self.max_buffered_spans and self._traces:
+            trace_id, buffered_trace = next(iter(self._traces.items()))
+            self._remove(trace_id, buffered_trace, False)
+            self.evicted_traces += 1
+
+    def _remove(self, trace_id: int, buffered_trace: _BufferedTrace, keep: bool) -> None:
+        del self._traces[trace_id]
+        self._buffered_spans -= len(buffered_trace.spans)
+        self._decisions[trace_id] = keep
+        while len(self._decisions) > self.decision_cache_size:
+            self._decisions.popitem(last=False)
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            return {
+                "kept_traces": self.kept_traces,
+                "dropped_traces": self.dropped_traces,
+                "evicted_traces": self.evicted_traces,
+                "expired_traces": self.expired_traces,
+                "buffered_traces": len(self._traces),
+                "buffered_spans": self._buffered_spans,
+            }
+
+    def shutdown(self) -> None:
+        """Traces still buffered past the max age are exported, the others have no decision and are dropped"""
+        self._shutdown.set()
+        self._worker.join()
+        self.expire()
+        with self._lock:
+            self._traces.clear()
+            self._buffered_spans = 0
+        self.span_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self.expire()
+        return self.span_processor.force_flush(timeout_millis)
@@ -0,0 +1,63 @@
+import contextvars
+import time
+import typing
+
+from opentelemetry.metrics import Histogram
+from opentelemetry.metrics import UpDownCounter
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+
+from .attributes import LISTENER_NAME
+
+ACK = "ack"
+NACK = "nack"
+
+
+class _Delivery:
+    __slots__ = ("received_ns", "attributes", "acknowledged")
+
+    def __init__(self, received_ns: int, attributes: typing.Dict[str, str]):
+        self.received_ns = received_ns
+        self.attributes = attributes
+        self.acknowledged = False
+
+
+# The message being handled, the ack and nack of the payload are sent from the handler call stack
+_current_delivery: contextvars.ContextVar[typing.Optional[_Delivery]] = contextvars.ContextVar(
+    "otel_django_outbox_pattern_delivery", default=None
+)
+
+
+class AcknowledgementTracker:
+    """
+    Times each message from the start of its handler to its ack or nack and keeps the count of the messages in a
+    handler that were not acknowledged yet, per listener and destination. A message whose handler returns without ack
+    or nack stops being counted when the handler returns.
+    """
+
+    def __init__(self, ack_histogram: Histogram, nack_histogram: Histogram, unacked_counter: UpDownCounter):
+        self.histograms = {ACK: ack_histogram, NACK: nack_histogram}
+        self.unacked_counter = unacked_counter
+
+    def received(self, destination: str, listener_name: str) -> contextvars.Token:
+        delivery = _Delivery(
+            time.perf_counter_ns(), {MESSAGING_DESTINATION_NAME: destination, LISTENER_NAME: listener_name}
+        )
+        self.unacked_counter.add(1, delivery.attributes)
+        return _current_delivery.set(delivery)
+
+    def acknowledged(self, operation: str) -> None:
+        """Record the ack or nack of the message being handled, only the first one counts"""
+        delivery = _current_delivery.get()
+        if delivery is None or delivery.acknowledged:
+            return
+        delivery.acknowledged = True
+        self.histograms[operation].record(
+            (time.perf_counter_ns() - delivery.received_ns) / 1_000_000, delivery.attributes
+        )
+        self.unacked_counter.add(-1, delivery.attributes)
+
+    def finished(self, token: contextvars.Token) -> None:
+        delivery = _current_delivery.get()
+        _current_delivery.reset(token)
+        if delivery is not None and not delivery.acknowledged:
+            self.unacked_counter.add(-1, delivery.attributes)
@@ -0,0 +1,35 @@
+"""Span attribute keys owned by this instrumentation (not covered by the semantic conventions)."""
+
+DB_QUERY_COUNT = "django_outbox_pattern.db.query_count"
+DB_QUERY_DURATION_MS = "django_outbox_pattern.db.duration_ms"
+DB_TOP_STATEMENT = "django_outbox_pattern.db.top_statement"
+DB_TOP_STATEMENT_COUNT = "django_outbox_pattern.db.top_statement_count"
+DB_N_PLUS_ONE = "django_outbox_pattern.db.n_plus_one"
+
+THREAD_CPU_TIME_MS = "django_outbox_pattern.thread.cpu_time_ms"
+MEMORY_PEAK_BYTES = "django_outbox_pattern.memory.peak_bytes"
+
+HOOK_NAME = "django_outbox_pattern.hook.name"
+HOOK_DURATION_MS = "django_outbox_pattern.hook.duration_ms"
+HOOK_BUDGET_MS = "django_outbox_pattern.hook.budget_ms"
+
+MESSAGE_DELIVERY_COUNT = "django_outbox_pattern.message.delivery_count"
+MESSAGE_POISON_THRESHOLD = "django_outbox_pattern.message.poison_threshold"
+
+HANDLER_ELAPSED_MS = "django_outbox_pattern.handler.elapsed_ms"
+HANDLER_DEADLINE_MS = "django_outbox_pattern.handler.deadline_ms"
+HANDLER_THREAD_NAME = "django_outbox_pattern.handler.thread_name"
+
+TRANSIT_DURATION_MS = "django_outbox_pattern.transit.duration_ms"
+PIPELINE_DURATION_MS = "django_outbox_pattern.pipeline.duration_ms"
+LATENCY_CLOCK_SKEW = "django_outbox_pattern.latency.clock_skew"
+
+LISTENER_NAME = "django_outbox_pattern.listener.name"
+
+WORKER_ID = "django_outbox_pattern.worker.id"
+
+WRAPPER_NAME = "django_outbox_pattern.wrapper.name"
+
+SAVE_TOTAL_BODY_SIZE = "django_outbox_pattern.save.total_body_size"
+TRANSACTION_OUTCOME = "django_outbox_pattern.transaction.outcome"
+TRANSACTION_DELAY_MS = "django_outbox_pattern.transaction.delay_ms"
@@ -0,0 +1,100 @@
+import contextlib
+import logging
+import re
+import time
+import typing
+
+from collections import Counter
+
+from django.db import connections
+from opentelemetry.trace.span import Span
+
+from .attributes import DB_N_PLUS_ONE
+from .attributes import DB_QUERY_COUNT
+from .attributes import DB_QUERY_DURATION_MS
+from .attributes import DB_TOP_STATEMENT
+from .attributes import DB_TOP_STATEMENT_COUNT
+
+_logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Helper function to collapse literals, placeholders and ``IN`` lists so queries that only differ by their
+    parameters are grouped together.
+    """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryTracker:
+    """
+    Django ``execute_wrapper`` that counts the queries executed while it is installed.
+
+    Only a counter per raw statement is kept on the hot path, normalization happens once per distinct statement
+    when the most frequent one is requested.
+    """
+
+    __slots__ = ("count", "duration", "_statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._statements: typing.Dict[str, int] = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self._statements[sql] = self._statements.get(sql, 0) + 1
+
+    def most_frequent_statement(self) -> typing.Optional[typing.Tuple[str, int]]:
+        normalized: typing.Counter[str] = Counter()
+        for sql, count in self._statements.items():
+            normalized[normalize_sql(sql)] += count
+        return normalized.most_common(1)[0] if normalized else None
+
+
+def record_queries(span: Span, tracker: QueryTracker, repeat_threshold: int) -> None:
+    """Helper function to add the aggregated query data to the span, flagging repeated statements as N+1"""
+    attributes: typing.Dict[str, typing.Any] = {
+        DB_QUERY_COUNT: tracker.count,
+        DB_QUERY_DURATION_MS: tracker.duration * 1000,
+    }
+    top_statement = tracker.most_frequent_statement()
+    if top_statement is not None:
+        statement, count = top_statement
+        attributes[DB_TOP_STATEMENT] = statement
+        attributes[DB_TOP_STATEMENT_COUNT] = count
+        if count >= repeat_threshold:
+            attributes[DB_N_PLUS_ONE] = True
+            span.add_event("db.n_plus_one", {DB_TOP_STATEMENT: statement, DB_TOP_STATEMENT_COUNT: count})
+    span.set_attributes(attributes)
+
+
+@contextlib.contextmanager
+def track_queries(span: Span, repeat_threshold: int):
+    """Context manager to install a :class:`QueryTracker` in every database connection and record it in the span"""
+    tracker = QueryTracker()
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(tracker))
+        try:
+            yield tracker
+        finally:
+            try:
+                record_queries(span, tracker, repeat_threshold)
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred while recording database queries.", exc_info=unmapped_exception)
@@ -0,0 +1,66 @@
+"""
+Reset of the per-process state of the instrumentation in the children of a fork, e.g. the workers a process manager
+forks after the Django setup.
+
+A child inherits the memory of its parent but not its threads: background workers are gone, locks may be held forever
+and caches or in-flight tables describe the parent. The objects that hold such state register a callback with
+``register_after_fork``, the callbacks run in the child right after the fork, before it runs any other code.
+"""
+
+import inspect
+import logging
+import os
+import threading
+import typing
+import weakref
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_callbacks: typing.List[typing.Callable[[], typing.Optional[typing.Callable[[], None]]]] = []
+_forks = 0
+_worker_id: typing.Optional[str] = None
+
+
+def register_after_fork(callback: typing.Callable[[], None]) -> None:
+    """
+    Run ``callback`` in the child of every later fork. Bound methods are held by a weak reference so the registry does
+    not keep their instances alive.
+    """
+    reference = weakref.WeakMethod(callback) if inspect.ismethod(callback) else (lambda: callback)
+    with _lock:
+        _callbacks[:] = [item for item in _callbacks if item() is not None]
+        _callbacks.append(reference)
+
+
+def worker_id() -> typing.Optional[str]:
+    """``{parent pid}.{fork number}`` in a forked child, None in a process that was not forked"""
+    return _worker_id
+
+
+def _before_fork() -> None:
+    global _forks
+    _forks += 1
+
+
+def _after_fork_in_child() -> None:
+    global _lock, _worker_id
+    _lock = threading.Lock()
+    _worker_id = f"{os.getppid()}.{_forks}"
+    alive = []
+    for reference in _callbacks:
+        callback = reference()
+        if callback is None:
+            continue
+        alive.append(reference)
+        try:
+            callback()
+        except Exception as unmapped_exception:
+            _logger.warning(
+                "An exception occurred while resetting the state after a fork.", exc_info=unmapped_exception
+            )
+    _callbacks[:] = alive
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
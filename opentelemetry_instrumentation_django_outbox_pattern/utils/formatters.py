@@ -1,5 +1,11 @@
+import collections
+import logging
+import re
+import threading
 import typing
 
+from .fork_safety import register_after_fork
+
 
 def format_consumer_destination(headers: typing.Dict) -> str:
     """
@@ -31,3 +37,71 @@ def format_publisher_destination(destination: str) -> str:
     routing_key = split_destination[-1]
     exchange = split_destination[-2]
     return f"{exchange}:{routing_key}"
+
+
+OVERFLOW_DESTINATION = "other"
+
+_logger = logging.getLogger(__name__)
+
+
+class DestinationTemplater:
+    """
+    Collapses the variable segments of destinations, e.g. ids in routing keys, so span names, attributes and metrics
+    keep a bounded cardinality.
+
+    ``rules`` are ``(pattern, replacement)`` pairs applied in order with ``re.sub``, they are compiled once and the
+    result is memoized per raw destination, at most ``cache_size`` of them, the oldest are forgotten first.
+    Once ``max_names`` distinct templated destinations were seen, the new ones are named ``overflow_name``.
+    """
+
+    def __init__(
+        self,
+        rules: typing.Iterable[typing.Tuple[typing.Union[str, typing.Pattern[str]], str]] = (),
+        max_names: int = 1000,
+        cache_size: int = 10_000,
+        overflow_name: str = OVERFLOW_DESTINATION,
+    ):
+        if max_names < 1:
+            raise ValueError(f"Invalid max_names {max_names!r}, expected a positive number")
+        self.rules = [(re.compile(pattern), replacement) for pattern, replacement in rules]
+        self.max_names = max_names
+        self.cache_size = cache_size
+        self.overflow_name = overflow_name
+        self._lock = threading.Lock()
+        self._cache: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._names: typing.Set[str] = set()
+        self.overflowed = 0
+        register_after_fork(self._reset_after_fork)
+
+    def __call__(self, destination: str) -> str:
+        templated = self._cache.get(destination)
+        if templated is not None:
+            return templated
+        templated = destination
+        for pattern, replacement in self.rules:
+            templated = pattern.sub(replacement, templated)
+        with self._lock:
+            if templated not in self._names:
+                if len(self._names) < self.max_names:
+                    self._names.add(templated)
+                else:
+                    if not self.overflowed:
+                        _logger.warning(
+                            "More than %s distinct destinations, the next ones are named %r.",
+                            self.max_names,
+                            self.overflow_name,
+                        )
+                    self.overflowed += 1
+                    templated = self.overflow_name
+            self._cache[destination] = templated
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return templated
+
+    def _reset_after_fork(self) -> None:
+        # The memoized names stay valid, only the lock may have been held by a thread of the parent
+        self._lock = threading.Lock()
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            return {"names": len(self._names), "cached": len(self._cache), "overflowed": self.overflowed}
@@ -0,0 +1,446 @@
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import time
+import types
+import typing
+
+from opentelemetry import trace
+from opentelemetry.metrics import Histogram
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace.span import Span
+
+from .attributes import HOOK_BUDGET_MS
+from .attributes import HOOK_DURATION_MS
+from .attributes import HOOK_NAME
+from .fork_safety import register_after_fork
+from .shared_types import BatchHookT
+from .shared_types import CallbackHookT
+
+_logger = logging.getLogger(__name__)
+
+DROP_NEW = "drop_new"
+DROP_OLDEST = "drop_oldest"
+DROP_POLICIES = (DROP_NEW, DROP_OLDEST)
+
+DropCallbackT = typing.Callable[[], None]
+
+
+class BackgroundHookExecutor:
+    """
+    Bounded queue drained by one daemon thread that runs the hooks registered as background hooks.
+
+    When the queue is full the ``drop_new`` policy discards the call being submitted and ``drop_oldest`` discards the
+    oldest queued call to make room for it, in both cases the ``dropped`` counter is incremented and the message path
+    is never blocked. The ``on_drop`` callback of a call discarded by ``drop_oldest`` is called in its place.
+    """
+
+    def __init__(self, max_queue_size: int = 1000, drop_policy: str = DROP_NEW):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Invalid drop policy {drop_policy!r}, expected one of {DROP_POLICIES}")
+        self.drop_policy = drop_policy
+        self.max_queue_size = max_queue_size
+        # One condition guards the queue, the counters and the worker state. The stop request is a flag under it
+        # rather than an item of the queue, so a full queue can never drop it
+        self._condition = threading.Condition()
+        self._items: typing.Deque[typing.Tuple[typing.Callable[..., None], tuple, typing.Optional[DropCallbackT]]] = (
+            collections.deque()
+        )
+        self._unfinished = 0
+        self._generation = 0
+        self._thread: typing.Optional[threading.Thread] = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        register_after_fork(self._reset_after_fork)
+
+    def submit(
+        self, function: typing.Callable[..., None], *args, on_drop: typing.Optional[DropCallbackT] = None
+    ) -> bool:
+        """Queue ``function(*args)``, returns False when the call was dropped"""
+        oldest = None
+        with self._condition:
+            self._ensure_started()
+            self.submitted += 1
+            if 0 < self.max_queue_size <= len(self._items):
+                self.dropped += 1
+                if self.drop_policy == DROP_NEW:
+                    return False
+                oldest = self._items.popleft()
+                self._unfinished -= 1
+            self._items.append((function, args, on_drop))
+            self._unfinished += 1
+            self._condition.notify_all()
+        if oldest is not None and oldest[2] is not None:
+            try:
+                oldest[2]()
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred while dropping a background hook.", exc_info=unmapped_exception)
+        return True
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._condition:
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "queued": len(self._items),
+            }
+
+    def join(self) -> None:
+        """Block until every queued call has run"""
+        with self._condition:
+            while self._unfinished:
+                self._condition.wait()
+
+    def shutdown(self, timeout: typing.Optional[float] = None) -> None:
+        """Run the queued calls and stop the worker thread"""
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._generation += 1
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _reset_after_fork(self) -> None:
+        """The worker thread does not exist in a forked child, the calls queued by the parent are its own"""
+        self._condition = threading.Condition()
+        self._items = collections.deque()
+        self._unfinished = 0
+        self._thread = None
+        self.submitted = self.completed = self.failed = self.dropped = 0
+
+    def _ensure_started(self) -> None:
+        # Called with the condition held
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, args=(self._generation,), name="otel-outbox-hooks", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, generation: int) -> None:
+        while True:
+            with self._condition:
+                while not self._items and generation == self._generation:
+                    self._condition.wait()
+                if not self._items:
+                    # Stopped by shutdown once the queued calls have run
+                    return
+                function, args, _ = self._items.popleft()
+            succeeded = False
+            try:
+                function(*args)
+                succeeded = True
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred in the callback hook.", exc_info=unmapped_exception)
+            finally:
+                with self._condition:
+                    if succeeded:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self._unfinished -= 1
+                    self._condition.notify_all()
+
+
+def read_only_snapshot(value: typing.Any) -> typing.Any:
+    """Helper function to give background hooks a shallow, read-only copy of the headers or the body"""
+    if isinstance(value, dict):
+        return types.MappingProxyType(dict(value))
+    return value
+
+
+class HookStats:
+    """In-process count, total, max and over budget calls of the hooks, by hook and destination"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: typing.Dict[typing.Tuple[str, str], typing.List[int]] = {}
+        register_after_fork(self._reset_after_fork)
+
+    def add(self, hook_name: str, destination: str, duration_ns: int, over_budget: bool) -> None:
+        with self._lock:
+            stats = self._stats.get((hook_name, destination))
+            if stats is None:
+                stats = self._stats[(hook_name, destination)] = [0, 0, 0, 0]
+            stats[0] += 1
+            stats[1] += duration_ns
+            stats[2] = max(stats[2], duration_ns)
+            stats[3] += over_budget
+
+    def snapshot(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        with self._lock:
+            items = [(key, list(stats)) for key, stats in self._stats.items()]
+        return [
+            {
+                "hook": hook_name,
+                "destination": destination,
+                "count": count,
+                "total_ms": total_ns / 1_000_000,
+                "mean_ms": total_ns / count / 1_000_000,
+                "max_ms": max_ns / 1_000_000,
+                "over_budget": over_budget,
+            }
+            for (hook_name, destination), (count, total_ns, max_ns, over_budget) in sorted(items)
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._stats = {}
+
+
+class HookTimer:
+    """
+    Records the duration of each call of one hook, measured with the monotonic ``perf_counter_ns`` clock, in the
+    ``HookStats`` and in the hook duration histogram. Calls over the budget get a span event, when the span is still
+    recording, and a warning logged at most once per ``log_interval`` seconds for each destination.
+    """
+
+    def __init__(
+        self,
+        hook_name: str,
+        stats: HookStats,
+        histogram: typing.Optional[Histogram] = None,
+        budget_ms: typing.Optional[float] = None,
+        log_interval: float = 60,
+    ):
+        self.hook_name = hook_name
+        self.stats = stats
+        self.histogram = histogram
+        self.budget_ns = int(budget_ms * 1_000_000) if budget_ms is not None else None
+        self.log_interval_ns = int(log_interval * 1_000_000_000)
+        # The hooks run on the consumer threads and on the background executor
+        self._lock = threading.Lock()
+        self._last_logged: typing.Dict[str, int] = {}
+        self._suppressed: typing.Dict[str, int] = {}
+        register_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def record(self, span: Span, destination: str, duration_ns: int) -> None:
+        over_budget = self.budget_ns is not None and duration_ns > self.budget_ns
+        self.stats.add(self.hook_name, destination, duration_ns, over_budget)
+        if self.histogram is not None:
+            self.histogram.record(
+                duration_ns / 1_000_000, {HOOK_NAME: self.hook_name, MESSAGING_DESTINATION_NAME: destination}
+            )
+        if over_budget:
+            self._report_slow_call(span, destination, duration_ns)
+
+    def _report_slow_call(self, span: Span, destination: str, duration_ns: int) -> None:
+        duration_ms = duration_ns / 1_000_000
+        budget_ms = self.budget_ns / 1_000_000
+        if span.is_recording():
+            span.add_event(
+                "hook.slow", {HOOK_NAME: self.hook_name, HOOK_DURATION_MS: duration_ms, HOOK_BUDGET_MS: budget_ms}
+            )
+        now = time.monotonic_ns()
+        with self._lock:
+            last_logged = self._last_logged.get(destination)
+            if last_logged is not None and now - last_logged < self.log_interval_ns:
+                self._suppressed[destination] = self._suppressed.get(destination, 0) + 1
+                return
+            self._last_logged[destination] = now
+            suppressed = self._suppressed.pop(destination, 0)
+        _logger.warning(
+            "The %s hook took %.3f ms for %s, over the %.3f ms budget (%d slow calls not logged since the last one).",
+            self.hook_name,
+            duration_ms,
+            destination,
+            budget_ms,
+            suppressed,
+        )
+
+
+class _PendingEnd:
+    __slots__ = ("span", "holds", "end_time")
+
+    def __init__(self, span: Span):
+        self.span = span
+        self.holds = 0
+        self.end_time: typing.Optional[int] = None
+
+
+# Spans held open by the background hooks queued for them, by span id
+_pending_lock = threading.Lock()
+_pending_ends: typing.Dict[int, _PendingEnd] = {}
+
+
+def hold_span(span: Span) -> None:
+    """Keep ``span`` open until ``release_span``, ``end_span`` only records its end time meanwhile"""
+    with _pending_lock:
+        pending = _pending_ends.get(id(span))
+        if pending is None:
+            pending = _pending_ends[id(span)] = _PendingEnd(span)
+        pending.holds += 1
+
+
+def release_span(span: Span) -> None:
+    with _pending_lock:
+        pending = _pending_ends.get(id(span))
+        if pending is None:
+            return
+        pending.holds -= 1
+        if pending.holds > 0:
+            return
+        del _pending_ends[id(span)]
+    # A span released before the wrapper is done is ended by the wrapper itself
+    if pending.end_time is not None:
+        span.end(end_time=pending.end_time)
+
+
+def end_span(span: Span, end_time: typing.Optional[int] = None) -> None:
+    """
+    End ``span``, or when background hooks still hold it record the end time and let the last of them end it, so the
+    hooks can enrich the span and its duration is not stretched by the queue.
+    """
+    if _pending_ends:
+        with _pending_lock:
+            pending = _pending_ends.get(id(span))
+            if pending is not None:
+                pending.end_time = time.time_ns() if end_time is None else end_time
+                return
+    span.end(end_time=end_time)
+
+
+@contextlib.contextmanager
+def use_span(span: Span, end_on_exit: bool = True) -> typing.Iterator[Span]:
+    """``trace.use_span`` that ends the span with ``end_span``, after an exception was recorded on it"""
+    try:
+        with trace.use_span(span, end_on_exit=False):
+            yield span
+    finally:
+        if end_on_exit:
+            end_span(span)
+
+
+def _reset_after_fork() -> None:
+    # The calls queued by the parent never run in the child, nothing would end the spans they hold
+    global _pending_lock, _pending_ends
+    _pending_lock = threading.Lock()
+    _pending_ends = {}
+
+
+register_after_fork(_reset_after_fork)
+
+
+class HookRunner:
+    """
+    Calls a publisher or consumer hook inline, or hands it to a ``BackgroundHookExecutor``, and times each call.
+
+    Background hooks get a read-only snapshot of the body and headers and the span itself. A recording span is held
+    open until its hooks have run, the wrappers end it with ``end_span`` at its real end time, so the hooks can still
+    set attributes and add events. A dropped call releases the span. Their exceptions are logged and counted by the
+    executor.
+    """
+
+    __slots__ = ("hook", "logger", "executor", "timer")
+
+    def __init__(
+        self,
+        hook: CallbackHookT,
+        logger: logging.Logger,
+        executor: typing.Optional[BackgroundHookExecutor] = None,
+        timer: typing.Optional[HookTimer] = None,
+    ):
+        self.hook = hook
+        self.logger = logger
+        self.executor = executor
+        self.timer = timer
+
+    def __bool__(self) -> bool:
+        return self.hook is not None
+
+    def __call__(self, span: Span, body: typing.Any, headers: typing.Dict, destination: str) -> None:
+        if self.executor is None:
+            try:
+                self._timed_call(span, body, headers, destination)
+            except Exception as hook_exception:
+                self.logger.warning("An exception occurred in the callback hook.", exc_info=hook_exception)
+            return
+        if not span.is_recording():
+            self.executor.submit(
+                self._timed_call, span, read_only_snapshot(body), read_only_snapshot(headers), destination
+            )
+            return
+        hold_span(span)
+        submitted = self.executor.submit(
+            self._background_call,
+            span,
+            read_only_snapshot(body),
+            read_only_snapshot(headers),
+            destination,
+            on_drop=functools.partial(release_span, span),
+        )
+        if not submitted:
+            release_span(span)
+
+    def _background_call(self, span: Span, body: typing.Any, headers: typing.Mapping, destination: str) -> None:
+        try:
+            self._timed_call(span, body, headers, destination)
+        finally:
+            release_span(span)
+
+    def _timed_call(self, span: Span, body: typing.Any, headers: typing.Mapping, destination: str) -> None:
+        if self.timer is None:
+            self.hook(span, body, headers)
+            return
+        start = time.perf_counter_ns()
+        try:
+            self.hook(span, body, headers)
+        finally:
+            duration_ns = time.perf_counter_ns() - start
+            try:
+                self.timer.record(span, destination, duration_ns)
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred while recording the hook duration.", exc_info=unmapped_exception)
+
+
+class BatchItem(typing.NamedTuple):
+    span: Span
+    body: typing.Any
+    headers: typing.Mapping
+    end_time: int
+
+
+class SpanBatch:
+    """
+    Send spans of one publishing cycle kept open for the batch hook.
+
+    The spans are added after the broker send with the time it ended, on ``flush`` the hook receives all of them in
+    one call and the spans are ended with their captured end time, so the durations are not stretched by the wait.
+    """
+
+    __slots__ = ("hook", "logger", "max_size", "items")
+
+    def __init__(self, hook: BatchHookT, logger: logging.Logger, max_size: int = 500):
+        self.hook = hook
+        self.logger = logger
+        self.max_size = max_size
+        self.items: typing.List[BatchItem] = []
+
+    def add(self, span: Span, body: typing.Any, headers: typing.Dict) -> None:
+        self.items.append(BatchItem(span, body, read_only_snapshot(headers), time.time_ns()))
+        if len(self.items) >= self.max_size:
+            self.flush()
+
+    def flush(self) -> None:
+        items, self.items = self.items, []
+        if not items:
+            return
+        try:
+            self.hook(items)
+        except Exception as hook_exception:
+            self.logger.warning("An exception occurred in the batch hook.", exc_info=hook_exception)
+        finally:
+            for item in items:
+                end_span(item.span, end_time=item.end_time)
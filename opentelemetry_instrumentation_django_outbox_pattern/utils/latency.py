@@ -0,0 +1,63 @@
+import time
+import typing
+
+from opentelemetry.metrics import Histogram
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace.span import Span
+
+from .attributes import LATENCY_CLOCK_SKEW
+from .attributes import PIPELINE_DURATION_MS
+from .attributes import TRANSIT_DURATION_MS
+
+# Epoch milliseconds, set by the publisher when the message is saved in the outbox and when it is sent to the broker
+SAVED_TIME_HEADER = "otel-saved-ms"
+SENT_TIME_HEADER = "otel-sent-ms"
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def stamp_time(headers: typing.Dict, name: str, overwrite: bool = True) -> None:
+    if overwrite or name not in headers:
+        headers[name] = str(now_ms())
+
+
+def _elapsed_ms(headers: typing.Dict, name: str, received_ms: int) -> typing.Optional[int]:
+    try:
+        return received_ms - int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PipelineLatencyRecorder:
+    """
+    Records the send to receive (broker transit) and save to receive (whole outbox pipeline) latencies of a consumed
+    message from the publisher time headers. The clocks of the publisher and the consumer hosts may disagree, negative
+    latencies are recorded as 0 and flagged on the span.
+    """
+
+    def __init__(self, transit_histogram: Histogram, pipeline_histogram: Histogram):
+        self.transit_histogram = transit_histogram
+        self.pipeline_histogram = pipeline_histogram
+
+    def record(
+        self, span: Span, destination: str, headers: typing.Dict, received_ms: typing.Optional[int] = None
+    ) -> None:
+        received_ms = now_ms() if received_ms is None else received_ms
+        metric_attributes = {MESSAGING_DESTINATION_NAME: destination}
+        span_attributes: typing.Dict[str, typing.Any] = {}
+        for name, histogram, attribute in (
+            (SENT_TIME_HEADER, self.transit_histogram, TRANSIT_DURATION_MS),
+            (SAVED_TIME_HEADER, self.pipeline_histogram, PIPELINE_DURATION_MS),
+        ):
+            elapsed_ms = _elapsed_ms(headers, name, received_ms)
+            if elapsed_ms is None:
+                continue
+            if elapsed_ms < 0:
+                span_attributes[LATENCY_CLOCK_SKEW] = True
+                elapsed_ms = 0
+            histogram.record(elapsed_ms, metric_attributes)
+            span_attributes[attribute] = elapsed_ms
+        if span_attributes and span.is_recording():
+            span.set_attributes(span_attributes)
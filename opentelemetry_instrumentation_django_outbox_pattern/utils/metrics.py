@@ -0,0 +1,106 @@
+"""Metric instruments owned by this instrumentation."""
+
+from opentelemetry.metrics import Counter
+from opentelemetry.metrics import Histogram
+from opentelemetry.metrics import Meter
+from opentelemetry.metrics import UpDownCounter
+
+HOOK_DURATION = "django_outbox_pattern.hook.duration"
+CONSUMER_REDELIVERIES = "django_outbox_pattern.consumer.redeliveries"
+CONSUMER_STUCK_HANDLERS = "django_outbox_pattern.consumer.stuck_handlers"
+CONSUMER_TRANSIT_DURATION = "django_outbox_pattern.consumer.transit.duration"
+CONSUMER_PIPELINE_DURATION = "django_outbox_pattern.consumer.pipeline.duration"
+CONSUMER_RECEIVE_TO_ACK_DURATION = "django_outbox_pattern.consumer.receive_to_ack.duration"
+CONSUMER_RECEIVE_TO_NACK_DURATION = "django_outbox_pattern.consumer.receive_to_nack.duration"
+CONSUMER_UNACKED_MESSAGES = "django_outbox_pattern.consumer.unacked_messages"
+INSTRUMENTATION_OVERHEAD = "django_outbox_pattern.instrumentation.overhead"
+PUBLISHER_COMMIT_DELAY = "django_outbox_pattern.publisher.commit_delay"
+PUBLISHER_ROLLED_BACK_MESSAGES = "django_outbox_pattern.publisher.rolled_back_messages"
+
+
+def create_hook_duration_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=HOOK_DURATION,
+        unit="ms",
+        description="Duration of the publisher and consumer hook calls",
+    )
+
+
+def create_redelivery_counter(meter: Meter) -> Counter:
+    return meter.create_counter(
+        name=CONSUMER_REDELIVERIES,
+        unit="{message}",
+        description="Messages delivered again to the consumer after a previous delivery",
+    )
+
+
+def create_stuck_handler_counter(meter: Meter) -> Counter:
+    return meter.create_counter(
+        name=CONSUMER_STUCK_HANDLERS,
+        unit="{message}",
+        description="Consumer callbacks still running after the watchdog deadline",
+    )
+
+
+def create_transit_duration_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=CONSUMER_TRANSIT_DURATION,
+        unit="ms",
+        description="Time from the broker send to the consumer receive of the messages",
+    )
+
+
+def create_pipeline_duration_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=CONSUMER_PIPELINE_DURATION,
+        unit="ms",
+        description="Time from the outbox save to the consumer receive of the messages",
+    )
+
+
+def create_receive_to_ack_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=CONSUMER_RECEIVE_TO_ACK_DURATION,
+        unit="ms",
+        description="Time from the start of the message handler to the ack of the message",
+    )
+
+
+def create_receive_to_nack_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=CONSUMER_RECEIVE_TO_NACK_DURATION,
+        unit="ms",
+        description="Time from the start of the message handler to the nack of the message",
+    )
+
+
+def create_unacked_messages_counter(meter: Meter) -> UpDownCounter:
+    return meter.create_up_down_counter(
+        name=CONSUMER_UNACKED_MESSAGES,
+        unit="{message}",
+        description="Messages in the handler of a listener that were not acked or nacked yet",
+    )
+
+
+def create_instrumentation_overhead_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=INSTRUMENTATION_OVERHEAD,
+        unit="ms",
+        description="Time spent in the wrappers of this instrumentation, without the wrapped call",
+    )
+
+
+def create_commit_delay_histogram(meter: Meter) -> Histogram:
+    return meter.create_histogram(
+        name=PUBLISHER_COMMIT_DELAY,
+        unit="ms",
+        description="Time from the outbox save to the commit of the transaction the message was saved in",
+    )
+
+
+def create_rolled_back_messages_counter(meter: Meter) -> Counter:
+    return meter.create_counter(
+        name=PUBLISHER_ROLLED_BACK_MESSAGES,
+        unit="{message}",
+        description="Messages saved in the outbox whose transaction rolled back, they are never published",
+    )
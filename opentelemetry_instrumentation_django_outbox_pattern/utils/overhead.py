@@ -0,0 +1,61 @@
+import itertools
+import logging
+import time
+import typing
+
+from opentelemetry.metrics import Histogram
+
+from .attributes import WRAPPER_NAME
+
+_logger = logging.getLogger(__name__)
+
+WrapperT = typing.Callable[[typing.Callable, typing.Any, typing.Tuple, typing.Dict], typing.Any]
+
+
+class OverheadMeter:
+    """
+    Measures the time one call in ``every`` of each wrapper spends in the instrumentation, without the wrapped call, and
+    records it in milliseconds in the histogram with the name of the wrapper.
+
+    The calls that are not measured only pay a counter increment.
+    """
+
+    def __init__(self, histogram: Histogram, every: int = 100):
+        if every < 1:
+            raise ValueError(f"Invalid sampling interval {every!r}, expected a positive number")
+        self.histogram = histogram
+        self.every = every
+
+    def wrap(self, wrapper: WrapperT) -> WrapperT:
+        """wrapt wrapper that measures ``wrapper``"""
+        attributes = {WRAPPER_NAME: wrapper.__name__}
+        calls = itertools.count()
+
+        def measured_wrapper(wrapped, instance, args, kwargs):
+            if next(calls) % self.every:
+                return wrapper(wrapped, instance, args, kwargs)
+
+            wrapped_ns = 0
+
+            def timed_wrapped(*wrapped_args, **wrapped_kwargs):
+                nonlocal wrapped_ns
+                wrapped_started = time.perf_counter_ns()
+                try:
+                    return wrapped(*wrapped_args, **wrapped_kwargs)
+                finally:
+                    wrapped_ns += time.perf_counter_ns() - wrapped_started
+
+            started = time.perf_counter_ns()
+            try:
+                return wrapper(timed_wrapped, instance, args, kwargs)
+            finally:
+                try:
+                    self.histogram.record((time.perf_counter_ns() - started - wrapped_ns) / 1_000_000, attributes)
+                except Exception as unmapped_exception:
+                    _logger.warning(
+                        "An exception occurred while recording the instrumentation overhead.",
+                        exc_info=unmapped_exception,
+                    )
+
+        measured_wrapper.__name__ = wrapper.__name__
+        return measured_wrapper
@@ -0,0 +1,41 @@
+import contextlib
+import logging
+import time
+import tracemalloc
+import typing
+
+from opentelemetry.trace.span import Span
+
+from .attributes import MEMORY_PEAK_BYTES
+from .attributes import THREAD_CPU_TIME_MS
+
+_logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def profile_call(span: Span, cpu_time: bool, memory: bool):
+    """
+    Context manager to record the CPU time of the current thread and the ``tracemalloc`` peak of the block in the span.
+
+    The peak is measured only when ``tracemalloc`` is tracing, it is process wide so allocations made by other threads
+    in the same interval are included.
+    """
+    memory = memory and tracemalloc.is_tracing()
+    start_memory = 0
+    if memory:
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+    start_cpu_time = time.thread_time_ns() if cpu_time else 0
+    try:
+        yield
+    finally:
+        try:
+            attributes: typing.Dict[str, typing.Any] = {}
+            if cpu_time:
+                attributes[THREAD_CPU_TIME_MS] = (time.thread_time_ns() - start_cpu_time) / 1_000_000
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                attributes[MEMORY_PEAK_BYTES] = max(peak - start_memory, 0)
+            span.set_attributes(attributes)
+        except Exception as unmapped_exception:
+            _logger.warning("An exception occurred while recording the call profile.", exc_info=unmapped_exception)
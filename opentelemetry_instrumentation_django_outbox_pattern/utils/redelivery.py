@@ -0,0 +1,99 @@
+import collections
+import threading
+import time
+import typing
+
+from opentelemetry.metrics import Counter
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace.span import Span
+
+from .attributes import MESSAGE_DELIVERY_COUNT
+from .attributes import MESSAGE_POISON_THRESHOLD
+from .fork_safety import register_after_fork
+
+# Same precedence as django-outbox-pattern, the ids set by the publishers survive a broker redelivery
+_MESSAGE_ID_HEADERS = ("dop-msg-id", "cap-msg-id", "message-id")
+_CORRELATION_ID_HEADERS = ("dop-correlation-id", "correlation-id")
+
+
+def _first_header(headers: typing.Dict, names: typing.Iterable[str]) -> typing.Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value:
+            return str(value)
+    return None
+
+
+class DeliveryTracker:
+    """
+    Least recently used table of the deliveries seen per key, with at most ``max_size`` entries that expire
+    ``ttl_s`` seconds after their last delivery. Each ``record`` call is O(1) amortized.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_s: float = 3600):
+        self.max_size = max_size
+        self.ttl_ns = int(ttl_s * 1_000_000_000)
+        self._lock = threading.Lock()
+        self._deliveries: "collections.OrderedDict[typing.Hashable, typing.Tuple[int, int]]" = collections.OrderedDict()
+        register_after_fork(self._reset_after_fork)
+
+    def record(self, key: typing.Hashable) -> int:
+        """Count one delivery of ``key``, returns the deliveries seen including this one"""
+        now = time.monotonic_ns()
+        with self._lock:
+            # The least recently delivered entries are at the head, only expired ones are removed
+            while self._deliveries:
+                oldest_key, (_, last_seen) = next(iter(self._deliveries.items()))
+                if now - last_seen < self.ttl_ns:
+                    break
+                del self._deliveries[oldest_key]
+            count, _ = self._deliveries.pop(key, (0, 0))
+            count += 1
+            self._deliveries[key] = (count, now)
+            if len(self._deliveries) > self.max_size:
+                self._deliveries.popitem(last=False)
+            return count
+
+    def __len__(self) -> int:
+        return len(self._deliveries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._deliveries.clear()
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._deliveries = collections.OrderedDict()
+
+
+class RedeliveryMonitor:
+    """
+    Records the delivery count of each consumed message on its process span, counts the redeliveries per destination
+    and adds a "message.poison" event once a message was delivered ``poison_threshold`` times.
+    """
+
+    def __init__(
+        self,
+        tracker: DeliveryTracker,
+        counter: typing.Optional[Counter] = None,
+        poison_threshold: int = 5,
+    ):
+        self.tracker = tracker
+        self.counter = counter
+        self.poison_threshold = poison_threshold
+
+    def record(self, span: Span, destination: str, headers: typing.Dict) -> int:
+        message_id = _first_header(headers, _MESSAGE_ID_HEADERS)
+        if message_id is None:
+            return 1
+        delivery_count = self.tracker.record((message_id, _first_header(headers, _CORRELATION_ID_HEADERS)))
+        if delivery_count > 1 and self.counter is not None:
+            self.counter.add(1, {MESSAGING_DESTINATION_NAME: destination})
+        if span.is_recording():
+            span.set_attribute(MESSAGE_DELIVERY_COUNT, delivery_count)
+            if delivery_count >= self.poison_threshold:
+                span.add_event(
+                    "message.poison",
+                    {MESSAGE_DELIVERY_COUNT: delivery_count, MESSAGE_POISON_THRESHOLD: self.poison_threshold},
+                )
+        return delivery_count
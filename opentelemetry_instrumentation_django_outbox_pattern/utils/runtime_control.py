@@ -0,0 +1,75 @@
+import threading
+import typing
+
+from opentelemetry.instrumentation.utils import is_instrumentation_enabled
+
+from .fork_safety import register_after_fork
+
+PUBLISHER = "publisher"
+CONSUMER = "consumer"
+SIDES = (PUBLISHER, CONSUMER)
+
+
+class InstrumentationSwitch:
+    """
+    Runtime switch to turn the tracing of one side off, entirely or per destination, without re-wrapping functions.
+
+    The state is immutable, writers build a new one under a lock and replace it with a single assignment, so the
+    wrappers only need one attribute read to decide whether they fall through to the original call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: typing.Tuple[typing.FrozenSet[str], typing.FrozenSet[typing.Tuple[str, str]]] = (
+            frozenset(),
+            frozenset(),
+        )
+        register_after_fork(self._reset_after_fork)
+
+    def is_enabled(self, side: str, destination: typing.Optional[str] = None) -> bool:
+        disabled_sides, disabled_destinations = self._state
+        return side not in disabled_sides and (side, destination) not in disabled_destinations
+
+    def disable(self, side: str, destination: typing.Optional[str] = None) -> None:
+        """Disable a side, or only one destination of the side when ``destination`` is given"""
+        self._validate_side(side)
+        with self._lock:
+            disabled_sides, disabled_destinations = self._state
+            if destination is None:
+                self._state = (disabled_sides | {side}, disabled_destinations)
+            else:
+                self._state = (disabled_sides, disabled_destinations | {(side, destination)})
+
+    def enable(self, side: str, destination: typing.Optional[str] = None) -> None:
+        """Enable one destination of a side, or the side and all its destinations when ``destination`` is omitted"""
+        self._validate_side(side)
+        with self._lock:
+            disabled_sides, disabled_destinations = self._state
+            if destination is None:
+                self._state = (
+                    disabled_sides - {side},
+                    frozenset(item for item in disabled_destinations if item[0] != side),
+                )
+            else:
+                self._state = (disabled_sides, disabled_destinations - {(side, destination)})
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = (frozenset(), frozenset())
+
+    def _reset_after_fork(self) -> None:
+        # The switches set in the parent stay in effect
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _validate_side(side: str) -> None:
+        if side not in SIDES:
+            raise ValueError(f"Invalid side {side!r}, expected one of {SIDES}")
+
+
+instrumentation_switch = InstrumentationSwitch()
+
+
+def is_tracing_enabled(side: str, destination: typing.Optional[str] = None) -> bool:
+    """Helper function to check the runtime switch and the OpenTelemetry suppress instrumentation flag"""
+    return instrumentation_switch.is_enabled(side, destination) and is_instrumentation_enabled()
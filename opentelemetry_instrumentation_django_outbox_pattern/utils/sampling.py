@@ -0,0 +1,157 @@
+"""
+Consistent probability sampling, the sampling threshold travels with the message in the ``ot=th:<hex>`` tracestate
+entry so the publisher and the consumer keep or drop a message trace as a whole.
+
+The threshold is the rejection threshold of the OpenTelemetry specification: a trace is kept when the 56 bits of
+randomness, the ``rv`` sub-key or the lowest 56 bits of the trace id, are greater than or equal to it.
+"""
+
+import typing
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace.sampling import Decision
+from opentelemetry.sdk.trace.sampling import Sampler
+from opentelemetry.sdk.trace.sampling import SamplingResult
+from opentelemetry.trace import Link
+from opentelemetry.trace import SpanContext
+from opentelemetry.trace import SpanKind
+from opentelemetry.trace import TraceFlags
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+OTEL_TRACE_STATE_KEY = "ot"
+THRESHOLD_KEY = "th"
+RANDOMNESS_KEY = "rv"
+
+MAX_THRESHOLD = 1 << 56
+_RANDOMNESS_MASK = MAX_THRESHOLD - 1
+_HEX_DIGITS = 14
+
+
+def threshold_for_ratio(ratio: float) -> int:
+    """Rejection threshold of a sampling ratio, ``MAX_THRESHOLD`` rejects every trace"""
+    if not 0.0 <= ratio <= 1.0:
+        raise ValueError(f"Invalid sampling ratio {ratio!r}, expected a value between 0 and 1")
+    return MAX_THRESHOLD - round(ratio * MAX_THRESHOLD)
+
+
+def encode_threshold(threshold: int) -> str:
+    return f"{threshold:0{_HEX_DIGITS}x}".rstrip("0") or "0"
+
+
+def _parse_hex(value: str, exact_length: bool) -> typing.Optional[int]:
+    if not value or len(value) > _HEX_DIGITS or (exact_length and len(value) != _HEX_DIGITS):
+        return None
+    try:
+        return int(value.ljust(_HEX_DIGITS, "0"), 16)
+    except ValueError:
+        return None
+
+
+def _otel_values(trace_state: typing.Optional[TraceState]) -> typing.Dict[str, str]:
+    """Sub-keys of the ``ot`` tracestate entry, e.g. ``th:8;rv:...``"""
+    entry = trace_state.get(OTEL_TRACE_STATE_KEY) if trace_state else None
+    if not entry:
+        return {}
+    values = {}
+    for item in entry.split(";"):
+        key, _, value = item.partition(":")
+        values[key] = value
+    return values
+
+
+def get_sampling_threshold(trace_state: typing.Optional[TraceState]) -> typing.Optional[int]:
+    return _parse_hex(_otel_values(trace_state).get(THRESHOLD_KEY, ""), exact_length=False)
+
+
+def get_randomness(trace_id: int, trace_state: typing.Optional[TraceState]) -> int:
+    randomness = _parse_hex(_otel_values(trace_state).get(RANDOMNESS_KEY, ""), exact_length=True)
+    return randomness if randomness is not None else trace_id & _RANDOMNESS_MASK
+
+
+def with_sampling_threshold(trace_state: typing.Optional[TraceState], threshold: int) -> TraceState:
+    """Copy of the tracestate with the threshold set in the ``ot`` entry, the other sub-keys are kept"""
+    trace_state = trace_state or TraceState()
+    values = _otel_values(trace_state)
+    values[THRESHOLD_KEY] = encode_threshold(threshold)
+    entry = ";".join(f"{key}:{value}" for key, value in values.items())
+    if OTEL_TRACE_STATE_KEY in trace_state:
+        return trace_state.update(OTEL_TRACE_STATE_KEY, entry)
+    return trace_state.add(OTEL_TRACE_STATE_KEY, entry)
+
+
+def is_sampled_out(span_context: SpanContext) -> bool:
+    """True when the span context carries a sampling threshold that rejects its trace"""
+    if not span_context.is_valid:
+        return False
+    threshold = get_sampling_threshold(span_context.trace_state)
+    if threshold is None:
+        return False
+    return get_randomness(span_context.trace_id, span_context.trace_state) < threshold
+
+
+def sampled_out_span(span_context: SpanContext) -> trace.Span:
+    """Non-recording span of a rejected trace, its children see an unsampled parent"""
+    return trace.NonRecordingSpan(
+        SpanContext(
+            trace_id=span_context.trace_id,
+            span_id=span_context.span_id,
+            is_remote=False,
+            trace_flags=TraceFlags(TraceFlags.DEFAULT),
+            trace_state=span_context.trace_state,
+        )
+    )
+
+
+class ConsistentProbabilitySampler(Sampler):
+    """
+    Sampler to configure in the tracer provider of both the publisher and the consumer services.
+
+    Root spans are kept with probability ``ratio`` and record the threshold in the tracestate, which the propagator
+    injects in the message headers. Spans with a parent that carries a threshold apply that threshold to the same
+    randomness, so every service reaches the parent's decision. Parents without a threshold are followed like
+    ``ParentBased`` does.
+    """
+
+    def __init__(self, ratio: float):
+        self._ratio = ratio
+        self._threshold = threshold_for_ratio(ratio)
+
+    @property
+    def ratio(self) -> float:
+        return self._ratio
+
+    def should_sample(
+        self,
+        parent_context: typing.Optional[Context],
+        trace_id: int,
+        name: str,
+        kind: typing.Optional[SpanKind] = None,
+        attributes: Attributes = None,
+        links: typing.Optional[typing.Sequence[Link]] = None,
+        trace_state: typing.Optional[TraceState] = None,
+    ) -> SamplingResult:
+        parent_span_context = trace.get_current_span(parent_context).get_span_context()
+        if parent_span_context.is_valid:
+            parent_trace_state = parent_span_context.trace_state
+            threshold = get_sampling_threshold(parent_trace_state)
+            if threshold is None:
+                sampled = parent_span_context.trace_flags.sampled
+            else:
+                sampled = get_randomness(trace_id, parent_trace_state) >= threshold
+            return self._result(sampled, attributes, parent_trace_state)
+
+        sampled = get_randomness(trace_id, trace_state) >= self._threshold
+        if self._threshold < MAX_THRESHOLD:
+            trace_state = with_sampling_threshold(trace_state, self._threshold)
+        return self._result(sampled, attributes, trace_state)
+
+    @staticmethod
+    def _result(sampled: bool, attributes: Attributes, trace_state: typing.Optional[TraceState]) -> SamplingResult:
+        if sampled:
+            return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, trace_state)
+        return SamplingResult(Decision.DROP, None, trace_state)
+
+    def get_description(self) -> str:
+        return f"ConsistentProbabilitySampler{{{self._ratio}}}"
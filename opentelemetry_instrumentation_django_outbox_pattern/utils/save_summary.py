@@ -0,0 +1,152 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import typing
+import weakref
+
+from django.db import transaction
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_BATCH_MESSAGE_COUNT
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace import Span
+from opentelemetry.trace import SpanKind
+from opentelemetry.trace import Tracer
+
+from .attributes import SAVE_TOTAL_BODY_SIZE
+from .attributes import TRANSACTION_OUTCOME
+from .fork_safety import register_after_fork
+from .hooks import end_span
+from .span import MessageTelemetry
+from .span import get_host_attributes
+from .span import span_name
+from .transactions import TransactionWatcher
+
+SAVE_PUBLISHED = "save published"
+MESSAGES_SAVED_EVENT = "messages.saved"
+
+
+class SaveSummary:
+    """
+    Single ``save published`` span of the messages saved in one transaction or ``save_summary`` block. The span ends
+    with the number of messages and their total body size, and a ``messages.saved`` event per destination.
+    """
+
+    __slots__ = ("span", "destinations", "_lock")
+
+    def __init__(self, tracer: Tracer, message: MessageTelemetry):
+        self.span = tracer.start_span(name=SAVE_PUBLISHED, kind=SpanKind.PRODUCER, start_time=message.started_ns)
+        if self.span.is_recording():
+            self.span.set_attributes(get_host_attributes())
+        # Destination: [messages, total body size]
+        self.destinations: typing.Dict[str, typing.List[int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, message: MessageTelemetry) -> Span:
+        if self.span.is_recording():
+            with self._lock:
+                totals = self.destinations.setdefault(message.destination, [0, 0])
+                totals[0] += 1
+                totals[1] += message.body_size
+        return self.span
+
+    def end(self, outcome: typing.Optional[str] = None) -> None:
+        if self.span.is_recording():
+            if outcome is not None:
+                self.span.set_attribute(TRANSACTION_OUTCOME, outcome)
+            with self._lock:
+                destinations = dict(self.destinations)
+            for destination, (messages, body_size) in destinations.items():
+                self.span.add_event(
+                    MESSAGES_SAVED_EVENT,
+                    {
+                        MESSAGING_DESTINATION_NAME: destination,
+                        MESSAGING_BATCH_MESSAGE_COUNT: messages,
+                        SAVE_TOTAL_BODY_SIZE: body_size,
+                    },
+                )
+            self.span.set_attributes(
+                {
+                    MESSAGING_BATCH_MESSAGE_COUNT: sum(totals[0] for totals in destinations.values()),
+                    SAVE_TOTAL_BODY_SIZE: sum(totals[1] for totals in destinations.values()),
+                }
+            )
+            if len(destinations) == 1:
+                (destination,) = destinations
+                self.span.update_name(span_name(SAVE_PUBLISHED, destination))
+                self.span.set_attribute(MESSAGING_DESTINATION_NAME, destination)
+        end_span(self.span)
+
+
+class _SaveScope:
+    __slots__ = ("summary",)
+
+    def __init__(self):
+        self.summary: typing.Optional[SaveSummary] = None
+
+
+_current_scope: contextvars.ContextVar[typing.Optional[_SaveScope]] = contextvars.ContextVar(
+    "otel_django_outbox_pattern_save_scope", default=None
+)
+
+
+@contextlib.contextmanager
+def save_summary() -> typing.Iterator[None]:
+    """
+    The messages saved inside the block, e.g. by one request outside any transaction, share one ``save published``
+    span, ended when the block exits.
+    """
+    scope = _SaveScope()
+    token = _current_scope.set(scope)
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+        if scope.summary is not None:
+            scope.summary.end()
+
+
+def current_save_summary(tracer: Tracer, message: MessageTelemetry) -> typing.Optional[SaveSummary]:
+    """Summary of the innermost ``save_summary`` block, started by the first message saved in it"""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    if scope.summary is None:
+        scope.summary = SaveSummary(tracer, message)
+    return scope.summary
+
+
+class TransactionSaveSummaries:
+    """Summary of the transaction in progress on each connection, ended when the transaction commits or rolls back"""
+
+    def __init__(self, tracer: Tracer, transaction_watcher: TransactionWatcher):
+        self.tracer = tracer
+        self.transaction_watcher = transaction_watcher
+        self._lock = threading.Lock()
+        self._summaries: "weakref.WeakKeyDictionary[typing.Any, SaveSummary]" = weakref.WeakKeyDictionary()
+        register_after_fork(self._reset_after_fork)
+
+    def get(self, message: MessageTelemetry, using: typing.Optional[str] = None) -> typing.Optional[SaveSummary]:
+        """Summary the message joins, None when it is saved outside a transaction"""
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return None
+        with self._lock:
+            summary = self._summaries.get(connection)
+        if summary is None:
+            summary = SaveSummary(self.tracer, message)
+            with self._lock:
+                self._summaries[connection] = summary
+            self.transaction_watcher.watch(functools.partial(self._end, using, summary), using)
+        return summary
+
+    def _end(self, using: typing.Optional[str], summary: SaveSummary, outcome: str) -> None:
+        # The outcome is reported in the thread of the transaction, the connection is the one the summary started on
+        connection = transaction.get_connection(using)
+        with self._lock:
+            if self._summaries.get(connection) is summary:
+                del self._summaries[connection]
+        summary.end(outcome)
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._summaries = weakref.WeakKeyDictionary()
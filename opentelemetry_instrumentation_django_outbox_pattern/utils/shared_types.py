@@ -3,3 +3,8 @@ import typing
 from opentelemetry.trace.span import Span
 
 CallbackHookT = typing.Optional[typing.Callable[[Span, typing.Dict, typing.Dict], None]]
+
+# Receives the (span, body, headers, end_time) items of the messages sent in one publishing cycle
+BatchHookT = typing.Optional[
+    typing.Callable[[typing.Sequence[typing.Tuple[Span, typing.Any, typing.Mapping, int]]], None]
+]
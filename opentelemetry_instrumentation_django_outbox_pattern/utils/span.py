@@ -1,10 +1,12 @@
+import contextvars
+import functools
 import json
-import sys
+import time
+import types
 import typing
 
 from django.conf import settings
-from opentelemetry.sdk.trace import Span
-from opentelemetry.sdk.trace import Tracer
+from django.core.signals import setting_changed
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_BODY_SIZE
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_CONVERSATION_ID
@@ -12,20 +14,120 @@ from opentelemetry.semconv._incubating.attributes.messaging_attributes import ME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_SYSTEM
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_NAME
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_PORT
+from opentelemetry.trace import Span
 from opentelemetry.trace import SpanKind
+from opentelemetry.trace import Tracer
+
+from .attributes import WORKER_ID
+from .fork_safety import register_after_fork
+from .fork_safety import worker_id
+
+_host_attributes: typing.Optional[typing.Mapping[str, typing.Any]] = None
+
+
+def get_host_attributes() -> typing.Mapping[str, typing.Any]:
+    """Broker attributes shared by every span, read from the settings once"""
+    global _host_attributes
+    if _host_attributes is None:
+        system = getattr(settings, "STOMP_SYSTEM", None) or "rabbitmq"
+        outbox_pattern_settings = getattr(settings, "DJANGO_OUTBOX_PATTERN")  # noqa
+        host, port = outbox_pattern_settings["DEFAULT_STOMP_HOST_AND_PORTS"][0]
+        host_attributes = {
+            NET_PEER_NAME: host,
+            NET_PEER_PORT: port,
+            MESSAGING_SYSTEM: system,
+        }
+        if worker_id() is not None:
+            host_attributes[WORKER_ID] = worker_id()
+        _host_attributes = types.MappingProxyType(host_attributes)
+    return _host_attributes
+
+
+def _clear_host_attributes(setting: str, **kwargs) -> None:
+    global _host_attributes
+    if setting in ("STOMP_SYSTEM", "DJANGO_OUTBOX_PATTERN"):
+        _host_attributes = None
+
+
+def _reset_after_fork() -> None:
+    global _host_attributes
+    _host_attributes = None
+
+
+setting_changed.connect(_clear_host_attributes)
+register_after_fork(_reset_after_fork)
+
+
+@functools.lru_cache(maxsize=1024)
+def span_name(operation: str, destination: str) -> str:
+    """``{operation} {destination}``, memoized so the name of each destination is built once"""
+    return f"{operation} {destination}"
+
+
+def body_size(encoded_body: typing.Union[str, bytes]) -> int:
+    """Size in bytes of the body as it travels to the broker"""
+    if isinstance(encoded_body, str):
+        return len(encoded_body.encode("utf-8"))
+    return len(encoded_body)
+
+
+def get_conversation_id(headers: typing.Dict) -> str:
+    return str(headers.get("dop-correlation-id") or headers.get("correlation-id"))
+
+
+class MessageTelemetry:
+    """
+    Values of one message shared by its spans, computed once in the wrapper: the destination, the conversation id, the
+    size of the encoded body, the operation and the time the wrapper started handling the message.
+    """
+
+    __slots__ = ("destination", "conversation_id", "body_size", "operation", "started_ns")
+
+    def __init__(
+        self,
+        destination: str,
+        conversation_id: str,
+        body_size: int,
+        operation: typing.Optional[str] = None,
+        started_ns: typing.Optional[int] = None,
+    ):
+        self.destination = destination
+        self.conversation_id = conversation_id
+        self.body_size = body_size
+        self.operation = operation
+        self.started_ns = time.time_ns() if started_ns is None else started_ns
+
+    @classmethod
+    def from_message(
+        cls,
+        destination: str,
+        headers: typing.Dict,
+        encoded_body: typing.Union[str, bytes],
+        operation: typing.Optional[str] = None,
+    ) -> "MessageTelemetry":
+        """Record of a message whose body is already encoded, as sent to or received from the broker"""
+        return cls(destination, get_conversation_id(headers), body_size(encoded_body), operation)
+
+    def attributes(self) -> typing.Dict[str, typing.Any]:
+        attributes = {
+            MESSAGING_DESTINATION_NAME: self.destination,
+            MESSAGING_MESSAGE_CONVERSATION_ID: self.conversation_id,
+            MESSAGING_MESSAGE_BODY_SIZE: self.body_size,
+        }
+        if self.operation is not None:
+            attributes[MESSAGING_OPERATION_TYPE] = self.operation
+        return attributes
+
+
+# The message being handled by the consumer, read by the ack and nack spans
+current_message: contextvars.ContextVar[typing.Optional[MessageTelemetry]] = contextvars.ContextVar(
+    "otel_django_outbox_pattern_message", default=None
+)
 
 
 def enrich_span_with_host_data(span: Span):
     """Helper function add broker SpanAttributes"""
-    system = getattr(settings, "STOMP_SYSTEM", None) or "rabbitmq"
-    outbox_pattern_settings = getattr(settings, "DJANGO_OUTBOX_PATTERN")  # noqa
-    host, port = outbox_pattern_settings["DEFAULT_STOMP_HOST_AND_PORTS"][0]
-    attributes = {
-        NET_PEER_NAME: host,
-        NET_PEER_PORT: port,
-        MESSAGING_SYSTEM: system,
-    }
-    span.set_attributes(attributes)
+    span.set_attributes(get_host_attributes())
 
 
 def enrich_span(
@@ -36,15 +138,8 @@ def enrich_span(
     body: typing.Dict,
 ) -> None:
     """Helper function add SpanAttributes"""
-    conversation_id = str(headers.get("dop-correlation-id") or headers.get("correlation-id"))
-    attributes = {
-        MESSAGING_DESTINATION_NAME: destination,
-        MESSAGING_MESSAGE_CONVERSATION_ID: conversation_id,
-        MESSAGING_MESSAGE_BODY_SIZE: sys.getsizeof(json.dumps(body)),
-    }
-    if operation is not None:
-        attributes.update({MESSAGING_OPERATION_TYPE: operation})
-    span.set_attributes(attributes)
+    message = MessageTelemetry.from_message(destination, headers, json.dumps(body), operation)
+    span.set_attributes(message.attributes())
     enrich_span_with_host_data(span)
 
 
@@ -70,17 +165,33 @@ def get_span(
     return span
 
 
+def start_message_span(tracer: Tracer, message: MessageTelemetry, span_kind: SpanKind, name: str) -> Span:
+    """Helper function to start the span of a message from its telemetry record"""
+    span = tracer.start_span(name=name, kind=span_kind, start_time=message.started_ns)
+    if span.is_recording():
+        span.set_attributes(message.attributes())
+        span.set_attributes(get_host_attributes())
+    return span
+
+
 def get_messaging_ack_nack_span(
     tracer: Tracer,
     operation: str,  # ack or nack
     process_span: Span,
+    message: typing.Optional[MessageTelemetry] = None,
 ) -> Span:
     """Helper function to mount span and call function to set SpanAttributes"""
-    destination = process_span._attributes.get(MESSAGING_DESTINATION_NAME, "UNKNOWN")
-    conversation_id = process_span._attributes.get(MESSAGING_MESSAGE_CONVERSATION_ID, "UNKNOWN")
-    span_name = f"ack {destination}" if operation == "ack" else f"nack {destination}"
+    if message is not None:
+        destination = message.destination
+        conversation_id = message.conversation_id
+    else:
+        # Only SDK spans that are recording carry attributes, an unsampled or missing process span falls back to
+        # UNKNOWN
+        process_attributes = getattr(process_span, "attributes", None) or {}
+        destination = process_attributes.get(MESSAGING_DESTINATION_NAME, "UNKNOWN")
+        conversation_id = process_attributes.get(MESSAGING_MESSAGE_CONVERSATION_ID, "UNKNOWN")
 
-    span = tracer.start_span(name=span_name, kind=SpanKind.CONSUMER)
+    span = tracer.start_span(name=span_name(operation, destination), kind=SpanKind.CONSUMER)
     if span.is_recording():
         attributes = {
             MESSAGING_OPERATION_TYPE: operation,
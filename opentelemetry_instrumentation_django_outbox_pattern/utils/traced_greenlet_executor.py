@@ -0,0 +1,88 @@
+import collections
+import concurrent.futures
+import contextvars
+import threading
+import typing
+
+SpawnT = typing.Callable[..., typing.Any]
+
+THREAD = "thread"
+GREENLET = "greenlet"
+WORKER_EXECUTORS = (THREAD, GREENLET)
+
+
+class TracedGreenletExecutor(concurrent.futures.Executor):
+    """
+    Worker executor of the consumers for gevent deployments.
+
+    Each task runs in a greenlet started with ``spawn``, ``gevent.spawn`` by default, inside a copy of the context of
+    the submitting code. The OpenTelemetry context and the context variables of the instrumentation follow the message
+    into its greenlet and never leak into another message or back into the listener. At most ``max_concurrency`` tasks
+    run at a time, the next ones wait in submission order.
+    """
+
+    def __init__(self, spawn: typing.Optional[SpawnT] = None, max_concurrency: int = 1):
+        if max_concurrency < 1:
+            raise ValueError(f"Invalid max_concurrency {max_concurrency!r}, expected a positive number")
+        if spawn is None:
+            # gevent is only needed by the deployments that use this executor
+            from gevent import spawn
+        self.spawn = spawn
+        self.max_concurrency = max_concurrency
+        # threading is patched by gevent, the lock only guards the bookkeeping between greenlets
+        self._lock = threading.Lock()
+        self._pending: typing.Deque[typing.Tuple] = collections.deque()
+        self._running: typing.Set[concurrent.futures.Future] = set()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        task = (concurrent.futures.Future(), contextvars.copy_context(), fn, args, kwargs)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if len(self._running) >= self.max_concurrency:
+                self._pending.append(task)
+                return task[0]
+            self._running.add(task[0])
+        self.spawn(self._run, task)
+        return task[0]
+
+    def _run(self, task: typing.Optional[typing.Tuple]) -> None:
+        # The greenlet takes the next waiting task when it is done, so the concurrency never goes over the limit
+        while task is not None:
+            future, context, fn, args, kwargs = task
+            completed = False
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = context.run(fn, *args, **kwargs)
+                    except BaseException as exception:
+                        future.set_exception(exception)
+                        if not isinstance(exception, Exception):
+                            raise
+                    else:
+                        future.set_result(result)
+                completed = True
+            finally:
+                task = self._finish(future)
+                if not completed and task is not None:
+                    # The greenlet was killed, the next task gets a greenlet of its own
+                    self.spawn(self._run, task)
+
+    def _finish(self, future: concurrent.futures.Future) -> typing.Optional[typing.Tuple]:
+        with self._lock:
+            self._running.discard(future)
+            task = self._pending.popleft() if self._pending else None
+            if task is not None:
+                self._running.add(task[0])
+            return task
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            cancelled = list(self._pending) if cancel_futures else []
+            futures = [task[0] for task in self._pending] + list(self._running)
+        for task in cancelled:
+            task[0].cancel()
+        if wait:
+            concurrent.futures.wait(futures)
@@ -0,0 +1,157 @@
+"""
+Outcome of the database transaction an outbox message is saved in.
+
+A message saved inside an ``atomic`` block is only published once the transaction commits. Django runs the
+``transaction.on_commit`` callbacks after the commit but silently discards them on a rollback, of the transaction or of
+the savepoint they were registered in. ``TransactionWatcher`` registers such a callback and, each time an ``atomic``
+block exits, reports the callbacks Django discarded as rolled back.
+"""
+
+import functools
+import logging
+import threading
+import time
+import typing
+import weakref
+
+from django.db import transaction
+from opentelemetry.metrics import Counter
+from opentelemetry.metrics import Histogram
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace import Span
+
+from .attributes import TRANSACTION_DELAY_MS
+from .attributes import TRANSACTION_OUTCOME
+from .fork_safety import register_after_fork
+from .hooks import end_span
+from .span import MessageTelemetry
+
+COMMITTED = "committed"
+ROLLED_BACK = "rolled_back"
+
+OutcomeCallbackT = typing.Callable[[str], None]
+
+_logger = logging.getLogger(__name__)
+
+
+class _PendingOutcome:
+    __slots__ = ("callback", "done")
+
+    def __init__(self, callback: OutcomeCallbackT):
+        self.callback = callback
+        self.done = False
+
+    def committed(self) -> None:
+        self._end(COMMITTED)
+
+    def rolled_back(self) -> None:
+        self._end(ROLLED_BACK)
+
+    def _end(self, outcome: str) -> None:
+        if self.done:
+            return
+        self.done = True
+        try:
+            self.callback(outcome)
+        except Exception as unmapped_exception:
+            _logger.warning(
+                "An exception occurred while reporting the outcome of a transaction.", exc_info=unmapped_exception
+            )
+
+
+class TransactionWatcher:
+    """
+    Calls back with ``"committed"`` or ``"rolled_back"`` once the transaction in progress ends. ``resolve`` must run
+    after every ``atomic`` block exit, the publisher instrument wraps ``Atomic.__exit__`` for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Connections are per thread, each one has the outcomes of its own transaction
+        self._pending: "weakref.WeakKeyDictionary[typing.Any, typing.List[_PendingOutcome]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        register_after_fork(self._reset_after_fork)
+
+    def watch(self, callback: OutcomeCallbackT, using: typing.Optional[str] = None) -> bool:
+        """Register ``callback``, False without calling it when no transaction is in progress on ``using``"""
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return False
+        pending = _PendingOutcome(callback)
+        transaction.on_commit(pending.committed, using=using)
+        with self._lock:
+            self._pending.setdefault(connection, []).append(pending)
+        return True
+
+    def resolve(self, using: typing.Optional[str] = None) -> None:
+        """Report the callbacks of ``using`` that Django discarded in a rollback"""
+        if not self._pending:
+            # Every atomic exit of the process comes here, most of them with nothing to resolve
+            return
+        try:
+            connection = transaction.get_connection(using)
+            with self._lock:
+                pending = self._pending.pop(connection, None)
+            if not pending:
+                return
+            # The callbacks of the watcher are bound methods of the pending outcomes, they stay alive while pending
+            registered = {id(getattr(item[1], "__self__", None)) for item in connection.run_on_commit}
+            waiting = []
+            for item in pending:
+                if item.done:
+                    continue
+                if id(item) in registered:
+                    waiting.append(item)
+                else:
+                    item.rolled_back()
+            if waiting:
+                with self._lock:
+                    self._pending.setdefault(connection, [])[:0] = waiting
+        except Exception as unmapped_exception:
+            _logger.warning(
+                "An exception occurred while resolving the transaction outcomes.", exc_info=unmapped_exception
+            )
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(items) for items in self._pending.values())
+
+    def _reset_after_fork(self) -> None:
+        # The transactions in progress belong to the parent, the child never commits them
+        self._lock = threading.Lock()
+        self._pending = weakref.WeakKeyDictionary()
+
+
+class CommitDelayRecorder:
+    """
+    Records the save to commit delay of the messages saved in a transaction and counts the messages whose transaction
+    rolled back, per destination. A span handed to ``track`` gets a ``transaction.committed`` or
+    ``transaction.rolled_back`` event and is ended with the transaction.
+    """
+
+    def __init__(
+        self, transaction_watcher: TransactionWatcher, commit_delay_histogram: Histogram, rollback_counter: Counter
+    ):
+        self.transaction_watcher = transaction_watcher
+        self.commit_delay_histogram = commit_delay_histogram
+        self.rollback_counter = rollback_counter
+
+    def track(
+        self, message: MessageTelemetry, using: typing.Optional[str] = None, span: typing.Optional[Span] = None
+    ) -> bool:
+        """False when the message is saved outside a transaction, the span is left to the caller then"""
+        return self.transaction_watcher.watch(functools.partial(self._record, message, span), using)
+
+    def _record(self, message: MessageTelemetry, span: typing.Optional[Span], outcome: str) -> None:
+        delay_ms = (time.time_ns() - message.started_ns) / 1_000_000
+        metric_attributes = {MESSAGING_DESTINATION_NAME: message.destination}
+        if outcome == COMMITTED:
+            self.commit_delay_histogram.record(delay_ms, metric_attributes)
+        else:
+            self.rollback_counter.add(1, metric_attributes)
+        if span is not None:
+            if span.is_recording():
+                span.add_event(f"transaction.{outcome}", {TRANSACTION_DELAY_MS: delay_ms})
+                span.set_attribute(TRANSACTION_OUTCOME, outcome)
+            end_span(span)
@@ -0,0 +1,154 @@
+import itertools
+import logging
+import sys
+import threading
+import time
+import traceback
+import typing
+
+from types import FrameType
+
+from opentelemetry.metrics import Counter
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace.span import Span
+
+from .attributes import HANDLER_DEADLINE_MS
+from .attributes import HANDLER_ELAPSED_MS
+from .attributes import HANDLER_THREAD_NAME
+from .fork_safety import register_after_fork
+
+_logger = logging.getLogger(__name__)
+
+
+class _InFlightHandler:
+    __slots__ = ("span", "destination", "thread", "greenlet", "started_ns", "reported")
+
+    def __init__(self, span: Span, destination: str, thread: threading.Thread, greenlet: typing.Any, started_ns: int):
+        self.span = span
+        self.destination = destination
+        self.thread = thread
+        self.greenlet = greenlet
+        self.started_ns = started_ns
+        self.reported = False
+
+    def frame(self) -> typing.Optional[FrameType]:
+        if self.greenlet is not None:
+            # Every greenlet of a gevent worker thread shares its ident, only the greenlet knows where it waits
+            return self.greenlet.gr_frame
+        return sys._current_frames().get(self.thread.ident)
+
+
+class HandlerWatchdog:
+    """
+    Table of the message handlers in progress scanned by one daemon thread every ``scan_interval_s`` seconds.
+
+    A handler still running after ``deadline_s`` is reported once: a "handler.stuck" event is added to its process
+    span, the stuck handler counter is incremented and a warning is logged, with the stack of the worker thread when
+    ``dump_stack`` is enabled. The process span itself only ends when the handler returns.
+
+    When the handlers run in greenlets, ``current_greenlet``, e.g. ``greenlet.getcurrent``, gives the greenlet of the
+    handler so the stack logged is the one of that greenlet rather than of the thread it runs on.
+    """
+
+    def __init__(
+        self,
+        deadline_s: float,
+        scan_interval_s: float = 10,
+        counter: typing.Optional[Counter] = None,
+        dump_stack: bool = False,
+        current_greenlet: typing.Optional[typing.Callable[[], typing.Any]] = None,
+    ):
+        self.deadline_ns = int(deadline_s * 1_000_000_000)
+        self.scan_interval_s = scan_interval_s
+        self.counter = counter
+        self.dump_stack = dump_stack
+        self.current_greenlet = current_greenlet
+        self._keys = itertools.count()
+        self._in_flight: typing.Dict[int, _InFlightHandler] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+        register_after_fork(self._reset_after_fork)
+
+    def track(self, span: Span, destination: str) -> int:
+        """Register the handler running on the current thread, returns the key to ``untrack`` it"""
+        self._ensure_started()
+        key = next(self._keys)
+        greenlet = self.current_greenlet() if self.current_greenlet is not None else None
+        self._in_flight[key] = _InFlightHandler(
+            span, destination, threading.current_thread(), greenlet, time.monotonic_ns()
+        )
+        return key
+
+    def untrack(self, key: int) -> None:
+        self._in_flight.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def scan(self, now: typing.Optional[int] = None) -> int:
+        """Report the handlers over the deadline that were not reported yet, returns how many were reported"""
+        now = time.monotonic_ns() if now is None else now
+        stuck = [
+            handler
+            for handler in list(self._in_flight.values())
+            if not handler.reported and now - handler.started_ns >= self.deadline_ns
+        ]
+        for handler in stuck:
+            handler.reported = True
+            try:
+                self._report(handler, now)
+            except Exception as unmapped_exception:
+                _logger.warning("An exception occurred while reporting a stuck handler.", exc_info=unmapped_exception)
+        return len(stuck)
+
+    def _report(self, handler: _InFlightHandler, now: int) -> None:
+        elapsed_ms = (now - handler.started_ns) / 1_000_000
+        if handler.span.is_recording():
+            handler.span.add_event(
+                "handler.stuck",
+                {
+                    HANDLER_ELAPSED_MS: elapsed_ms,
+                    HANDLER_DEADLINE_MS: self.deadline_ns / 1_000_000,
+                    HANDLER_THREAD_NAME: handler.thread.name,
+                },
+            )
+        if self.counter is not None:
+            self.counter.add(1, {MESSAGING_DESTINATION_NAME: handler.destination})
+        stack = ""
+        if self.dump_stack:
+            frame = handler.frame()
+            if frame is not None:
+                stack = "\n" + "".join(traceback.format_stack(frame))
+        _logger.warning(
+            "The handler of a message from %s has been running for %.0f ms on %s.%s",
+            handler.destination,
+            elapsed_ms,
+            handler.thread.name,
+            stack,
+        )
+
+    def shutdown(self, timeout: typing.Optional[float] = None) -> None:
+        self._stopped.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _reset_after_fork(self) -> None:
+        """The handlers in progress and the scan thread belong to the parent, the child starts its own thread"""
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopped.is_set():
+                self._thread = threading.Thread(target=self._run, name="otel-outbox-watchdog", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.scan_interval_s):
+            self.scan()
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import SpanKind
+from opentelemetry.trace import StatusCode
+
+from opentelemetry_instrumentation_django_outbox_pattern.exporters import ring_buffer
+from opentelemetry_instrumentation_django_outbox_pattern.exporters.ring_buffer import RingBufferSpanExporter
+from opentelemetry_instrumentation_django_outbox_pattern.exporters.ring_buffer import main
+from opentelemetry_instrumentation_django_outbox_pattern.exporters.ring_buffer import read_ring
+
+
+class RingBufferSpanExporterTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "spans.ring")
+
+    def export(self, names, capacity=4096):
+        exporter = RingBufferSpanExporter(self.path, capacity=capacity)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tracer = tracer_provider.get_tracer(__name__)
+        for name in names:
+            with tracer.start_as_current_span(name, kind=SpanKind.CONSUMER, attributes={"index": name}) as span:
+                span.add_event("message.ack")
+                span.set_status(StatusCode.OK)
+        tracer_provider.shutdown()
+        return exporter
+
+    def test_spans_are_decoded_in_order(self):
+        """Test that the reader decodes every span written to a ring that did not wrap yet"""
+        self.export(["process first", "process second"])
+
+        spans = list(read_ring(self.path))
+
+        self.assertEqual([span["name"] for span in spans], ["process first", "process second"])
+        self.assertEqual(spans[0]["kind"], "CONSUMER")
+        self.assertEqual(spans[0]["status"]["status_code"], "OK")
+        self.assertEqual(spans[0]["attributes"], {"index": "process first"})
+        self.assertEqual(spans[0]["events"][0]["name"], "message.ack")
+        self.assertEqual(len(spans[0]["trace_id"]), 32)
+
+    def test_oldest_spans_are_overwritten(self):
+        """Test that a wrapped ring keeps the most recent spans and skips the record cut by the wrap"""
+        names = [f"process {index:03}" for index in range(100)]
+
+        self.export(names, capacity=2048)
+
+        decoded = [span["name"] for span in read_ring(self.path)]
+        self.assertGreater(len(decoded), 1)
+        self.assertLess(len(decoded), len(names))
+        self.assertEqual(decoded, names[-len(decoded) :])
+        self.assertEqual(os.path.getsize(self.path), 2048 + 24)
+
+    def test_ring_of_the_same_capacity_is_appended_to(self):
+        """Test that a restarted process keeps the spans written before it"""
+        self.export(["process before restart"])
+        self.export(["process after restart"])
+
+        self.assertEqual(
+            [span["name"] for span in read_ring(self.path)], ["process before restart", "process after restart"]
+        )
+
+        self.export(["process new capacity"], capacity=8192)
+        self.assertEqual([span["name"] for span in read_ring(self.path)], ["process new capacity"])
+
+    def test_record_still_being_written_is_skipped(self):
+        """Test that the reader ignores bytes reserved by a writer that did not copy its record yet"""
+        exporter = RingBufferSpanExporter(self.path, capacity=4096)
+        exporter._reserve(100)
+        exporter.shutdown()
+        self.export(["process after gap"])
+
+        self.assertEqual([span["name"] for span in read_ring(self.path)], ["process after gap"])
+
+    def test_span_larger_than_the_ring_is_dropped(self):
+        """Test that a span that cannot fit is counted and does not corrupt the ring"""
+        exporter = self.export(["process " + "x" * 200], capacity=128)
+
+        self.assertEqual(exporter.dropped, 1)
+        self.assertEqual(list(read_ring(self.path)), [])
+
+    def test_main_writes_json_lines(self):
+        """Test that the command line reader prints one span per line"""
+        self.export(["process first", "process second"])
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            main([self.path])
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["process first", "process second"])
+
+    def test_file_that_is_not_a_ring_is_rejected(self):
+        """Test that the reader refuses other files"""
+        with open(self.path, "wb") as ring_file:
+            ring_file.write(b"\0" * 64)
+
+        with self.assertRaises(ValueError):
+            list(read_ring(self.path))
+
+    def test_forked_workers_reuse_a_bounded_set_of_rings(self):
+        """Test that a child claims the first free worker slot and a recycled worker takes over the ring of its slot"""
+        first = RingBufferSpanExporter(self.path, capacity=4096, max_workers=2)
+        second = RingBufferSpanExporter(self.path, capacity=4096, max_workers=2)
+        third = RingBufferSpanExporter(self.path, capacity=4096, max_workers=2)
+        for exporter in (first, second, third):
+            self.addCleanup(exporter.shutdown)
+
+        first._reset_after_fork()
+        second._reset_after_fork()
+        with self.assertLogs(logger=ring_buffer._logger, level="WARNING") as log:
+            third._reset_after_fork()
+        first.shutdown()
+        recycled = RingBufferSpanExporter(self.path, capacity=4096, max_workers=2)
+        self.addCleanup(recycled.shutdown)
+        recycled._reset_after_fork()
+
+        self.assertEqual(first.path, f"{self.path}.0")
+        self.assertEqual(second.path, f"{self.path}.1")
+        self.assertIn("All the 2 worker rings", log.output[0])
+        self.assertEqual(third.export([]), SpanExportResult.FAILURE)
+        self.assertEqual(recycled.path, f"{self.path}.0")
@@ -1,4 +1,5 @@
 import json
+import time
 
 from unittest.mock import MagicMock
 from unittest.mock import patch
@@ -10,6 +11,9 @@ from django_outbox_pattern.factories import factory_consumer
 from django_outbox_pattern.headers import get_message_headers
 from django_outbox_pattern.models import Published
 from django_outbox_pattern.models import Received
+from opentelemetry import context
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_BODY_SIZE
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_CONVERSATION_ID
@@ -21,10 +25,33 @@ from opentelemetry.semconv.trace import MessagingOperationValues
 from request_id_django_log import local_threading
 from stomp.listener import TestListener
 
+from opentelemetry_instrumentation_django_outbox_pattern import DjangoOutboxPatternInstrumentor
+from opentelemetry_instrumentation_django_outbox_pattern.instrumentors import consumer_instrument
 from opentelemetry_instrumentation_django_outbox_pattern.instrumentors.consumer_instrument import (
     _logger as consumer_logger,
 )
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_N_PLUS_ONE
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_QUERY_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_TOP_STATEMENT_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import LISTENER_NAME
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MEMORY_PEAK_BYTES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MESSAGE_DELIVERY_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import PIPELINE_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import THREAD_CPU_TIME_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import TRANSIT_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SAVED_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SENT_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import CONSUMER_RECEIVE_TO_ACK_DURATION
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import CONSUMER_RECEIVE_TO_NACK_DURATION
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import CONSUMER_REDELIVERIES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import CONSUMER_UNACKED_MESSAGES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import CONSUMER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import instrumentation_switch
+from opentelemetry_instrumentation_django_outbox_pattern.utils.traced_greenlet_executor import TracedGreenletExecutor
+from opentelemetry_instrumentation_django_outbox_pattern.utils.watchdog import HandlerWatchdog
+from opentelemetry_instrumentation_django_outbox_pattern.utils.watchdog import _logger as watchdog_logger
 from tests.support.helpers_tests import TestBase
+from tests.support.otel_helpers import instrument_app_with
 
 
 def get_callback(raise_except=False):
@@ -74,7 +101,7 @@ class TestConsumerInstrument(ConsumerInstrumentBase):
         self.consumer.set_listener("test_listener", TestListener(print_to_log=True))
         self.listener = self.consumer.get_listener("test_listener")
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_consumer_create_span_with_ack(self, mock_payload_size):
         # Arrange
         headers = get_message_headers(
@@ -127,7 +154,7 @@ class TestConsumerInstrument(ConsumerInstrumentBase):
         del ack_expected_attributes["messaging.message.body.size"]
         self.assertEqual(dict(ack_span.attributes), ack_expected_attributes)
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_consumer_create_span_with_nack(self, mock_payload_size):
         # Arrange
         callback = get_callback(raise_except=True)
@@ -180,7 +207,8 @@ class TestConsumerInstrument(ConsumerInstrumentBase):
         del nack_expected_attributes["messaging.message.body.size"]
         self.assertEqual(dict(nack_span.attributes), nack_expected_attributes)
 
-    def test_should_handle_exception_in_common_ack(self):
+    @patch.object(consumer_instrument, "get_messaging_ack_nack_span", side_effect=KeyError("fake exception"))
+    def test_should_handle_exception_in_common_ack(self, mock_get_messaging_ack_nack_span):
         # Arrange
         self.consumer.connection.send_frame = MagicMock()
 
@@ -195,7 +223,8 @@ class TestConsumerInstrument(ConsumerInstrumentBase):
             log.output[0],
         )
 
-    def test_should_handle_exception_in_common_nack(self):
+    @patch.object(consumer_instrument, "get_messaging_ack_nack_span", side_effect=KeyError("fake exception"))
+    def test_should_handle_exception_in_common_nack(self, mock_get_messaging_ack_nack_span):
         # Arrange
         self.consumer.connection.send_frame = MagicMock()
 
@@ -230,3 +259,323 @@ class TestConsumerInstrument(ConsumerInstrumentBase):
             "An exception occurred in the instrument_callback wrap.",
             log.output[0],
         )
+
+
+class TestConsumerInstrumentOptionalTelemetry(ConsumerInstrumentBase):
+
+    def setUp(self):
+        super().setUp()
+        self.consumer = factory_consumer()
+        self.consumer.connection.send_frame = MagicMock()
+
+    @patch("django_outbox_pattern.consumers.db.close_old_connections")
+    def handle_message(self, callback, mock_close_old_connections, **extra_headers):
+        self.consumer.callback = callback
+        self.consumer.message_handler(
+            json.dumps(self.fake_payload_body),
+            {
+                "message-id": f"{uuid4()}",
+                "destination": self.test_queue_name,
+                "dop-correlation-id": self.correlation_id,
+                **extra_headers,
+            },
+        )
+        self.consumer.stop()
+
+    def test_should_not_record_db_queries_by_default(self):
+        # Act
+        self.handle_message(get_callback())
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertNotIn(DB_QUERY_COUNT, process.attributes)
+
+    def test_should_record_db_queries_on_process_span(self):
+        # Arrange
+        def callback(payload):
+            for _ in range(3):
+                Received.objects.filter(msg_id=f"{uuid4()}").exists()
+            payload.save()
+
+        # Act
+        with instrument_app_with(track_db_queries=True, db_query_repeat_threshold=3):
+            self.handle_message(callback)
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertGreaterEqual(process.attributes[DB_QUERY_COUNT], 4)
+        self.assertGreaterEqual(process.attributes[DB_TOP_STATEMENT_COUNT], 3)
+        self.assertTrue(process.attributes[DB_N_PLUS_ONE])
+        self.assertIn("db.n_plus_one", [event.name for event in process.events])
+
+    def test_should_record_cpu_time_and_memory_peak_on_process_span(self):
+        # Act
+        with instrument_app_with(profile_cpu_time=True, profile_memory=True):
+            self.handle_message(get_callback())
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertGreaterEqual(process.attributes[THREAD_CPU_TIME_MS], 0)
+        self.assertGreater(process.attributes[MEMORY_PEAK_BYTES], 0)
+
+    def test_should_fall_through_when_destination_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(CONSUMER, "topic:consumer.v1")
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        self.handle_message(get_callback())
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.consumer.connection.send_frame.assert_called_once()
+        self.assertEqual(self.consumer.connection.send_frame.call_args[0][0], "ACK")
+
+    def test_should_keep_tracing_the_calls_of_the_callback_when_destination_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(CONSUMER, "topic:consumer.v1")
+        self.addCleanup(instrumentation_switch.reset)
+
+        def callback(payload):
+            Published.objects.create(destination="/exchange/test-exchange/forwarded", body=payload.body)
+            payload.save()
+
+        # Act
+        self.handle_message(callback)
+
+        # Assert
+        span_names = [span.name for span in self.get_finished_spans()]
+        self.assertEqual(span_names, ["save published /exchange/test-exchange/forwarded"])
+        self.assertEqual(self.consumer.connection.send_frame.call_args[0][0], "ACK")
+
+    def test_should_fall_through_when_consumer_side_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(CONSUMER)
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        self.consumer.connection.nack("message_fake_id")
+        self.handle_message(get_callback(raise_except=True))
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.assertEqual(self.consumer.connection.send_frame.call_count, 2)
+
+    def test_should_trace_other_destinations(self):
+        # Arrange
+        instrumentation_switch.disable(CONSUMER, "topic:other.v1")
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        self.handle_message(get_callback())
+
+        # Assert
+        finished_spans = self.get_finished_spans()
+        finished_spans.by_name("process topic:consumer.v1")
+        finished_spans.by_name("ack topic:consumer.v1")
+
+    def test_should_restore_context_when_callback_fails(self):
+        # Arrange
+        previous_context = context.get_current()
+
+        # Act
+        self.handle_message(get_callback(raise_except=True), traceparent=f"00-{'1' * 32}-{'2' * 16}-01")
+
+        # Assert
+        self.assertIs(context.get_current(), previous_context)
+        self.assertEqual(self.consumer.connection.send_frame.call_args[0][0], "NACK")
+
+    @patch.object(consumer_instrument, "start_message_span", side_effect=KeyError("fake exception"))
+    def test_should_restore_context_when_span_creation_fails(self, mock_start_message_span):
+        # Arrange
+        previous_context = context.get_current()
+
+        # Act
+        with self.assertLogs(logger=consumer_logger, level="WARNING") as log:
+            self.handle_message(get_callback(), traceparent=f"00-{'1' * 32}-{'2' * 16}-01")
+
+        # Assert
+        self.assertIs(context.get_current(), previous_context)
+        self.assertIn("An exception occurred in the instrument_callback wrap.", log.output[0])
+        self.consumer.connection.send_frame.assert_called_once()
+
+    def test_should_run_consumer_hook_in_background(self):
+        # Arrange
+        hook_calls = []
+
+        def hook(span, body, headers):
+            hook_calls.append((span.get_span_context().span_id, headers["destination"]))
+
+        # Act
+        with instrument_app_with(consumer_hook=hook, background_hooks={"consumer"}, hook_queue_size=1):
+            self.handle_message(get_callback())
+            DjangoOutboxPatternInstrumentor()._hook_executor.join()
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertEqual(hook_calls, [(process.context.span_id, self.test_queue_name)])
+
+    def test_should_skip_the_process_span_when_the_threshold_rejects_the_trace(self):
+        # Arrange
+        rejected_trace_id = "1" * 32
+
+        # Act
+        with instrument_app_with(consistent_sampling=True):
+            self.handle_message(
+                get_callback(), traceparent=f"00-{rejected_trace_id}-{'2' * 16}-01", tracestate="ot=th:8"
+            )
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.assertEqual(self.consumer.connection.send_frame.call_args[0][0], "ACK")
+
+    def test_should_create_the_process_span_when_the_threshold_keeps_the_trace(self):
+        # Arrange
+        kept_trace_id = "f" * 32
+
+        # Act
+        with instrument_app_with(consistent_sampling=True):
+            self.handle_message(get_callback(), traceparent=f"00-{kept_trace_id}-{'2' * 16}-01", tracestate="ot=th:8")
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertEqual(process.context.trace_id, int(kept_trace_id, 16))
+        self.assertEqual(process.context.trace_state.get("ot"), "th:8")
+
+    def test_should_ignore_the_threshold_without_consistent_sampling(self):
+        # Act
+        self.handle_message(get_callback(), traceparent=f"00-{'1' * 32}-{'2' * 16}-01", tracestate="ot=th:8")
+
+        # Assert
+        self.get_finished_spans().by_name("process topic:consumer.v1")
+
+    def test_should_record_delivery_count_and_flag_poison_messages(self):
+        # Arrange
+        metric_reader = InMemoryMetricReader()
+        message_id = f"{uuid4()}"
+
+        # Act
+        with instrument_app_with(
+            meter_provider=MeterProvider(metric_readers=[metric_reader]),
+            track_redeliveries=True,
+            poison_message_threshold=3,
+        ):
+            for _ in range(3):
+                self.handle_message(get_callback(raise_except=True), **{"dop-msg-id": message_id})
+
+        # Assert
+        process_spans = [span for span in self.get_finished_spans() if span.name == "process topic:consumer.v1"]
+        self.assertEqual([span.attributes[MESSAGE_DELIVERY_COUNT] for span in process_spans], [1, 2, 3])
+        self.assertNotIn("message.poison", [event.name for event in process_spans[1].events])
+        self.assertIn("message.poison", [event.name for event in process_spans[2].events])
+        [metric] = [
+            metric
+            for resource_metrics in metric_reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+            if metric.name == CONSUMER_REDELIVERIES
+        ]
+        [point] = metric.data.data_points
+        self.assertEqual(point.value, 2)
+        self.assertEqual(point.attributes, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+
+    def test_should_report_handler_over_the_watchdog_deadline(self):
+        # Arrange
+        def slow_callback(payload):
+            time.sleep(0.3)
+            payload.save()
+
+        # Act
+        with self.assertLogs(logger=watchdog_logger, level="WARNING"):
+            with instrument_app_with(watchdog_deadline_s=0.05, watchdog_interval_s=0.01):
+                self.handle_message(slow_callback)
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertIn("handler.stuck", [event.name for event in process.events])
+
+    def test_should_end_the_process_span_when_the_watchdog_fails(self):
+        # Arrange
+        callback = MagicMock(side_effect=get_callback())
+        context_before = context.get_current()
+
+        # Act
+        with self.assertLogs(logger=consumer_instrument._logger, level="WARNING") as log:
+            with patch.object(HandlerWatchdog, "track", side_effect=KeyError("fake exception")):
+                with instrument_app_with(watchdog_deadline_s=60):
+                    self.handle_message(callback)
+
+        # Assert
+        self.assertIn("An exception occurred while tracking the message in progress.", log.output[0])
+        callback.assert_called_once()
+        self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertIsNone(consumer_instrument.current_message.get())
+        self.assertEqual(context.get_current(), context_before)
+
+    def test_should_record_transit_and_pipeline_latency(self):
+        # Arrange
+        received_ms = time.time_ns() // 1_000_000
+        latency_headers = {SAVED_TIME_HEADER: str(received_ms - 60_000), SENT_TIME_HEADER: str(received_ms - 100)}
+
+        # Act
+        with instrument_app_with(track_pipeline_latency=True):
+            self.handle_message(get_callback(), **latency_headers)
+
+        # Assert
+        process = self.get_finished_spans().by_name("process topic:consumer.v1")
+        self.assertGreaterEqual(process.attributes[TRANSIT_DURATION_MS], 100)
+        self.assertGreaterEqual(process.attributes[PIPELINE_DURATION_MS], 60_000)
+        self.assertLess(process.attributes[PIPELINE_DURATION_MS], 70_000)
+
+    def test_should_record_receive_to_ack_and_nack_durations(self):
+        # Arrange
+        metric_reader = InMemoryMetricReader()
+
+        # Act
+        with instrument_app_with(
+            meter_provider=MeterProvider(metric_readers=[metric_reader]), track_acknowledgements=True
+        ):
+            self.handle_message(get_callback())
+            self.handle_message(get_callback(raise_except=True))
+
+        # Assert
+        metrics = {
+            metric.name: metric.data.data_points
+            for resource_metrics in metric_reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+        }
+        [ack_point] = metrics[CONSUMER_RECEIVE_TO_ACK_DURATION]
+        [nack_point] = metrics[CONSUMER_RECEIVE_TO_NACK_DURATION]
+        [unacked_point] = metrics[CONSUMER_UNACKED_MESSAGES]
+        self.assertEqual((ack_point.count, nack_point.count, unacked_point.value), (1, 1, 0))
+        self.assertEqual(ack_point.attributes[LISTENER_NAME], self.consumer.listener_name)
+
+    @patch("django_outbox_pattern.consumers.db.close_old_connections")
+    def test_should_handle_messages_in_greenlets(self, mock_close_old_connections):
+        # Arrange
+        # Each greenlet runs in the calling thread, so the callback writes in the transaction of the test
+        spawn = MagicMock(side_effect=lambda function, *args: function(*args))
+        headers = {"destination": self.test_queue_name, "dop-correlation-id": self.correlation_id}
+
+        # Act
+        with instrument_app_with(worker_executor="greenlet", greenlet_spawn=spawn, greenlet_concurrency=4):
+            consumer = factory_consumer()
+            consumer.connection.send_frame = MagicMock()
+            consumer.callback = get_callback()
+            for index in range(3):
+                consumer._submit_task_to_worker_pool(
+                    json.dumps(self.fake_payload_body),
+                    {**headers, "message-id": f"{uuid4()}", "traceparent": f"00-{index + 1:032x}-{'2' * 16}-01"},
+                )
+            consumer.stop()
+
+        # Assert
+        self.assertIsInstance(consumer._pool_executor, TracedGreenletExecutor)
+        self.assertEqual(spawn.call_count, 3)
+        process_spans = [span for span in self.get_finished_spans() if span.name.startswith("process ")]
+        self.assertEqual(sorted(span.context.trace_id for span in process_spans), [1, 2, 3])
+        for span in self.get_finished_spans():
+            if span.name.startswith("ack "):
+                self.assertIn(span.context.trace_id, [1, 2, 3])
+        self.assertEqual(consumer.connection.send_frame.call_count, 3)
@@ -0,0 +1,73 @@
+import threading
+
+from unittest.mock import patch
+from uuid import uuid4
+
+from django_outbox_pattern.consumers import Consumer
+from django_outbox_pattern.models import Published
+from django_outbox_pattern.models import Received
+from django_outbox_pattern.producers import Producer
+from stomp.connect import StompConnection12
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import format_publisher_destination
+from tests.support.helpers_tests import TransactionTestBase
+from tests.support.stomp_broker import StompBrokerStub
+
+
+class TestEndToEndInstrument(TransactionTestBase):
+    """Publish from the database and consume through the in-process broker stub, the consumer runs in its own thread"""
+
+    messages = 5
+
+    def setUp(self):
+        super().setUp()
+        self.destination = f"/exchange/test-exchange/test-end-to-end-{uuid4()}"
+        self.consumed = []
+        self.all_consumed = threading.Event()
+        self.broker = StompBrokerStub().start()
+        self.addCleanup(self.broker.stop)
+
+    def callback(self, payload):
+        payload.save()
+        self.consumed.append(payload.body)
+        if len(self.consumed) == self.messages:
+            self.all_consumed.set()
+
+    def publish_and_consume(self):
+        producer = Producer(StompConnection12([self.broker.host_and_port]), "guest", "guest")
+        for index in range(self.messages):
+            Published.objects.create(destination=self.destination, body={"index": index})
+        with patch.object(producer, "_waiting"):
+            producer.publish_message_from_database()
+
+        # The broker keeps the messages until the subscription, so the SQLite writes of both sides never overlap
+        consumer = Consumer(StompConnection12([self.broker.host_and_port]), "guest", "guest")
+        consumer.start(self.callback, self.destination)
+        self.all_consumed.wait(timeout=10)
+        consumer.stop()
+        self.broker.wait_for_acknowledgements(self.messages, timeout=10)
+
+    def test_should_trace_every_message_from_save_to_ack(self):
+        # Act
+        self.publish_and_consume()
+
+        # Assert
+        self.assertEqual(len(self.consumed), self.messages)
+        self.assertEqual(self.broker.acked, self.messages)
+        self.assertEqual(Received.objects.count(), self.messages)
+        finished_spans = self.get_finished_spans()
+        destination = format_publisher_destination(self.destination)
+        send_spans = [span for span in finished_spans if span.name == f"send {destination}"]
+        process_spans = [span for span in finished_spans if span.name.startswith("process ")]
+        ack_spans = [span for span in finished_spans if span.name.startswith("ack ")]
+        self.assertEqual(len(send_spans), self.messages)
+        self.assertEqual(len(process_spans), self.messages)
+        self.assertEqual(len(ack_spans), self.messages)
+        self.assertEqual(
+            {span.context.span_id for span in send_spans},
+            {span.parent.span_id for span in process_spans},
+        )
+        self.assertEqual(
+            {span.context.span_id for span in process_spans},
+            {span.parent.span_id for span in ack_spans},
+        )
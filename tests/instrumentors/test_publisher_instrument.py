@@ -1,11 +1,21 @@
+import json
+import time
+
 from io import StringIO
+from unittest.mock import MagicMock
 from unittest.mock import PropertyMock
 from unittest.mock import patch
 from uuid import uuid4
 
 from django.core.management import call_command
+from django.db import transaction
 from django_outbox_pattern.management.commands.publish import Command
 from django_outbox_pattern.models import Published
+from django_outbox_pattern.producers import Producer
+from opentelemetry import context
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_BATCH_MESSAGE_COUNT
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_BODY_SIZE
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_MESSAGE_CONVERSATION_ID
@@ -13,15 +23,34 @@ from opentelemetry.semconv._incubating.attributes.messaging_attributes import ME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_SYSTEM
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_NAME
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_PORT
+from opentelemetry.trace import StatusCode
+from opentelemetry.trace import format_trace_id
 from request_id_django_log import local_threading
 
+from opentelemetry_instrumentation_django_outbox_pattern import DjangoOutboxPatternInstrumentor
 from opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument import (
     _logger as publisher_logger,
 )
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MEMORY_PEAK_BYTES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import SAVE_TOTAL_BODY_SIZE
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import THREAD_CPU_TIME_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import TRANSACTION_DELAY_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import TRANSACTION_OUTCOME
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import WRAPPER_NAME
 from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import format_publisher_destination
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SAVED_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SENT_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import HOOK_DURATION
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import INSTRUMENTATION_OVERHEAD
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import PUBLISHER_COMMIT_DELAY
+from opentelemetry_instrumentation_django_outbox_pattern.utils.metrics import PUBLISHER_ROLLED_BACK_MESSAGES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import PUBLISHER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import instrumentation_switch
+from opentelemetry_instrumentation_django_outbox_pattern.utils.save_summary import save_summary
 from tests.support.helpers_tests import TestBase
 from tests.support.otel_helpers import CustomFakeException
 from tests.support.otel_helpers import get_traceparent_from_span
+from tests.support.otel_helpers import instrument_app_with
 
 
 class PublisherInstrumentBase(TestBase):
@@ -52,7 +81,7 @@ class PublisherInstrumentBase(TestBase):
 
 class TestPublisherSaveInstrument(PublisherInstrumentBase):
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_match_traceparent_header_message_equals_to_traceparent_context_span(self, mock_payload_size):
         # Act
         published_create = Published.objects.create(
@@ -69,7 +98,7 @@ class TestPublisherSaveInstrument(PublisherInstrumentBase):
 
 class TestPublisherSaveInstrumentRaises(PublisherInstrumentBase):
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_log_exception_if_it_was_raised_inside_hook_function(self, mock_payload_size):
         # Arrange
         body = {"raise_publisher_hook_exception": True, **self.fake_payload_body}
@@ -91,11 +120,11 @@ class TestPublisherSaveInstrumentRaises(PublisherInstrumentBase):
         self.assertIn('CustomFakeException("fake exception")', publisher_log.output[0])
 
     @patch(
-        "opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument.get_span",
+        "opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument.start_message_span",
         side_effect=CustomFakeException("fake high level exception"),
     )
-    @patch("sys.getsizeof", return_value=1)
-    def test_should_log_exception_if_it_was_raised_to_instrument(self, mock_payload_size, mock_get_span):
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
+    def test_should_log_exception_if_it_was_raised_to_instrument(self, mock_payload_size, mock_start_message_span):
         # Act
         with self.assertLogs(logger=publisher_logger, level="WARNING") as publisher_log:
             published_create = Published.objects.create(
@@ -128,7 +157,7 @@ class TestPublisherToBrokerInstrument(PublisherInstrumentBase):
             MESSAGING_SYSTEM: "rabbitmq",
         }
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_publish_with_trace_traceparent_header_and_create_publish_span(self, mock_payload_size):
         # Act save
         published_create = Published.objects.create(
@@ -169,7 +198,7 @@ class TestPublisherToBrokerRaisesInstrument(PublisherInstrumentBase):
             MESSAGING_SYSTEM: "rabbitmq",
         }
 
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_publish_with_trace_traceparent_when_callback_hook_fails(self, mock_payload_size):
         # Arrange save
         body = {"raise_publisher_hook_exception": True, **self.fake_payload_body}
@@ -204,7 +233,7 @@ class TestPublisherToBrokerRaisesInstrument(PublisherInstrumentBase):
         "opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument.format_publisher_destination",  # noqa: E501
         side_effect=CustomFakeException("fake high level exception"),
     )
-    @patch("sys.getsizeof", return_value=1)
+    @patch("opentelemetry_instrumentation_django_outbox_pattern.utils.span.body_size", return_value=1)
     def test_should_publish_when_exception_occurs_on_instrument(
         self, mock_payload_size, mock_format_publisher_destination
     ):
@@ -233,3 +262,509 @@ class TestPublisherToBrokerRaisesInstrument(PublisherInstrumentBase):
         self.assertEqual(len(publisher_log.output), 1)
         self.assertIn("An exception occurred in the on_send_message wrap.", publisher_log.output[0])
         self.assertIn("CustomFakeException: fake high level exception", publisher_log.output[0])
+
+
+class TestPublisherSendOptionalTelemetry(PublisherInstrumentBase):
+    """Exercise the send wrapper through Producer with a fake broker connection"""
+
+    def setUp(self):
+        super().setUp()
+        self.producer = Producer(connection=MagicMock(), username="guest", passcode="guest")
+        self.send_span_name = f"send {format_publisher_destination(self.test_queue_name)}"
+
+    def send(self):
+        self.producer.send_event(
+            body=self.fake_payload_body,
+            destination=self.test_queue_name,
+            headers={"dop-correlation-id": self.correlation_id},
+        )
+
+    def test_should_not_profile_send_by_default(self):
+        # Act
+        self.send()
+
+        # Assert
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        self.assertNotIn(THREAD_CPU_TIME_MS, publish_span.attributes)
+        self.assertNotIn(MEMORY_PEAK_BYTES, publish_span.attributes)
+        self.producer.connection.send.assert_called_once()
+
+    def test_should_record_cpu_time_and_memory_peak_on_send_span(self):
+        # Act
+        with instrument_app_with(profile_cpu_time=True, profile_memory=True):
+            self.send()
+
+        # Assert
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        self.assertGreaterEqual(publish_span.attributes[THREAD_CPU_TIME_MS], 0)
+        self.assertGreaterEqual(publish_span.attributes[MEMORY_PEAK_BYTES], 0)
+        self.producer.connection.send.assert_called_once()
+
+    def test_should_fall_through_when_destination_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(PUBLISHER, format_publisher_destination(self.test_queue_name))
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        self.send()
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.producer.connection.send.assert_called_once()
+        self.assertNotIn("traceparent", self.producer.connection.send.call_args.kwargs["headers"])
+
+    def test_should_create_neither_save_nor_send_span_when_destination_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(PUBLISHER, format_publisher_destination(self.test_queue_name))
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        published = Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+        self.producer.send(published)
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.assertNotIn("traceparent", published.headers)
+        self.producer.connection.send.assert_called_once()
+
+    def test_should_not_create_save_span_when_publisher_side_is_disabled(self):
+        # Arrange
+        instrumentation_switch.disable(PUBLISHER)
+        self.addCleanup(instrumentation_switch.reset)
+
+        # Act
+        published_create = Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        self.assertNotIn("traceparent", published_create.headers)
+
+    def test_should_send_once_and_restore_context_when_send_fails(self):
+        # Arrange
+        previous_context = context.get_current()
+        self.producer.connection.send.side_effect = CustomFakeException("fake broker exception")
+
+        # Act
+        with self.assertRaises(CustomFakeException):
+            self.producer._send_with_retry(
+                body=json.dumps(self.fake_payload_body), destination=self.test_queue_name, headers={}
+            )
+
+        # Assert
+        self.producer.connection.send.assert_called_once()
+        self.assertIs(context.get_current(), previous_context)
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        self.assertEqual(publish_span.status.status_code, StatusCode.ERROR)
+
+    def test_should_restore_context_after_sending_a_saved_message(self):
+        # Arrange
+        previous_context = context.get_current()
+        headers = {"traceparent": f"00-{'1' * 32}-{'2' * 16}-01"}
+
+        # Act
+        self.producer._send_with_retry(
+            body=json.dumps(self.fake_payload_body), destination=self.test_queue_name, headers=headers
+        )
+
+        # Assert
+        self.assertIs(context.get_current(), previous_context)
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        self.assertEqual(format_trace_id(publish_span.context.trace_id), "1" * 32)
+
+    @patch(
+        "opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument.start_message_span",
+        side_effect=CustomFakeException("fake high level exception"),
+    )
+    def test_should_send_once_and_restore_context_when_span_creation_fails(self, mock_start_message_span):
+        # Arrange
+        previous_context = context.get_current()
+
+        # Act
+        with self.assertLogs(logger=publisher_logger, level="WARNING"):
+            self.send()
+
+        # Assert
+        self.producer.connection.send.assert_called_once()
+        self.assertIs(context.get_current(), previous_context)
+
+    def test_should_propagate_the_drop_decision_with_consistent_sampling(self):
+        # Arrange
+        headers = {"traceparent": f"00-{'1' * 32}-{'2' * 16}-00", "tracestate": "ot=th:8"}
+
+        # Act
+        with instrument_app_with(consistent_sampling=True):
+            self.producer._send_with_retry(
+                body=json.dumps(self.fake_payload_body), destination=self.test_queue_name, headers=headers
+            )
+
+        # Assert
+        self.assertEqual(len(self.get_finished_spans()), 0)
+        sent_headers = self.producer.connection.send.call_args.kwargs["headers"]
+        self.assertRegex(sent_headers["traceparent"], f"^00-{'1' * 32}-(?!{'2' * 16})[0-9a-f]{{16}}-00$")
+        self.assertEqual(sent_headers["tracestate"], "ot=th:8")
+
+    def test_should_not_inject_unsampled_context_by_default(self):
+        # Arrange
+        headers = {"traceparent": f"00-{'1' * 32}-{'2' * 16}-00", "tracestate": "ot=th:8"}
+
+        # Act
+        self.producer._send_with_retry(
+            body=json.dumps(self.fake_payload_body), destination=self.test_queue_name, headers=headers
+        )
+
+        # Assert
+        sent_headers = self.producer.connection.send.call_args.kwargs["headers"]
+        self.assertEqual(sent_headers["traceparent"], f"00-{'1' * 32}-{'2' * 16}-00")
+
+    def test_should_stamp_save_and_send_times_in_the_headers(self):
+        # Act
+        with instrument_app_with(track_pipeline_latency=True):
+            published = Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+            saved_time = published.headers[SAVED_TIME_HEADER]
+            published.save()
+            self.producer.send(published)
+
+        # Assert
+        self.assertEqual(published.headers[SAVED_TIME_HEADER], saved_time)
+        sent_headers = self.producer.connection.send.call_args.kwargs["headers"]
+        self.assertEqual(sent_headers[SAVED_TIME_HEADER], saved_time)
+        self.assertGreaterEqual(int(sent_headers[SENT_TIME_HEADER]), int(saved_time))
+
+    def test_should_name_send_and_save_spans_after_the_templated_destination(self):
+        # Act
+        with instrument_app_with(destination_templates=[(r"[0-9a-f]{8}-[0-9a-f-]{27}", "{uuid}")]):
+            Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+            self.send()
+
+        # Assert
+        span_names = [span.name for span in self.get_finished_spans()]
+        self.assertEqual(
+            span_names,
+            [
+                "save published /exchange/test-exchange/test-publisher-queue-{uuid}",
+                "send test-exchange:test-publisher-queue-{uuid}",
+            ],
+        )
+
+    def test_should_run_publisher_hook_in_background(self):
+        # Arrange
+        hook_calls = []
+
+        def hook(span, body, headers):
+            hook_calls.append((span.is_recording(), headers.get("traceparent"), time.time_ns()))
+            span.set_attribute("cache.hit", True)
+
+        # Act
+        with instrument_app_with(publisher_hook=hook, background_hooks={"publisher"}):
+            self.send()
+            instrumentor = DjangoOutboxPatternInstrumentor()
+            instrumentor._hook_executor.join()
+            stats = instrumentor.get_hook_stats()
+
+        # Assert
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        [(recording, traceparent, _)] = hook_calls
+        self.assertTrue(recording)
+        self.assertEqual(traceparent, get_traceparent_from_span(publish_span))
+        self.assertTrue(publish_span.attributes["cache.hit"])
+        self.assertEqual(stats["background"]["completed"], 1)
+        self.assertEqual(stats["background"]["dropped"], 0)
+        self.producer.connection.send.assert_called_once()
+
+    def test_should_time_publisher_hook_and_flag_calls_over_budget(self):
+        # Arrange
+        metric_reader = InMemoryMetricReader()
+        instrumentor = DjangoOutboxPatternInstrumentor()
+
+        # Act
+        with instrument_app_with(meter_provider=MeterProvider(metric_readers=[metric_reader]), hook_time_budget_ms=0):
+            instrumentor.reset_hook_stats()
+            self.send()
+            stats = instrumentor.get_hook_stats()
+
+        # Assert
+        publish_span = self.get_finished_spans().by_name(self.send_span_name)
+        self.assertIn("hook.slow", [event.name for event in publish_span.events])
+        [hook_stats] = stats["hooks"]
+        self.assertEqual(hook_stats["hook"], "publisher")
+        self.assertEqual(hook_stats["destination"], format_publisher_destination(self.test_queue_name))
+        self.assertEqual((hook_stats["count"], hook_stats["over_budget"]), (1, 1))
+        [metric] = [
+            metric
+            for resource_metrics in metric_reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+        ]
+        self.assertEqual(metric.name, HOOK_DURATION)
+        self.assertEqual(metric.data.data_points[0].count, 1)
+
+    def test_should_record_the_overhead_of_the_publisher_wrappers(self):
+        # Arrange
+        metric_reader = InMemoryMetricReader()
+
+        # Act
+        with instrument_app_with(
+            meter_provider=MeterProvider(metric_readers=[metric_reader]), measure_overhead_every=1
+        ):
+            published = Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+            self.producer.send(published)
+
+        # Assert
+        [metric] = [
+            metric
+            for resource_metrics in metric_reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+            if metric.name == INSTRUMENTATION_OVERHEAD
+        ]
+        counts = {point.attributes[WRAPPER_NAME]: point.count for point in metric.data.data_points}
+        self.assertEqual(counts, {"on_get_message_headers": 1, "on_send_message": 1})
+        self.producer.connection.send.assert_called_once()
+
+
+class TestPublisherBatchHook(PublisherInstrumentBase):
+    """Publishing cycles of Producer.publish_message_from_database with a fake broker connection"""
+
+    def setUp(self):
+        super().setUp()
+        self.producer = Producer(connection=MagicMock(), username="guest", passcode="guest")
+        self.send_span_name = f"send {format_publisher_destination(self.test_queue_name)}"
+        self.batches = []
+
+    def batch_hook(self, items):
+        self.batches.append([item.body["index"] for item in items])
+        for item in items:
+            item.span.set_attribute("batch.size", len(items))
+
+    @patch("django_outbox_pattern.producers.sleep")
+    def publish(self, mock_sleep, **options):
+        for index in range(5):
+            Published.objects.create(destination=self.test_queue_name, body={"index": index})
+        self.reset_trace()
+        with instrument_app_with(publisher_batch_hook=self.batch_hook, **options):
+            self.producer.publish_message_from_database()
+
+    def test_should_call_batch_hook_once_per_publishing_cycle(self):
+        # Act
+        self.publish()
+
+        # Assert
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4]])
+        send_spans = [span for span in self.get_finished_spans() if span.name == self.send_span_name]
+        self.assertEqual(len(send_spans), 5)
+        self.assertEqual({span.attributes["batch.size"] for span in send_spans}, {5})
+        self.assertEqual(self.producer.connection.send.call_count, 5)
+
+    def test_should_split_long_publishing_cycles(self):
+        # Act
+        self.publish(publisher_batch_size=2)
+
+        # Assert
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+
+    def test_should_end_send_spans_inline_outside_publishing_cycles(self):
+        # Act
+        with instrument_app_with(publisher_batch_hook=self.batch_hook):
+            self.producer.send_event(body={"index": 0}, destination=self.test_queue_name)
+
+        # Assert
+        self.assertEqual(self.batches, [])
+        self.get_finished_spans().by_name(self.send_span_name)
+
+
+class TestPublisherSaveSummary(PublisherInstrumentBase):
+    """Saves aggregated in one span per transaction or save_summary block"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_queue_name = f"{self.test_queue_name}-other"
+
+    def save_messages(self):
+        return [
+            Published.objects.create(destination=destination, body=self.fake_payload_body)
+            for destination in (self.test_queue_name, self.test_queue_name, self.other_queue_name)
+        ]
+
+    def test_should_create_one_save_span_per_committed_transaction(self):
+        # Act
+        with instrument_app_with(aggregate_saves=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    published = self.save_messages()
+                    self.assertEqual(self.get_finished_spans(), [])
+
+        # Assert
+        summary_span = self.get_finished_spans().by_name("save published")
+        self.assertEqual(summary_span.attributes[MESSAGING_BATCH_MESSAGE_COUNT], 3)
+        body_size = summary_span.attributes[SAVE_TOTAL_BODY_SIZE]
+        saved = {event.attributes[MESSAGING_DESTINATION_NAME]: event.attributes for event in summary_span.events}
+        self.assertEqual(set(saved), {self.test_queue_name, self.other_queue_name})
+        self.assertEqual(saved[self.test_queue_name][MESSAGING_BATCH_MESSAGE_COUNT], 2)
+        self.assertEqual(saved[self.other_queue_name][MESSAGING_BATCH_MESSAGE_COUNT], 1)
+        self.assertEqual(saved[self.test_queue_name][SAVE_TOTAL_BODY_SIZE] * 3, body_size * 2)
+        # Each message carries the context of the summary for its send span
+        for message in published:
+            self.assertEqual(message.headers["traceparent"], get_traceparent_from_span(summary_span))
+
+    def test_should_end_the_save_span_when_the_transaction_rolls_back(self):
+        # Act
+        with instrument_app_with(aggregate_saves=True):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(CustomFakeException):
+                with transaction.atomic():
+                    Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+                    raise CustomFakeException
+
+        # Assert
+        summary_span = self.get_finished_spans().by_name(f"save published {self.test_queue_name}")
+        self.assertEqual(summary_span.attributes[MESSAGING_BATCH_MESSAGE_COUNT], 1)
+        self.assertEqual(summary_span.attributes[MESSAGING_DESTINATION_NAME], self.test_queue_name)
+
+    def test_should_create_one_save_span_per_save_summary_block(self):
+        # Act
+        with instrument_app_with():
+            with save_summary():
+                published = self.save_messages()
+            Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+
+        # Assert
+        span_names = [span.name for span in self.get_finished_spans()]
+        self.assertEqual(span_names, ["save published", f"save published {self.test_queue_name}"])
+        summary_span = self.get_finished_spans()[0]
+        self.assertEqual(summary_span.attributes[MESSAGING_BATCH_MESSAGE_COUNT], 3)
+        self.assertEqual(published[2].headers["traceparent"], get_traceparent_from_span(summary_span))
+
+    @patch("django_outbox_pattern.producers.sleep")
+    def test_should_not_aggregate_the_saves_of_the_publishing_cycle(self, mock_sleep):
+        # Arrange
+        producer = Producer(connection=MagicMock(), username="guest", passcode="guest")
+        for _ in range(3):
+            Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+        self.reset_trace()
+
+        # Act
+        with instrument_app_with(aggregate_saves=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                producer.publish_message_from_database()
+
+        # Assert
+        save_spans = [span for span in self.get_finished_spans() if span.name.startswith("save published")]
+        self.assertEqual(len(save_spans), 3)
+        for span in save_spans:
+            self.assertNotIn(MESSAGING_BATCH_MESSAGE_COUNT, span.attributes)
+
+    def test_should_link_the_send_spans_to_the_save_span(self):
+        # Arrange
+        producer = Producer(connection=MagicMock(), username="guest", passcode="guest")
+
+        # Act
+        with instrument_app_with(aggregate_saves=True):
+            with save_summary():
+                published = self.save_messages()
+            for message in published:
+                producer.send(message)
+
+        # Assert
+        summary_span = self.get_finished_spans().by_name("save published")
+        send_spans = [span for span in self.get_finished_spans() if span.name.startswith("send ")]
+        self.assertEqual(len(send_spans), 3)
+        for span in send_spans:
+            self.assertEqual(span.parent.span_id, summary_span.context.span_id)
+
+
+class TestPublisherCommitDelay(PublisherInstrumentBase):
+    """Save spans ended by the commit or the rollback of their transaction"""
+
+    def setUp(self):
+        super().setUp()
+        self.metric_reader = InMemoryMetricReader()
+        self.save_span_name = f"save published {self.test_queue_name}"
+
+    def instrument(self, **options):
+        return instrument_app_with(
+            meter_provider=MeterProvider(metric_readers=[self.metric_reader]), track_commit_delay=True, **options
+        )
+
+    def get_data_points(self, name):
+        return [
+            point
+            for resource_metrics in self.metric_reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+            if metric.name == name
+            for point in metric.data.data_points
+        ]
+
+    def test_should_end_the_save_span_when_the_transaction_commits(self):
+        # Act
+        with self.instrument():
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+                self.assertEqual(self.get_finished_spans(), [])
+
+        # Assert
+        save_span = self.get_finished_spans().by_name(self.save_span_name)
+        self.assertEqual(save_span.attributes[TRANSACTION_OUTCOME], "committed")
+        [event] = save_span.events
+        self.assertEqual(event.name, "transaction.committed")
+        self.assertGreaterEqual(event.attributes[TRANSACTION_DELAY_MS], 0)
+        [point] = self.get_data_points(PUBLISHER_COMMIT_DELAY)
+        self.assertEqual(point.count, 1)
+        self.assertEqual(point.attributes, {MESSAGING_DESTINATION_NAME: self.test_queue_name})
+        self.assertEqual(self.get_data_points(PUBLISHER_ROLLED_BACK_MESSAGES), [])
+
+    def test_should_count_the_messages_of_a_rolled_back_transaction(self):
+        # Act
+        with self.instrument():
+            with self.assertRaises(CustomFakeException):
+                with transaction.atomic():
+                    Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+                    Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+                    raise CustomFakeException
+
+        # Assert
+        save_spans = [span for span in self.get_finished_spans() if span.name == self.save_span_name]
+        self.assertEqual(len(save_spans), 2)
+        for span in save_spans:
+            self.assertEqual(span.attributes[TRANSACTION_OUTCOME], "rolled_back")
+            self.assertEqual([event.name for event in span.events], ["transaction.rolled_back"])
+        [point] = self.get_data_points(PUBLISHER_ROLLED_BACK_MESSAGES)
+        self.assertEqual(point.value, 2)
+        self.assertEqual(point.attributes, {MESSAGING_DESTINATION_NAME: self.test_queue_name})
+        self.assertEqual(self.get_data_points(PUBLISHER_COMMIT_DELAY), [])
+
+    @patch("django_outbox_pattern.producers.sleep")
+    def test_should_not_track_the_saves_of_the_publishing_cycle(self, mock_sleep):
+        # Arrange
+        producer = Producer(connection=MagicMock(), username="guest", passcode="guest")
+        for _ in range(3):
+            Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+        self.reset_trace()
+
+        # Act
+        with self.instrument():
+            with self.captureOnCommitCallbacks(execute=True):
+                producer.publish_message_from_database()
+                # The status updates of the producer are not held until the cycle commits
+                save_spans = [span for span in self.get_finished_spans() if span.name == self.save_span_name]
+
+        # Assert
+        self.assertEqual(len(save_spans), 3)
+        for span in save_spans:
+            self.assertNotIn(TRANSACTION_OUTCOME, span.attributes)
+        self.assertEqual(self.get_data_points(PUBLISHER_COMMIT_DELAY), [])
+        self.assertEqual(producer.connection.send.call_count, 3)
+
+    def test_should_record_the_commit_delay_of_aggregated_saves(self):
+        # Act
+        with self.instrument(aggregate_saves=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for _ in range(3):
+                        Published.objects.create(destination=self.test_queue_name, body=self.fake_payload_body)
+
+        # Assert
+        save_span = self.get_finished_spans().by_name(self.save_span_name)
+        self.assertEqual(save_span.attributes[TRANSACTION_OUTCOME], "committed")
+        [point] = self.get_data_points(PUBLISHER_COMMIT_DELAY)
+        self.assertEqual(point.count, 3)
@@ -0,0 +1,117 @@
+import threading
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status
+from opentelemetry.trace import StatusCode
+
+from opentelemetry_instrumentation_django_outbox_pattern.processors import adaptive_batch
+from opentelemetry_instrumentation_django_outbox_pattern.processors.adaptive_batch import AdaptiveBatchSpanProcessor
+
+
+class BlockingExporter(InMemorySpanExporter):
+    """Holds the first export until released, so the next spans stay queued"""
+
+    def __init__(self):
+        super().__init__()
+        self.exporting = threading.Event()
+        self.release = threading.Event()
+
+    def export(self, spans):
+        self.exporting.set()
+        self.release.wait(timeout=5)
+        return super().export(spans)
+
+
+class AdaptiveBatchSpanProcessorTestCase(TestCase):
+    def make_processor(self, exporter, **options) -> AdaptiveBatchSpanProcessor:
+        processor = AdaptiveBatchSpanProcessor(exporter, **options)
+        self.addCleanup(processor.shutdown)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(processor)
+        self.tracer = tracer_provider.get_tracer(__name__)
+        return processor
+
+    def end_span(self, name, error=False):
+        span = self.tracer.start_span(name)
+        if error:
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
+    def test_batch_size_and_delay_follow_the_span_rate(self):
+        """Test that quiet periods wait longer for small batches and bursts export large batches quickly"""
+        processor = self.make_processor(
+            InMemorySpanExporter(), min_batch_size=10, max_batch_size=1000, max_schedule_delay_ms=1000
+        )
+
+        self.assertEqual((processor.batch_size, processor.schedule_delay), (10, 1.0))
+        processor._rate = 100
+        self.assertEqual((processor.batch_size, processor.schedule_delay), (100, 1.0))
+        processor._rate = 20_000
+        self.assertEqual((processor.batch_size, processor.schedule_delay), (1000, 0.1))
+
+    def test_rate_is_a_moving_average_of_the_arrivals(self):
+        processor = self.make_processor(InMemorySpanExporter(), rate_smoothing=0.5)
+        processor._arrived = 200
+        processor._rate = 100
+
+        with patch.object(adaptive_batch.time, "monotonic", return_value=processor._last_export + 1):
+            processor._update_rate()
+
+        self.assertEqual(processor._rate, 150)
+        self.assertEqual(processor._arrived, 0)
+
+    def test_export_in_batches_and_on_flush(self):
+        """Test that a full batch is exported by the worker and the rest by force_flush"""
+        exporter = InMemorySpanExporter()
+        processor = self.make_processor(exporter, min_batch_size=2, max_schedule_delay_ms=60_000)
+
+        for index in range(5):
+            self.end_span(f"process {index}")
+        self.assertTrue(processor.force_flush())
+
+        self.assertEqual(len(exporter.get_finished_spans()), 5)
+        self.assertEqual(processor.stats()["exported"], 5)
+        self.assertEqual(processor.stats()["queued"], 0)
+
+    def test_errored_and_nack_spans_replace_ack_spans_under_back_pressure(self):
+        """Test that a full queue keeps the important spans and counts the drops by category"""
+        exporter = BlockingExporter()
+        processor = self.make_processor(exporter, max_queue_size=2, min_batch_size=2, max_batch_size=2)
+        self.end_span("ack first")
+        self.end_span("ack second")
+        exporter.exporting.wait(timeout=5)
+
+        self.end_span("ack third")
+        self.end_span("ack fourth")
+        self.end_span("process failed", error=True)
+        self.end_span("nack topic", error=True)
+        self.end_span("nack other", error=True)
+        self.end_span("ack fifth")
+        self.end_span("process other")
+        exporter.release.set()
+        processor.force_flush()
+
+        exported = [span.name for span in exporter.get_finished_spans()]
+        self.assertEqual(exported, ["ack first", "ack second", "process failed", "nack topic"])
+        self.assertEqual(processor.stats()["dropped"], {"error": 0, "nack": 1, "other": 1, "ack": 3})
+
+    def test_export_exception_is_logged(self):
+        """Test that a failing exporter does not stop the processor"""
+        exporter = InMemorySpanExporter()
+        processor = self.make_processor(exporter)
+
+        self.end_span("process")
+        with patch.object(exporter, "export", side_effect=KeyError("fake exception")):
+            with self.assertLogs(logger=adaptive_batch._logger, level="WARNING") as log:
+                processor.force_flush()
+
+        self.assertIn("An exception occurred while exporting a batch of spans.", log.output[0])
+        self.assertEqual(processor.stats()["exported"], 0)
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            AdaptiveBatchSpanProcessor(InMemorySpanExporter(), min_batch_size=100, max_batch_size=10)
@@ -0,0 +1,156 @@
+import time
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+from opentelemetry.trace import Status
+from opentelemetry.trace import StatusCode
+from opentelemetry.trace import set_span_in_context
+
+from opentelemetry_instrumentation_django_outbox_pattern.processors import tail_sampling
+from opentelemetry_instrumentation_django_outbox_pattern.processors.tail_sampling import TailSamplingSpanProcessor
+
+DESTINATION = "topic:consumer.v1"
+
+
+class TailSamplingSpanProcessorTestCase(TestCase):
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        self.tracer_provider = None
+
+    def make_processor(self, **options) -> TailSamplingSpanProcessor:
+        processor = TailSamplingSpanProcessor(SimpleSpanProcessor(self.exporter), **options)
+        self.tracer_provider = TracerProvider()
+        self.tracer_provider.add_span_processor(processor)
+        self.addCleanup(processor.shutdown)
+        self.tracer = self.tracer_provider.get_tracer("opentelemetry_instrumentation_django_outbox_pattern")
+        return processor
+
+    def consume(self, operation="ack", duration_ns=1_000_000, error=False, start_time=1_000_000_000):
+        """One message trace: the process span with a child callback span and the ack or nack span"""
+        process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER, start_time=start_time)
+        context = set_span_in_context(process)
+        self.tracer.start_span("SELECT", context=context).end(end_time=start_time + 10)
+        acknowledge = self.tracer.start_span(f"{operation} {DESTINATION}", kind=SpanKind.CONSUMER, context=context)
+        acknowledge.end(end_time=start_time + 20)
+        if error:
+            process.set_status(Status(StatusCode.ERROR))
+        process.end(end_time=start_time + duration_ns)
+        return process
+
+    def exported_names(self):
+        return [span.name for span in self.exporter.get_finished_spans()]
+
+    def test_successful_fast_trace_is_dropped(self):
+        """Test that an acked message under the latency threshold is not exported"""
+        processor = self.make_processor()
+
+        self.consume()
+
+        self.assertEqual(self.exported_names(), [])
+        self.assertEqual(processor.stats()["dropped_traces"], 1)
+        self.assertEqual(processor.stats()["buffered_spans"], 0)
+
+    def test_nacked_errored_and_slow_traces_are_exported(self):
+        """Test that each keep condition exports the whole trace"""
+        processor = self.make_processor(latency_threshold_ms=100)
+
+        self.consume(operation="nack")
+        self.consume(error=True)
+        self.consume(duration_ns=200_000_000)
+
+        self.assertEqual(
+            self.exported_names(),
+            ["SELECT", f"nack {DESTINATION}", f"process {DESTINATION}"]
+            + ["SELECT", f"ack {DESTINATION}", f"process {DESTINATION}"] * 2,
+        )
+        self.assertEqual(processor.stats()["kept_traces"], 3)
+
+    def test_baseline_sample(self):
+        """Test that a baseline ratio of one keeps successful traces"""
+        self.make_processor(baseline_ratio=1.0)
+
+        self.consume()
+
+        self.assertEqual(len(self.exporter.get_finished_spans()), 3)
+
+    def test_spans_outside_consumer_traces_pass_through(self):
+        """Test that only traces with a process span are buffered"""
+        self.make_processor()
+
+        self.tracer.start_span("send topic:consumer.v1", kind=SpanKind.PRODUCER).end()
+
+        self.assertEqual(self.exported_names(), ["send topic:consumer.v1"])
+
+    def test_late_spans_follow_the_trace_decision(self):
+        """Test that a span ending after its process span is dropped with its trace"""
+        self.make_processor()
+        process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER)
+        late = self.tracer.start_span("late", context=set_span_in_context(process))
+
+        process.end()
+        late.end()
+
+        self.assertEqual(self.exported_names(), [])
+
+    def test_oldest_traces_are_evicted_when_the_buffer_is_full(self):
+        """Test that the buffer never holds more than max_buffered_spans"""
+        processor = self.make_processor(max_buffered_spans=2)
+        process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER)
+        for _ in range(3):
+            self.tracer.start_span("SELECT", context=set_span_in_context(process)).end()
+        process.set_status(Status(StatusCode.ERROR))
+        process.end()
+
+        self.assertEqual(self.exported_names(), [])
+        self.assertEqual(processor.stats()["evicted_traces"], 1)
+        self.assertEqual(processor.stats()["buffered_spans"], 0)
+
+    def test_traces_in_progress_past_the_max_age_are_exported(self):
+        """Test that an incomplete trace older than max_trace_age_s is exported as slow"""
+        processor = self.make_processor(max_trace_age_s=60)
+        with patch.object(tail_sampling.time, "monotonic_ns", return_value=0):
+            process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER)
+            self.tracer.start_span("SELECT", context=set_span_in_context(process)).end()
+        self.assertEqual(self.exported_names(), [])
+
+        with patch.object(tail_sampling.time, "monotonic_ns", return_value=61_000_000_000):
+            self.tracer.start_span("unrelated").end()
+        process.end()
+
+        self.assertEqual(self.exported_names(), ["unrelated", "SELECT", f"process {DESTINATION}"])
+        self.assertEqual(processor.stats()["expired_traces"], 1)
+
+    def test_traces_past_the_max_age_are_exported_on_force_flush(self):
+        """Test that an incomplete trace is exported by age even when no other span ends"""
+        processor = self.make_processor(max_trace_age_s=60)
+        with patch.object(tail_sampling.time, "monotonic_ns", return_value=0):
+            process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER)
+            self.tracer.start_span("SELECT", context=set_span_in_context(process)).end()
+
+        with patch.object(tail_sampling.time, "monotonic_ns", return_value=61_000_000_000):
+            processor.force_flush()
+
+        self.assertEqual(self.exported_names(), ["SELECT"])
+        self.assertEqual(processor.stats()["expired_traces"], 1)
+
+    def test_worker_exports_traces_past_the_max_age(self):
+        """Test that the worker expires traces on a quiet consumer"""
+        processor = self.make_processor(max_trace_age_s=0.05, expiry_interval_s=0.01)
+        process = self.tracer.start_span(f"process {DESTINATION}", kind=SpanKind.CONSUMER)
+        self.tracer.start_span("SELECT", context=set_span_in_context(process)).end()
+
+        deadline = time.monotonic() + 5
+        while not self.exported_names() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.exported_names(), ["SELECT"])
+        self.assertEqual(processor.stats()["expired_traces"], 1)
+
+    def test_invalid_baseline_ratio(self):
+        with self.assertRaises(ValueError):
+            TailSamplingSpanProcessor(SimpleSpanProcessor(self.exporter), baseline_ratio=2)
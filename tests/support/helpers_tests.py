@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.test import TransactionTestCase
 from opentelemetry import trace
 from opentelemetry.util._once import Once
 
@@ -6,8 +7,8 @@ from tests.support.otel_helpers import FinishedTestSpans
 from tests.support.otel_helpers import instrument_app
 
 
-class TestBase(TestCase):
-    """Base test class with setup and teardown for telemetry parameters"""
+class TelemetryTestMixin:
+    """Setup and teardown for telemetry parameters"""
 
     tracer_provider = None
     memory_exporter = None
@@ -36,3 +37,11 @@ class TestBase(TestCase):
         trace._TRACER_PROVIDER_SET_ONCE = Once()
         trace._TRACER_PROVIDER = None
         trace._PROXY_TRACER_PROVIDER = trace.ProxyTracerProvider()
+
+
+class TestBase(TelemetryTestMixin, TestCase):
+    """Base test class with setup and teardown for telemetry parameters"""
+
+
+class TransactionTestBase(TelemetryTestMixin, TransactionTestCase):
+    """Base test class for tests that commit, e.g. when another thread reads or writes the database"""
@@ -1,3 +1,5 @@
+import contextlib
+
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace import export
@@ -45,6 +47,38 @@ def instrument_app():
     return tracer_provider, memory_exporter
 
 
+@contextlib.contextmanager
+def instrument_app_with(**options):
+    """Re-instrument the app with extra instrument options while the context is active"""
+    tracer_provider, memory_exporter = instrument_app()
+    instrumentor = DjangoOutboxPatternInstrumentor()
+    instrumentor.uninstrument()
+    instrumentor.instrument(
+        **{
+            "tracer_provider": tracer_provider,
+            "publisher_hook": publisher_hook,
+            "consumer_hook": consumer_hook,
+            **options,
+        }
+    )
+    try:
+        yield tracer_provider, memory_exporter
+    finally:
+        restore_instrumentation()
+
+
+def restore_instrumentation():
+    """Re-instrument the app with the default options after a test changed or removed the wrappers"""
+    tracer_provider, _ = instrument_app()
+    instrumentor = DjangoOutboxPatternInstrumentor()
+    instrumentor.uninstrument()
+    instrumentor.instrument(
+        tracer_provider=tracer_provider,
+        publisher_hook=publisher_hook,
+        consumer_hook=consumer_hook,
+    )
+
+
 def get_traceparent_from_span(span):
     """Helper function to get traceparent for propagator, used to create header on publish message"""
     trace_id_formatted = format_trace_id(span.context.trace_id)
@@ -0,0 +1,205 @@
+import itertools
+import socket
+import socketserver
+import threading
+import typing
+
+from stomp.utils import parse_headers
+
+_NULL = b"\x00"
+_HEADER_ESCAPES = (("\\", "\\\\"), ("\r", "\\r"), ("\n", "\\n"), (":", "\\c"))
+
+
+def _escape_header(value: str) -> str:
+    for character, escaped in _HEADER_ESCAPES:
+        value = value.replace(character, escaped)
+    return value
+
+
+def encode_frame(command: str, headers: typing.Dict[str, str], body: bytes = b"") -> bytes:
+    lines = [command]
+    lines.extend(f"{_escape_header(str(key))}:{_escape_header(str(value))}" for key, value in headers.items())
+    return ("\n".join(lines) + "\n\n").encode() + body + _NULL
+
+
+class _Subscription(typing.NamedTuple):
+    session: "_StompSession"
+    subscription_id: str
+    destination: str
+
+
+class _StompSession(socketserver.BaseRequestHandler):
+    """One client connection, frames are read in this thread and messages may be written by any other session"""
+
+    server: "_StompServer"
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._write_lock = threading.Lock()
+        self._buffer = b""
+
+    def write(self, data: bytes) -> None:
+        with self._write_lock:
+            self.request.sendall(data)
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                frame = self._read_frame()
+                if frame is None:
+                    return
+                command, headers, body = frame
+                if not broker.handle_frame(self, command, headers, body):
+                    return
+        except OSError:
+            return
+        finally:
+            broker.remove_session(self)
+
+    def _read_frame(self) -> typing.Optional[typing.Tuple[str, typing.Dict[str, str], bytes]]:
+        while True:
+            self._buffer = self._buffer.lstrip(b"\r\n")
+            header_end = self._buffer.find(b"\n\n")
+            if header_end != -1:
+                preamble = self._buffer[:header_end].decode().replace("\r\n", "\n").split("\n")
+                headers = parse_headers(preamble, 1)
+                body_start = header_end + 2
+                if "content-length" in headers:
+                    body_end = body_start + int(headers["content-length"])
+                else:
+                    body_end = self._buffer.find(_NULL, body_start)
+                if body_end != -1 and len(self._buffer) > body_end:
+                    body = self._buffer[body_start:body_end]
+                    self._buffer = self._buffer[body_end + 1 :]
+                    return preamble[0], headers, body
+            chunk = self.request.recv(65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+
+
+class _StompServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, broker: "StompBrokerStub"):
+        self.broker = broker
+        super().__init__(address, _StompSession)
+
+
+class StompBrokerStub:
+    """
+    In-process STOMP 1.2 broker with just enough behavior for django-outbox-pattern producers and consumers.
+
+    Messages are routed by exact destination to every subscription, messages sent to a destination without
+    subscriptions are kept until one subscribes. Acknowledgements are only counted, there is no redelivery.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = _StompServer((host, port), self)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stomp-broker-stub", daemon=True)
+        self._lock = threading.Condition()
+        self._subscriptions: typing.Dict[str, typing.List[_Subscription]] = {}
+        self._pending: typing.Dict[str, typing.List[typing.Tuple[typing.Dict[str, str], bytes]]] = {}
+        self._message_ids = itertools.count(1)
+        self.sent = 0
+        self.delivered = 0
+        self.acked = 0
+        self.nacked = 0
+
+    @property
+    def host_and_port(self) -> typing.Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self) -> "StompBrokerStub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def wait_for_acknowledgements(self, count: int, timeout: float) -> bool:
+        """Wait until ``count`` messages were acked or nacked, the frames arrive after the client call returned"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self.acked + self.nacked >= count, timeout=timeout)
+
+    def handle_frame(self, session: _StompSession, command: str, headers: typing.Dict[str, str], body: bytes) -> bool:
+        """Handle one client frame, returns False when the session must be closed"""
+        if command in ("CONNECT", "STOMP"):
+            session.write(encode_frame("CONNECTED", {"version": "1.2", "heart-beat": "0,0", "server": "stub"}))
+        elif command == "SUBSCRIBE":
+            self._subscribe(_Subscription(session, headers["id"], headers["destination"]))
+        elif command == "UNSUBSCRIBE":
+            self._unsubscribe(session, headers["id"])
+        elif command == "SEND":
+            self._route(headers, body)
+        elif command == "ACK":
+            with self._lock:
+                self.acked += 1
+                self._lock.notify_all()
+        elif command == "NACK":
+            with self._lock:
+                self.nacked += 1
+                self._lock.notify_all()
+        if "receipt" in headers:
+            session.write(encode_frame("RECEIPT", {"receipt-id": headers["receipt"]}))
+        return command != "DISCONNECT"
+
+    def remove_session(self, session: _StompSession) -> None:
+        with self._lock:
+            for destination, subscriptions in self._subscriptions.items():
+                self._subscriptions[destination] = [item for item in subscriptions if item.session is not session]
+
+    def _subscribe(self, subscription: _Subscription) -> None:
+        with self._lock:
+            self._subscriptions.setdefault(subscription.destination, []).append(subscription)
+            pending = self._pending.pop(subscription.destination, [])
+        for headers, body in pending:
+            self._deliver(subscription, headers, body)
+
+    def _unsubscribe(self, session: _StompSession, subscription_id: str) -> None:
+        with self._lock:
+            for destination, subscriptions in self._subscriptions.items():
+                self._subscriptions[destination] = [
+                    item
+                    for item in subscriptions
+                    if item.session is not session or item.subscription_id != subscription_id
+                ]
+
+    def _route(self, headers: typing.Dict[str, str], body: bytes) -> None:
+        destination = headers["destination"]
+        with self._lock:
+            self.sent += 1
+            subscriptions = list(self._subscriptions.get(destination, ()))
+            if not subscriptions:
+                self._pending.setdefault(destination, []).append((headers, body))
+        for subscription in subscriptions:
+            self._deliver(subscription, headers, body)
+
+    def _deliver(self, subscription: _Subscription, headers: typing.Dict[str, str], body: bytes) -> None:
+        message_id = f"stub-{next(self._message_ids)}"
+        message_headers = {key: value for key, value in headers.items() if key not in ("receipt", "content-length")}
+        message_headers.update(
+            {
+                "subscription": subscription.subscription_id,
+                "message-id": message_id,
+                "ack": message_id,
+                "destination": subscription.destination,
+                "content-length": str(len(body)),
+            }
+        )
+        try:
+            subscription.session.write(encode_frame("MESSAGE", message_headers, body))
+        except OSError:
+            return
+        with self._lock:
+            self.delivered += 1
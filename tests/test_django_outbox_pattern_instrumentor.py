@@ -1,12 +1,19 @@
+import subprocess  # noqa: S404
+import sys
+
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 from django.test import TestCase
 from django.test import override_settings
+from django_outbox_pattern.consumers import Consumer
+from django_outbox_pattern.producers import Producer
 
 from opentelemetry_instrumentation_django_outbox_pattern import DjangoOutboxPatternInstrumentor
 from opentelemetry_instrumentation_django_outbox_pattern.instrumentors.consumer_instrument import ConsumerInstrument
 from opentelemetry_instrumentation_django_outbox_pattern.instrumentors.publisher_instrument import PublisherInstrument
+from tests.support.otel_helpers import instrument_app_with
+from tests.support.otel_helpers import restore_instrumentation
 
 
 class TestDjangoOutboxPatternInstrumentor(TestCase):
@@ -33,10 +40,67 @@ class TestDjangoOutboxPatternInstrumentor(TestCase):
         # Arrange
         instrumentor = DjangoOutboxPatternInstrumentor()
         tracer_provider = MagicMock()
+        self.addCleanup(restore_instrumentation)
 
         # Act & Assert
         instrumentor.instrument(tracer_provider=tracer_provider)
-        self.assertIsNotNone(getattr(instrumentor, "__opentelemetry_tracer_provider", None))
+        self.assertIsNotNone(instrumentor._tracer_provider)
 
         instrumentor._uninstrument(tracer_provider=tracer_provider)
-        self.assertIsNone(getattr(instrumentor, "__opentelemetry_tracer_provider", None))
+        self.assertIsNone(instrumentor._tracer_provider)
+
+    def test_import_does_not_load_instrumented_modules(self):
+        """
+        Test that importing the package defers the consumer, producer, stomp, messaging semantic conventions and
+        database imports until instrument. ``BaseInstrumentor`` itself loads the ``opentelemetry.semconv`` package.
+        """
+        code = (
+            "import sys; import opentelemetry_instrumentation_django_outbox_pattern; "
+            "print([m for m in ('django_outbox_pattern.consumers', 'django_outbox_pattern.producers', 'stomp', "
+            "'opentelemetry.sdk.trace', 'opentelemetry.semconv.trace', "
+            "'opentelemetry.semconv._incubating.attributes.messaging_attributes', 'django.db') "
+            "if m in sys.modules])"
+        )
+
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)  # noqa: S603
+
+        self.assertEqual(output.stdout.strip(), "[]")
+
+    def test_instrument_only_publisher_side(self):
+        """Test that the consumer functions are not wrapped when instrument_consumer is False"""
+        with instrument_app_with(instrument_consumer=False):
+            self.assertFalse(hasattr(Consumer.message_handler, "__wrapped__"))
+            self.assertTrue(hasattr(Producer._send_with_retry, "__wrapped__"))
+
+        self.assertTrue(hasattr(Consumer.message_handler, "__wrapped__"))
+
+    def test_instrument_only_consumer_side(self):
+        """Test that the publisher functions are not wrapped when instrument_publisher is False"""
+        with instrument_app_with(instrument_publisher=False):
+            self.assertTrue(hasattr(Consumer.message_handler, "__wrapped__"))
+            self.assertFalse(hasattr(Producer._send_with_retry, "__wrapped__"))
+
+        self.assertTrue(hasattr(Producer._send_with_retry, "__wrapped__"))
+
+    def test_runtime_tracing_toggle(self):
+        """Test that the instrumentor exposes the runtime switch per side and destination"""
+        instrumentor = DjangoOutboxPatternInstrumentor()
+        self.addCleanup(instrumentor.enable_tracing, "consumer")
+
+        instrumentor.disable_tracing("consumer", "exchange:routing-key")
+        self.assertFalse(instrumentor.is_tracing_enabled("consumer", "exchange:routing-key"))
+        self.assertTrue(instrumentor.is_tracing_enabled("consumer", "exchange:other"))
+
+        instrumentor.enable_tracing("consumer")
+        self.assertTrue(instrumentor.is_tracing_enabled("consumer", "exchange:routing-key"))
+
+    def test_invalid_background_hooks_side(self):
+        """Test that an unknown side in background_hooks is rejected before wrapping anything"""
+        instrumentor = DjangoOutboxPatternInstrumentor()
+
+        with self.assertRaises(ValueError):
+            instrumentor._instrument(tracer_provider=MagicMock(), background_hooks={"producer"})
+
+    def test_get_hook_stats_without_background_hooks(self):
+        """Test that the background stats are empty when every hook runs inline"""
+        self.assertIsNone(DjangoOutboxPatternInstrumentor().get_hook_stats()["background"])
@@ -0,0 +1,45 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.acknowledgements import ACK
+from opentelemetry_instrumentation_django_outbox_pattern.utils.acknowledgements import NACK
+from opentelemetry_instrumentation_django_outbox_pattern.utils.acknowledgements import AcknowledgementTracker
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import LISTENER_NAME
+
+ATTRIBUTES = {MESSAGING_DESTINATION_NAME: "topic:consumer.v1", LISTENER_NAME: "consumer-listener-1"}
+
+
+class AcknowledgementTrackerTestCase(TestCase):
+    def setUp(self):
+        self.ack_histogram = MagicMock()
+        self.nack_histogram = MagicMock()
+        self.unacked_counter = MagicMock()
+        self.tracker = AcknowledgementTracker(self.ack_histogram, self.nack_histogram, self.unacked_counter)
+
+    def unacked(self):
+        return sum(call.args[0] for call in self.unacked_counter.add.call_args_list)
+
+    def test_first_acknowledgement_is_recorded(self):
+        """Test that an ack followed by a nack of the same message only records the ack"""
+        token = self.tracker.received("topic:consumer.v1", "consumer-listener-1")
+        self.assertEqual(self.unacked(), 1)
+
+        self.tracker.acknowledged(ACK)
+        self.tracker.acknowledged(NACK)
+        self.tracker.finished(token)
+
+        self.ack_histogram.record.assert_called_once()
+        self.assertEqual(self.ack_histogram.record.call_args.args[1], ATTRIBUTES)
+        self.nack_histogram.record.assert_not_called()
+        self.assertEqual(self.unacked(), 0)
+
+    def test_message_without_acknowledgement_stops_being_counted_when_the_handler_returns(self):
+        token = self.tracker.received("topic:consumer.v1", "consumer-listener-1")
+
+        self.tracker.finished(token)
+        self.tracker.acknowledged(NACK)
+
+        self.nack_histogram.record.assert_not_called()
+        self.assertEqual(self.unacked(), 0)
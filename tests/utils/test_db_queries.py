@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from django_outbox_pattern.models import Published
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_N_PLUS_ONE
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_QUERY_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_QUERY_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_TOP_STATEMENT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import DB_TOP_STATEMENT_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.db_queries import QueryTracker
+from opentelemetry_instrumentation_django_outbox_pattern.utils.db_queries import normalize_sql
+from opentelemetry_instrumentation_django_outbox_pattern.utils.db_queries import record_queries
+from opentelemetry_instrumentation_django_outbox_pattern.utils.db_queries import track_queries
+
+
+class DbQueriesTestCase(TestCase):
+    def test_normalize_sql_collapses_literals_and_in_lists(self):
+        """Test that normalize_sql groups statements that only differ by their parameters"""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t1 WHERE id IN (%s, %s,  %s) AND name = 'x' AND  age > 10"),
+            "SELECT * FROM t1 WHERE id IN (?) AND name = ? AND age > ?",
+        )
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t1 WHERE id IN (%s)"), normalize_sql("SELECT * FROM t1 WHERE id IN (%s, %s)")
+        )
+
+    def test_query_tracker_counts_executions(self):
+        """Test that the tracker counts queries and returns the most frequent normalized statement"""
+        tracker = QueryTracker()
+        execute = MagicMock(return_value="result")
+
+        result = tracker(execute, "SELECT 1 FROM t WHERE id = %s", (1,), False, {})
+        tracker(execute, "SELECT 1 FROM t WHERE id = %s", (2,), False, {})
+        tracker(execute, "UPDATE t SET a = %s", (3,), False, {})
+
+        self.assertEqual(result, "result")
+        self.assertEqual(tracker.count, 3)
+        self.assertEqual(tracker.most_frequent_statement(), ("SELECT ? FROM t WHERE id = ?", 2))
+
+    def test_query_tracker_counts_failed_executions(self):
+        """Test that a query raising an exception is still accounted"""
+        tracker = QueryTracker()
+        execute = MagicMock(side_effect=ValueError("boom"))
+
+        with self.assertRaises(ValueError):
+            tracker(execute, "SELECT 1", None, False, {})
+
+        self.assertEqual(tracker.count, 1)
+
+    def test_record_queries_without_queries(self):
+        """Test that only the counters are set when no query was executed"""
+        span = MagicMock()
+
+        record_queries(span, QueryTracker(), repeat_threshold=2)
+
+        span.set_attributes.assert_called_once_with({DB_QUERY_COUNT: 0, DB_QUERY_DURATION_MS: 0.0})
+        span.add_event.assert_not_called()
+
+    def test_track_queries_flags_n_plus_one(self):
+        """Test that track_queries records the queries of the block and flags repeated statements"""
+        span = MagicMock()
+
+        with track_queries(span, repeat_threshold=3):
+            for destination in ("a", "b", "c"):
+                Published.objects.filter(destination=destination).exists()
+
+        attributes = span.set_attributes.call_args[0][0]
+        self.assertEqual(attributes[DB_QUERY_COUNT], 3)
+        self.assertEqual(attributes[DB_TOP_STATEMENT_COUNT], 3)
+        self.assertIn('FROM "published"', attributes[DB_TOP_STATEMENT])
+        self.assertTrue(attributes[DB_N_PLUS_ONE])
+        span.add_event.assert_called_once()
+        self.assertEqual(span.add_event.call_args[0][0], "db.n_plus_one")
+
+    def test_track_queries_does_not_flag_below_threshold(self):
+        """Test that statements repeated fewer times than the threshold are not flagged"""
+        span = MagicMock()
+
+        with track_queries(span, repeat_threshold=3):
+            Published.objects.filter(destination="a").exists()
+
+        attributes = span.set_attributes.call_args[0][0]
+        self.assertEqual(attributes[DB_QUERY_COUNT], 1)
+        self.assertNotIn(DB_N_PLUS_ONE, attributes)
+        span.add_event.assert_not_called()
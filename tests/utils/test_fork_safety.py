@@ -0,0 +1,115 @@
+import os
+import threading
+import unittest
+
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils import fork_safety
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import WORKER_ID
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import BackgroundHookExecutor
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import get_host_attributes
+from opentelemetry_instrumentation_django_outbox_pattern.utils.watchdog import HandlerWatchdog
+
+
+class _Resettable:
+    def __init__(self):
+        self.resets = 0
+        fork_safety.register_after_fork(self.reset)
+
+    def reset(self):
+        self.resets += 1
+
+
+class ForkSafetyTestCase(TestCase):
+    def setUp(self):
+        # Run the registry in isolation, the objects of the other tests must not be reset
+        for name, value in [("_callbacks", []), ("_worker_id", None), ("_forks", 3), ("_lock", threading.Lock())]:
+            patcher = patch.object(fork_safety, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_callbacks_run_in_the_child_and_dead_instances_are_forgotten(self):
+        """Test that bound methods do not keep their instances alive"""
+        callback = MagicMock()
+        fork_safety.register_after_fork(callback)
+        alive = _Resettable()
+        _Resettable()
+
+        fork_safety._after_fork_in_child()
+
+        callback.assert_called_once_with()
+        self.assertEqual(alive.resets, 1)
+        self.assertEqual(len(fork_safety._callbacks), 2)
+        self.assertEqual(fork_safety.worker_id(), f"{os.getppid()}.3")
+
+    def test_failing_callback_is_logged(self):
+        """Test that one failing reset does not prevent the next ones"""
+        callback = MagicMock()
+        fork_safety.register_after_fork(MagicMock(side_effect=KeyError("fake exception")))
+        fork_safety.register_after_fork(callback)
+
+        with self.assertLogs(logger=fork_safety._logger, level="WARNING") as log:
+            fork_safety._after_fork_in_child()
+
+        callback.assert_called_once_with()
+        self.assertIn("An exception occurred while resetting the state after a fork.", log.output[0])
+
+    def test_background_executor_starts_a_new_worker(self):
+        """Test that the executor of a child does not wait on the thread of its parent"""
+        executor = BackgroundHookExecutor()
+        self.addCleanup(executor.shutdown)
+        executor.submit(MagicMock())
+        executor.join()
+        called = threading.Event()
+
+        executor._reset_after_fork()
+        executor.submit(called.set)
+
+        self.assertTrue(called.wait(timeout=5))
+        self.assertEqual(executor.stats()["completed"], 1)
+
+    def test_watchdog_forgets_the_handlers_of_the_parent(self):
+        """Test that the handlers in progress in the parent are not reported by the child"""
+        watchdog = HandlerWatchdog(deadline_s=0, scan_interval_s=60)
+        self.addCleanup(watchdog.shutdown)
+        watchdog.track(MagicMock(), "exchange:routing-key")
+
+        watchdog._reset_after_fork()
+
+        self.assertEqual(watchdog.in_flight(), 0)
+        self.assertEqual(watchdog.scan(), 0)
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+class ForkedWorkerTestCase(TestCase):
+    def test_forked_worker_gets_an_identity_and_working_executors(self):
+        """Test in a real child process that the spans are tagged with the worker and the background hooks run"""
+        executor = BackgroundHookExecutor()
+        self.addCleanup(executor.shutdown)
+        executor.submit(MagicMock())
+        executor.join()
+        self.assertNotIn(WORKER_ID, get_host_attributes())
+        read_end, write_end = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            result = b"failed"
+            try:
+                called = threading.Event()
+                executor.submit(called.set)
+                if called.wait(timeout=5) and get_host_attributes()[WORKER_ID] == fork_safety.worker_id():
+                    result = fork_safety.worker_id().encode()
+            finally:
+                os.write(write_end, result)
+                os._exit(0)
+
+        os.close(write_end)
+        result = os.read(read_end, 1024).decode()
+        os.close(read_end)
+        os.waitpid(pid, 0)
+
+        self.assertRegex(result, rf"^{os.getpid()}\.\d+$")
+        self.assertIsNone(fork_safety.worker_id())
@@ -1,5 +1,8 @@
 from django.test import TestCase
 
+from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import OVERFLOW_DESTINATION
+from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import DestinationTemplater
+from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import _logger as formatters_logger
 from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import format_consumer_destination
 from opentelemetry_instrumentation_django_outbox_pattern.utils.formatters import format_publisher_destination
 
@@ -45,3 +48,39 @@ class FormattersTestCase(TestCase):
         destination = "/exchange/test-exchange/test-routing-key"
         result = format_publisher_destination(destination)
         self.assertEqual(result, "test-exchange:test-routing-key")
+
+
+class DestinationTemplaterTestCase(TestCase):
+    def test_rules_are_applied_in_order(self):
+        """Test that the id segments of the routing key are collapsed"""
+        templater = DestinationTemplater([(r"\.\d+\.", ".{id}."), (r"\.v\d+$", "")])
+
+        self.assertEqual(templater("orders:order.123.created.v2"), "orders:order.{id}.created")
+        self.assertEqual(templater("orders:order.456.created.v2"), "orders:order.{id}.created")
+        self.assertEqual(templater("orders:order.created"), "orders:order.created")
+
+    def test_result_is_memoized_per_raw_destination(self):
+        """Test that the rules run once per raw destination and the cache is bounded"""
+        templater = DestinationTemplater([(r"\d+", "{id}")], cache_size=2)
+
+        for destination in ["a:1", "a:1", "a:2", "a:3"]:
+            templater(destination)
+
+        self.assertEqual(list(templater._cache), ["a:2", "a:3"])
+        self.assertEqual(templater.stats(), {"names": 1, "cached": 2, "overflowed": 0})
+
+    def test_names_past_the_cap_fall_back_to_the_overflow_name(self):
+        """Test that new names over max_names are bucketed and already seen names are kept"""
+        templater = DestinationTemplater(max_names=2)
+
+        with self.assertLogs(logger=formatters_logger, level="WARNING") as log:
+            names = [templater(destination) for destination in ["a:1", "a:2", "a:3", "a:1", "a:4"]]
+
+        self.assertEqual(names, ["a:1", "a:2", OVERFLOW_DESTINATION, "a:1", OVERFLOW_DESTINATION])
+        self.assertEqual(templater.stats()["overflowed"], 2)
+        self.assertEqual(len(log.output), 1)
+
+    def test_invalid_max_names(self):
+        """Test that a cap below one name is rejected"""
+        with self.assertRaises(ValueError):
+            DestinationTemplater(max_names=0)
@@ -0,0 +1,315 @@
+import logging
+import threading
+
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+from opentelemetry.trace import NonRecordingSpan
+from opentelemetry.trace import SpanContext
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HOOK_BUDGET_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HOOK_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HOOK_NAME
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import DROP_OLDEST
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import BackgroundHookExecutor
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import HookRunner
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import HookStats
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import HookTimer
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import SpanBatch
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import _logger as hooks_logger
+from opentelemetry_instrumentation_django_outbox_pattern.utils.hooks import end_span
+
+_logger = logging.getLogger(__name__)
+
+
+class BackgroundHookExecutorTestCase(TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def blocking_call(self, value):
+        self.started.set()
+        self.release.wait(timeout=5)
+        self.calls.append(value)
+
+    def fill(self, executor, values):
+        """Block the worker with the first value so the next ones stay queued"""
+        executor.submit(self.blocking_call, values[0])
+        self.started.wait(timeout=5)
+        return [executor.submit(self.calls.append, value) for value in values[1:]]
+
+    def test_drop_new_discards_the_submitted_call_when_full(self):
+        """Test that drop_new keeps the queued calls and counts the rejected one"""
+        executor = BackgroundHookExecutor(max_queue_size=2)
+        self.addCleanup(executor.shutdown)
+
+        accepted = self.fill(executor, ["running", "first", "second", "third"])
+        self.release.set()
+        executor.join()
+
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(self.calls, ["running", "first", "second"])
+        self.assertEqual(executor.stats()["dropped"], 1)
+        self.assertEqual(executor.stats()["completed"], 3)
+
+    def test_drop_oldest_discards_the_oldest_queued_call_when_full(self):
+        """Test that drop_oldest makes room for the submitted call"""
+        executor = BackgroundHookExecutor(max_queue_size=2, drop_policy=DROP_OLDEST)
+        self.addCleanup(executor.shutdown)
+
+        accepted = self.fill(executor, ["running", "first", "second", "third"])
+        self.release.set()
+        executor.join()
+
+        self.assertEqual(accepted, [True, True, True])
+        self.assertEqual(self.calls, ["running", "second", "third"])
+        self.assertEqual(executor.stats()["dropped"], 1)
+
+    def test_failed_call_is_logged_and_counted(self):
+        """Test that an exception in a background call does not stop the worker"""
+        executor = BackgroundHookExecutor()
+        self.addCleanup(executor.shutdown)
+
+        with self.assertLogs(logger=hooks_logger, level="WARNING") as log:
+            executor.submit(MagicMock(side_effect=KeyError("fake exception")))
+            executor.submit(self.calls.append, "after failure")
+            executor.join()
+
+        self.assertEqual(self.calls, ["after failure"])
+        self.assertEqual(executor.stats()["failed"], 1)
+        self.assertIn("An exception occurred in the callback hook.", log.output[0])
+
+    def test_shutdown_runs_queued_calls_and_stops_the_worker(self):
+        """Test that shutdown drains the queue before the worker thread exits"""
+        executor = BackgroundHookExecutor()
+        executor.submit(self.calls.append, "queued")
+
+        executor.shutdown(timeout=5)
+
+        self.assertEqual(self.calls, ["queued"])
+        self.assertIsNone(executor._thread)
+
+    def test_shutdown_is_not_dropped_by_a_full_queue(self):
+        """Test that drop_oldest cannot discard the stop request, only the queued calls and their on_drop callback"""
+        executor = BackgroundHookExecutor(max_queue_size=1, drop_policy=DROP_OLDEST)
+        self.addCleanup(executor.shutdown, timeout=5)
+        on_drop = MagicMock()
+        executor.submit(self.blocking_call, "running")
+        self.started.wait(timeout=5)
+        executor.submit(self.calls.append, "first", on_drop=on_drop)
+        worker = executor._thread
+        executor.shutdown(timeout=0)
+
+        executor.submit(self.calls.append, "second")
+        self.release.set()
+        worker.join(timeout=5)
+        executor.join()
+
+        on_drop.assert_called_once_with()
+        self.assertFalse(worker.is_alive())
+        self.assertCountEqual(self.calls, ["running", "second"])
+
+    def test_invalid_drop_policy(self):
+        """Test that an unknown drop policy is rejected"""
+        with self.assertRaises(ValueError):
+            BackgroundHookExecutor(drop_policy="block")
+
+
+class HookRunnerTestCase(TestCase):
+    def setUp(self):
+        self.span = NonRecordingSpan(SpanContext(trace_id=1, span_id=2, is_remote=False))
+
+    def test_inline_hook_exception_is_logged(self):
+        """Test that an inline hook exception is logged on the instrument logger and not raised"""
+        run_hook = HookRunner(MagicMock(side_effect=KeyError("fake exception")), _logger)
+
+        with self.assertLogs(logger=_logger, level="WARNING") as log:
+            run_hook(self.span, {}, {}, "exchange:routing-key")
+
+        self.assertIn("An exception occurred in the callback hook.", log.output[0])
+
+    def test_background_hook_gets_a_read_only_snapshot(self):
+        """Test that a background hook sees the values at submit time and cannot change them"""
+        executor = BackgroundHookExecutor()
+        self.addCleanup(executor.shutdown)
+        received = []
+
+        def hook(span, body, headers):
+            received.append((span.get_span_context(), dict(body), dict(headers)))
+            headers["traceparent"] = "changed"
+
+        headers = {"traceparent": "original"}
+        run_hook = HookRunner(hook, _logger, executor)
+
+        with self.assertLogs(logger=hooks_logger, level="WARNING"):
+            run_hook(self.span, {"key": "value"}, headers, "exchange:routing-key")
+            headers["x-after-submit"] = "value"
+            executor.join()
+
+        self.assertEqual(received, [(self.span.get_span_context(), {"key": "value"}, {"traceparent": "original"})])
+        self.assertEqual(headers["traceparent"], "original")
+        self.assertEqual(executor.stats()["failed"], 1)
+
+    def test_background_hook_holds_the_span_until_it_ran(self):
+        """Test that a background hook can enrich the span and the span keeps the end time of the wrapper"""
+        executor = BackgroundHookExecutor()
+        self.addCleanup(executor.shutdown)
+        release = threading.Event()
+        span = MagicMock()
+        span.is_recording.return_value = True
+
+        def hook(span, body, headers):
+            release.wait(timeout=5)
+            span.set_attribute("cache.hit", True)
+
+        HookRunner(hook, _logger, executor)(span, {}, {}, "exchange:routing-key")
+        end_span(span, end_time=10)
+        span.end.assert_not_called()
+        release.set()
+        executor.join()
+
+        span.set_attribute.assert_called_once_with("cache.hit", True)
+        span.end.assert_called_once_with(end_time=10)
+
+    def test_dropped_background_call_releases_the_span(self):
+        """Test that a span whose hook call was dropped is ended by the wrapper"""
+        executor = BackgroundHookExecutor(max_queue_size=1)
+        self.addCleanup(executor.shutdown)
+        release = threading.Event()
+        started = threading.Event()
+        executor.submit(lambda: started.set() or release.wait(timeout=5))
+        started.wait(timeout=5)
+        executor.submit(MagicMock())
+        span = MagicMock()
+        span.is_recording.return_value = True
+
+        HookRunner(MagicMock(), _logger, executor)(span, {}, {}, "exchange:routing-key")
+        end_span(span)
+        release.set()
+
+        span.end.assert_called_once_with(end_time=None)
+        self.assertEqual(executor.stats()["dropped"], 1)
+
+    def test_runner_without_hook_is_false(self):
+        """Test that the wrappers can skip the runner when no hook was registered"""
+        self.assertFalse(HookRunner(None, _logger))
+        self.assertTrue(HookRunner(MagicMock(), _logger))
+
+    def test_hook_calls_are_timed_by_hook_and_destination(self):
+        """Test that inline calls, failed or not, are recorded in the stats and the histogram"""
+        stats = HookStats()
+        histogram = MagicMock()
+        run_hook = HookRunner(MagicMock(), _logger, timer=HookTimer("consumer", stats, histogram))
+
+        run_hook(self.span, {}, {}, "exchange:routing-key")
+        run_hook.hook.side_effect = KeyError("fake exception")
+        with self.assertLogs(logger=_logger, level="WARNING"):
+            run_hook(self.span, {}, {}, "exchange:routing-key")
+
+        [hook_stats] = stats.snapshot()
+        self.assertEqual(hook_stats["hook"], "consumer")
+        self.assertEqual(hook_stats["destination"], "exchange:routing-key")
+        self.assertEqual(hook_stats["count"], 2)
+        self.assertEqual(hook_stats["over_budget"], 0)
+        self.assertEqual(histogram.record.call_count, 2)
+        self.assertEqual(
+            histogram.record.call_args[0][1],
+            {HOOK_NAME: "consumer", MESSAGING_DESTINATION_NAME: "exchange:routing-key"},
+        )
+
+
+class HookTimerTestCase(TestCase):
+    def test_call_over_budget_adds_span_event_and_rate_limited_log(self):
+        """Test that slow calls are flagged on the span every time and logged once per interval"""
+        span = MagicMock()
+        stats = HookStats()
+        timer = HookTimer("publisher", stats, budget_ms=1, log_interval=60)
+
+        with self.assertLogs(logger=hooks_logger, level="WARNING") as log:
+            for _ in range(3):
+                timer.record(span, "exchange:routing-key", duration_ns=5_000_000)
+            timer.record(span, "exchange:other", duration_ns=5_000_000)
+            timer.record(span, "exchange:other", duration_ns=500_000)
+
+        self.assertEqual(span.add_event.call_count, 4)
+        event_name, event_attributes = span.add_event.call_args[0]
+        self.assertEqual(event_name, "hook.slow")
+        self.assertEqual(event_attributes[HOOK_DURATION_MS], 5)
+        self.assertEqual(event_attributes[HOOK_BUDGET_MS], 1)
+        self.assertEqual(len(log.output), 2)
+        self.assertEqual([item["over_budget"] for item in stats.snapshot()], [1, 3])
+
+    def test_suppressed_slow_calls_are_counted_in_the_next_log(self):
+        """Test that the next log line after the interval reports how many slow calls were not logged"""
+        timer = HookTimer("publisher", HookStats(), budget_ms=1, log_interval=0)
+        timer._suppressed["exchange:routing-key"] = 7
+
+        with self.assertLogs(logger=hooks_logger, level="WARNING") as log:
+            timer.record(MagicMock(), "exchange:routing-key", duration_ns=5_000_000)
+
+        self.assertIn("7 slow calls not logged", log.output[0])
+
+    def test_slow_calls_from_concurrent_threads_are_all_counted(self):
+        """Test that the calls of the consumer threads and the background executor share the counters safely"""
+        timer = HookTimer("consumer", HookStats(), budget_ms=1, log_interval=60)
+        span = NonRecordingSpan(SpanContext(trace_id=1, span_id=2, is_remote=False))
+
+        def record_slow_calls():
+            for _ in range(500):
+                timer.record(span, "exchange:routing-key", duration_ns=5_000_000)
+
+        with self.assertLogs(logger=hooks_logger, level="WARNING") as log:
+            threads = [threading.Thread(target=record_slow_calls) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            timer.log_interval_ns = 0
+            timer.record(span, "exchange:routing-key", duration_ns=5_000_000)
+
+        self.assertEqual(len(log.output), 2)
+        self.assertIn("3999 slow calls not logged", log.output[1])
+
+
+class SpanBatchTestCase(TestCase):
+    def test_flush_calls_the_hook_once_and_ends_the_spans_with_their_end_time(self):
+        """Test that the batch hook sees every item while the spans are still open"""
+        spans = [MagicMock(), MagicMock()]
+        hook = MagicMock(side_effect=lambda items: [span.end.assert_not_called() for span in spans])
+        span_batch = SpanBatch(hook, _logger)
+
+        span_batch.add(spans[0], {"index": 0}, {"traceparent": "first"})
+        span_batch.add(spans[1], {"index": 1}, {"traceparent": "second"})
+        span_batch.flush()
+        span_batch.flush()
+
+        hook.assert_called_once()
+        items = hook.call_args[0][0]
+        self.assertEqual([item.body for item in items], [{"index": 0}, {"index": 1}])
+        for span, item in zip(spans, items):
+            span.end.assert_called_once_with(end_time=item.end_time)
+
+    def test_flush_when_the_batch_is_full(self):
+        """Test that a long publishing cycle is handed to the hook every max_size items"""
+        hook = MagicMock()
+        span_batch = SpanBatch(hook, _logger, max_size=2)
+
+        for index in range(5):
+            span_batch.add(MagicMock(), {"index": index}, {})
+
+        self.assertEqual([len(call.args[0]) for call in hook.call_args_list], [2, 2])
+        self.assertEqual(len(span_batch.items), 1)
+
+    def test_hook_exception_is_logged_and_spans_are_ended(self):
+        """Test that a failing batch hook does not leave the spans open"""
+        span = MagicMock()
+        span_batch = SpanBatch(MagicMock(side_effect=KeyError("fake exception")), _logger)
+        span_batch.add(span, {}, {})
+
+        with self.assertLogs(logger=_logger, level="WARNING") as log:
+            span_batch.flush()
+
+        span.end.assert_called_once()
+        self.assertIn("An exception occurred in the batch hook.", log.output[0])
@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import LATENCY_CLOCK_SKEW
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import PIPELINE_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import TRANSIT_DURATION_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SAVED_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import SENT_TIME_HEADER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import PipelineLatencyRecorder
+from opentelemetry_instrumentation_django_outbox_pattern.utils.latency import stamp_time
+
+
+class PipelineLatencyRecorderTestCase(TestCase):
+    def setUp(self):
+        self.span = MagicMock()
+        self.transit_histogram = MagicMock()
+        self.pipeline_histogram = MagicMock()
+        self.recorder = PipelineLatencyRecorder(self.transit_histogram, self.pipeline_histogram)
+
+    def test_transit_and_pipeline_latencies(self):
+        # Act
+        self.recorder.record(
+            self.span, "topic:consumer.v1", {SAVED_TIME_HEADER: "1000", SENT_TIME_HEADER: "1500"}, received_ms=1600
+        )
+
+        # Assert
+        self.transit_histogram.record.assert_called_once_with(100, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+        self.pipeline_histogram.record.assert_called_once_with(600, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+        self.span.set_attributes.assert_called_once_with({TRANSIT_DURATION_MS: 100, PIPELINE_DURATION_MS: 600})
+
+    def test_negative_latency_is_clamped_and_flagged(self):
+        """Test that a consumer clock behind the publisher clock does not record negative latencies"""
+        # Act
+        self.recorder.record(self.span, "topic:consumer.v1", {SENT_TIME_HEADER: "2000"}, received_ms=1600)
+
+        # Assert
+        self.transit_histogram.record.assert_called_once_with(0, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+        self.pipeline_histogram.record.assert_not_called()
+        self.span.set_attributes.assert_called_once_with({TRANSIT_DURATION_MS: 0, LATENCY_CLOCK_SKEW: True})
+
+    def test_missing_or_invalid_headers_are_ignored(self):
+        # Act
+        self.recorder.record(self.span, "topic:consumer.v1", {SENT_TIME_HEADER: "not a time"}, received_ms=1600)
+
+        # Assert
+        self.transit_histogram.record.assert_not_called()
+        self.span.set_attributes.assert_not_called()
+
+    def test_stamp_time_keeps_the_first_time_without_overwrite(self):
+        # Arrange
+        headers = {SAVED_TIME_HEADER: "1000"}
+
+        # Act
+        stamp_time(headers, SAVED_TIME_HEADER, overwrite=False)
+        stamp_time(headers, SENT_TIME_HEADER)
+
+        # Assert
+        self.assertEqual(headers[SAVED_TIME_HEADER], "1000")
+        self.assertGreater(int(headers[SENT_TIME_HEADER]), 1000)
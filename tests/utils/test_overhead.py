@@ -0,0 +1,62 @@
+import time
+
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import WRAPPER_NAME
+from opentelemetry_instrumentation_django_outbox_pattern.utils.overhead import OverheadMeter
+from opentelemetry_instrumentation_django_outbox_pattern.utils.overhead import _logger as overhead_logger
+
+
+def on_send_message(wrapped, instance, args, kwargs):
+    return wrapped(*args, **kwargs)
+
+
+class OverheadMeterTestCase(TestCase):
+    def setUp(self):
+        self.histogram = MagicMock()
+
+    def test_wrapped_call_is_not_counted(self):
+        """Test that the recorded time excludes the call of the original function"""
+        measured = OverheadMeter(self.histogram, every=1).wrap(on_send_message)
+
+        result = measured(lambda value: time.sleep(0.05) or value, None, ("sent",), {})
+
+        self.assertEqual(result, "sent")
+        duration_ms, attributes = self.histogram.record.call_args[0]
+        self.assertLess(duration_ms, 50)
+        self.assertEqual(attributes, {WRAPPER_NAME: "on_send_message"})
+
+    def test_one_call_in_every_is_measured(self):
+        """Test that the calls in between go straight to the wrapper"""
+        measured = OverheadMeter(self.histogram, every=3).wrap(on_send_message)
+
+        for _ in range(7):
+            measured(MagicMock(), None, (), {})
+
+        self.assertEqual(self.histogram.record.call_count, 3)
+
+    def test_failed_call_is_measured_and_raised(self):
+        """Test that an exception of the wrapped call still records the overhead"""
+        measured = OverheadMeter(self.histogram, every=1).wrap(on_send_message)
+
+        with self.assertRaises(KeyError):
+            measured(MagicMock(side_effect=KeyError("fake exception")), None, (), {})
+
+        self.histogram.record.assert_called_once()
+
+    def test_failed_record_is_logged(self):
+        """Test that the histogram cannot break the wrapped call"""
+        self.histogram.record.side_effect = KeyError("fake exception")
+        measured = OverheadMeter(self.histogram, every=1).wrap(on_send_message)
+
+        with self.assertLogs(logger=overhead_logger, level="WARNING") as log:
+            self.assertEqual(measured(lambda: "sent", None, (), {}), "sent")
+
+        self.assertIn("An exception occurred while recording the instrumentation overhead.", log.output[0])
+
+    def test_invalid_interval(self):
+        """Test that a sampling interval below one call is rejected"""
+        with self.assertRaises(ValueError):
+            OverheadMeter(self.histogram, every=0)
@@ -0,0 +1,59 @@
+import tracemalloc
+
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MEMORY_PEAK_BYTES
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import THREAD_CPU_TIME_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.profiling import _logger as profiling_logger
+from opentelemetry_instrumentation_django_outbox_pattern.utils.profiling import profile_call
+
+
+class ProfilingTestCase(TestCase):
+    def test_profile_call_records_cpu_time(self):
+        """Test that profile_call records only the thread CPU time when memory is not requested"""
+        span = MagicMock()
+
+        with profile_call(span, cpu_time=True, memory=False):
+            sum(range(10_000))
+
+        attributes = span.set_attributes.call_args[0][0]
+        self.assertGreaterEqual(attributes[THREAD_CPU_TIME_MS], 0)
+        self.assertNotIn(MEMORY_PEAK_BYTES, attributes)
+
+    def test_profile_call_records_memory_peak_when_tracing(self):
+        """Test that profile_call records the tracemalloc peak of the block"""
+        span = MagicMock()
+        tracemalloc.start()
+        try:
+            with profile_call(span, cpu_time=False, memory=True):
+                buffer = bytearray(1024 * 1024)
+                del buffer
+        finally:
+            tracemalloc.stop()
+
+        attributes = span.set_attributes.call_args[0][0]
+        self.assertGreaterEqual(attributes[MEMORY_PEAK_BYTES], 1024 * 1024)
+        self.assertNotIn(THREAD_CPU_TIME_MS, attributes)
+
+    def test_profile_call_skips_memory_when_not_tracing(self):
+        """Test that the memory peak is not recorded when tracemalloc is not tracing"""
+        span = MagicMock()
+
+        with profile_call(span, cpu_time=False, memory=True):
+            pass
+
+        span.set_attributes.assert_called_once_with({})
+
+    @patch("time.thread_time_ns", side_effect=[0, ValueError("fake")])
+    def test_profile_call_logs_exceptions(self, mock_thread_time_ns):
+        """Test that an exception while recording is only logged"""
+        span = MagicMock()
+
+        with self.assertLogs(logger=profiling_logger, level="WARNING") as log:
+            with profile_call(span, cpu_time=True, memory=False):
+                pass
+
+        self.assertIn("An exception occurred while recording the call profile.", log.output[0])
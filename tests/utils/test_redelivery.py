@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.test import TestCase
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils import redelivery
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MESSAGE_DELIVERY_COUNT
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import MESSAGE_POISON_THRESHOLD
+from opentelemetry_instrumentation_django_outbox_pattern.utils.redelivery import DeliveryTracker
+from opentelemetry_instrumentation_django_outbox_pattern.utils.redelivery import RedeliveryMonitor
+
+
+class DeliveryTrackerTestCase(TestCase):
+    def test_counts_deliveries_per_key(self):
+        tracker = DeliveryTracker()
+
+        self.assertEqual([tracker.record("first"), tracker.record("first"), tracker.record("second")], [1, 2, 1])
+
+    def test_least_recently_delivered_key_is_forgotten_when_full(self):
+        """Test that the table never holds more than max_size keys"""
+        tracker = DeliveryTracker(max_size=2)
+        tracker.record("first")
+        tracker.record("second")
+        tracker.record("first")
+
+        tracker.record("third")
+
+        self.assertEqual(len(tracker), 2)
+        self.assertEqual(tracker.record("first"), 3)
+        self.assertEqual(tracker.record("second"), 1)
+
+    def test_keys_expire_after_the_ttl(self):
+        tracker = DeliveryTracker(ttl_s=10)
+        with patch.object(redelivery.time, "monotonic_ns", return_value=0):
+            tracker.record("first")
+
+        with patch.object(redelivery.time, "monotonic_ns", return_value=11_000_000_000):
+            self.assertEqual(tracker.record("first"), 1)
+
+
+class RedeliveryMonitorTestCase(TestCase):
+    def setUp(self):
+        self.span = MagicMock()
+        self.counter = MagicMock()
+        self.monitor = RedeliveryMonitor(DeliveryTracker(), self.counter, poison_threshold=3)
+        self.headers = {"dop-msg-id": "1", "message-id": "broker-1", "dop-correlation-id": "correlation"}
+
+    def test_redeliveries_are_counted_and_flagged_as_poison(self):
+        """Test that the broker message id does not matter and the poison event starts at the threshold"""
+        delivery_counts = [
+            self.monitor.record(self.span, "topic:consumer.v1", {**self.headers, "message-id": f"broker-{index}"})
+            for index in range(4)
+        ]
+
+        self.assertEqual(delivery_counts, [1, 2, 3, 4])
+        self.assertEqual(self.counter.add.call_count, 3)
+        self.counter.add.assert_called_with(1, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+        self.span.set_attribute.assert_called_with(MESSAGE_DELIVERY_COUNT, 4)
+        self.assertEqual(self.span.add_event.call_count, 2)
+        self.span.add_event.assert_called_with(
+            "message.poison", {MESSAGE_DELIVERY_COUNT: 4, MESSAGE_POISON_THRESHOLD: 3}
+        )
+
+    def test_messages_with_other_correlation_id_are_tracked_apart(self):
+        self.monitor.record(self.span, "topic:consumer.v1", self.headers)
+
+        delivery_count = self.monitor.record(
+            self.span, "topic:consumer.v1", {**self.headers, "dop-correlation-id": "other"}
+        )
+
+        self.assertEqual(delivery_count, 1)
+        self.counter.add.assert_not_called()
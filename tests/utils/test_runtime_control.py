@@ -0,0 +1,78 @@
+from django.test import TestCase
+from opentelemetry.instrumentation.utils import suppress_instrumentation
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import CONSUMER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import PUBLISHER
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import InstrumentationSwitch
+from opentelemetry_instrumentation_django_outbox_pattern.utils.runtime_control import is_tracing_enabled
+
+
+class InstrumentationSwitchTestCase(TestCase):
+    def setUp(self):
+        self.switch = InstrumentationSwitch()
+
+    def test_everything_is_enabled_by_default(self):
+        """Test that a new switch has both sides enabled"""
+        self.assertTrue(self.switch.is_enabled(PUBLISHER))
+        self.assertTrue(self.switch.is_enabled(CONSUMER, "exchange:routing-key"))
+
+    def test_disable_side(self):
+        """Test that disabling a side disables all its destinations and keeps the other side enabled"""
+        self.switch.disable(CONSUMER)
+
+        self.assertFalse(self.switch.is_enabled(CONSUMER))
+        self.assertFalse(self.switch.is_enabled(CONSUMER, "exchange:routing-key"))
+        self.assertTrue(self.switch.is_enabled(PUBLISHER, "exchange:routing-key"))
+
+    def test_disable_destination(self):
+        """Test that disabling a destination keeps the side and the other destinations enabled"""
+        self.switch.disable(PUBLISHER, "exchange:noisy")
+
+        self.assertFalse(self.switch.is_enabled(PUBLISHER, "exchange:noisy"))
+        self.assertTrue(self.switch.is_enabled(PUBLISHER, "exchange:other"))
+        self.assertTrue(self.switch.is_enabled(PUBLISHER))
+        self.assertTrue(self.switch.is_enabled(CONSUMER, "exchange:noisy"))
+
+    def test_enable_destination(self):
+        """Test that enabling a destination only removes that destination"""
+        self.switch.disable(PUBLISHER, "exchange:a")
+        self.switch.disable(PUBLISHER, "exchange:b")
+
+        self.switch.enable(PUBLISHER, "exchange:a")
+
+        self.assertTrue(self.switch.is_enabled(PUBLISHER, "exchange:a"))
+        self.assertFalse(self.switch.is_enabled(PUBLISHER, "exchange:b"))
+
+    def test_enable_side_enables_its_destinations(self):
+        """Test that enabling a side clears the side and its destinations, keeping the other side untouched"""
+        self.switch.disable(PUBLISHER)
+        self.switch.disable(PUBLISHER, "exchange:a")
+        self.switch.disable(CONSUMER, "exchange:a")
+
+        self.switch.enable(PUBLISHER)
+
+        self.assertTrue(self.switch.is_enabled(PUBLISHER, "exchange:a"))
+        self.assertFalse(self.switch.is_enabled(CONSUMER, "exchange:a"))
+
+    def test_reset(self):
+        """Test that reset enables everything"""
+        self.switch.disable(PUBLISHER)
+        self.switch.disable(CONSUMER, "exchange:a")
+
+        self.switch.reset()
+
+        self.assertTrue(self.switch.is_enabled(PUBLISHER))
+        self.assertTrue(self.switch.is_enabled(CONSUMER, "exchange:a"))
+
+    def test_invalid_side(self):
+        """Test that an unknown side raises ValueError"""
+        with self.assertRaises(ValueError):
+            self.switch.disable("broker")
+        with self.assertRaises(ValueError):
+            self.switch.enable("broker")
+
+    def test_is_tracing_enabled_honors_suppress_instrumentation(self):
+        """Test that the helper returns False while OpenTelemetry instrumentation is suppressed"""
+        self.assertTrue(is_tracing_enabled(CONSUMER))
+        with suppress_instrumentation():
+            self.assertFalse(is_tracing_enabled(CONSUMER))
@@ -0,0 +1,105 @@
+from django.test import TestCase
+from opentelemetry import trace
+from opentelemetry.sdk.trace.sampling import Decision
+from opentelemetry.trace import SpanContext
+from opentelemetry.trace import TraceFlags
+from opentelemetry.trace.span import TraceState
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import MAX_THRESHOLD
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import ConsistentProbabilitySampler
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import encode_threshold
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import get_randomness
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import get_sampling_threshold
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import is_sampled_out
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import threshold_for_ratio
+from opentelemetry_instrumentation_django_outbox_pattern.utils.sampling import with_sampling_threshold
+
+KEPT_TRACE_ID = int("f" * 32, 16)
+REJECTED_TRACE_ID = int("1" * 32, 16)
+
+
+def parent_context(trace_state: TraceState, sampled: bool = True):
+    span_context = SpanContext(
+        trace_id=KEPT_TRACE_ID,
+        span_id=2,
+        is_remote=True,
+        trace_flags=TraceFlags(TraceFlags.SAMPLED if sampled else TraceFlags.DEFAULT),
+        trace_state=trace_state,
+    )
+    return trace.set_span_in_context(trace.NonRecordingSpan(span_context))
+
+
+class ThresholdTestCase(TestCase):
+    def test_threshold_for_ratio(self):
+        """Test the rejection thresholds and their encodings of the specification examples"""
+        self.assertEqual(encode_threshold(threshold_for_ratio(1.0)), "0")
+        self.assertEqual(encode_threshold(threshold_for_ratio(0.5)), "8")
+        self.assertEqual(encode_threshold(threshold_for_ratio(0.25)), "c")
+        self.assertEqual(encode_threshold(threshold_for_ratio(0.1)), "e6666666666666")
+        self.assertEqual(threshold_for_ratio(0.0), MAX_THRESHOLD)
+        with self.assertRaises(ValueError):
+            threshold_for_ratio(1.5)
+
+    def test_parse_threshold_and_randomness(self):
+        """Test that th and rv are read from the ot entry and invalid values are ignored"""
+        trace_state = TraceState([("ot", f"rv:{'0' * 13}1;th:c"), ("vendor", "value")])
+
+        self.assertEqual(get_sampling_threshold(trace_state), threshold_for_ratio(0.25))
+        self.assertEqual(get_randomness(KEPT_TRACE_ID, trace_state), 1)
+        self.assertEqual(get_randomness(KEPT_TRACE_ID, TraceState()), (1 << 56) - 1)
+        self.assertIsNone(get_sampling_threshold(TraceState([("ot", "th:xyz")])))
+        self.assertIsNone(get_sampling_threshold(None))
+
+    def test_with_sampling_threshold_keeps_the_other_entries(self):
+        """Test that setting the threshold replaces th only"""
+        trace_state = TraceState([("ot", "th:8;rv:00000000000001"), ("vendor", "value")])
+
+        updated = with_sampling_threshold(trace_state, threshold_for_ratio(0.25))
+
+        self.assertEqual(updated.get("ot"), "th:c;rv:00000000000001")
+        self.assertEqual(updated.get("vendor"), "value")
+        self.assertEqual(with_sampling_threshold(None, 0).get("ot"), "th:0")
+
+    def test_is_sampled_out(self):
+        """Test that only a threshold above the randomness rejects the trace"""
+        trace_state = TraceState([("ot", "th:8")])
+
+        self.assertTrue(is_sampled_out(SpanContext(REJECTED_TRACE_ID, 2, True, trace_state=trace_state)))
+        self.assertFalse(is_sampled_out(SpanContext(KEPT_TRACE_ID, 2, True, trace_state=trace_state)))
+        self.assertFalse(is_sampled_out(SpanContext(REJECTED_TRACE_ID, 2, True)))
+
+
+class ConsistentProbabilitySamplerTestCase(TestCase):
+    def setUp(self):
+        self.sampler = ConsistentProbabilitySampler(0.5)
+
+    def test_root_span_records_the_threshold(self):
+        """Test that root spans are decided on the trace id and carry the threshold, kept or not"""
+        kept = self.sampler.should_sample(None, KEPT_TRACE_ID, "send")
+        rejected = self.sampler.should_sample(None, REJECTED_TRACE_ID, "send")
+
+        self.assertEqual(kept.decision, Decision.RECORD_AND_SAMPLE)
+        self.assertEqual(rejected.decision, Decision.DROP)
+        self.assertEqual(kept.trace_state.get("ot"), "th:8")
+        self.assertEqual(rejected.trace_state.get("ot"), "th:8")
+
+    def test_child_span_honors_the_parent_threshold(self):
+        """Test that the parent threshold wins over the sampler ratio"""
+        sampler = ConsistentProbabilitySampler(1.0)
+        context = parent_context(TraceState([("ot", "th:8")]))
+
+        self.assertEqual(sampler.should_sample(context, REJECTED_TRACE_ID, "process").decision, Decision.DROP)
+        result = sampler.should_sample(context, KEPT_TRACE_ID, "process")
+        self.assertEqual(result.decision, Decision.RECORD_AND_SAMPLE)
+        self.assertEqual(result.trace_state.get("ot"), "th:8")
+
+    def test_child_span_follows_a_parent_without_threshold(self):
+        """Test that parents sampled by other samplers are followed like ParentBased"""
+        sampled = self.sampler.should_sample(parent_context(TraceState()), REJECTED_TRACE_ID, "process")
+        unsampled = self.sampler.should_sample(parent_context(TraceState(), sampled=False), KEPT_TRACE_ID, "process")
+
+        self.assertEqual(sampled.decision, Decision.RECORD_AND_SAMPLE)
+        self.assertEqual(unsampled.decision, Decision.DROP)
+
+    def test_description(self):
+        self.assertEqual(self.sampler.get_description(), "ConsistentProbabilitySampler{0.5}")
@@ -10,12 +10,20 @@ from opentelemetry.semconv._incubating.attributes.messaging_attributes import ME
 from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_SYSTEM
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_NAME
 from opentelemetry.semconv._incubating.attributes.net_attributes import NET_PEER_PORT
+from opentelemetry.trace import INVALID_SPAN
+from opentelemetry.trace import INVALID_SPAN_CONTEXT
+from opentelemetry.trace import NonRecordingSpan
 from opentelemetry.trace import SpanKind
 
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import MessageTelemetry
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import body_size
 from opentelemetry_instrumentation_django_outbox_pattern.utils.span import enrich_span
 from opentelemetry_instrumentation_django_outbox_pattern.utils.span import enrich_span_with_host_data
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import get_host_attributes
 from opentelemetry_instrumentation_django_outbox_pattern.utils.span import get_messaging_ack_nack_span
 from opentelemetry_instrumentation_django_outbox_pattern.utils.span import get_span
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import span_name
+from opentelemetry_instrumentation_django_outbox_pattern.utils.span import start_message_span
 
 
 class SpanUtilsTestCase(TestCase):
@@ -125,7 +133,7 @@ class SpanUtilsTestCase(TestCase):
             destination = "test-destination"
 
             mock_process_span = MagicMock()
-            mock_process_span._attributes = {
+            mock_process_span.attributes = {
                 MESSAGING_DESTINATION_NAME: destination,
                 MESSAGING_MESSAGE_CONVERSATION_ID: "test-correlation-id",
             }
@@ -149,3 +157,75 @@ class SpanUtilsTestCase(TestCase):
 
             # reset mock objects for the next iteration
             mock_enrich_span_with_host_data.reset_mock()
+
+    def test_get_messaging_ack_nack_span_without_recording_process_span(self):
+        """Test that an unsampled or missing process span names the ack span with UNKNOWN"""
+        mock_tracer = MagicMock()
+        mock_tracer.start_span.return_value.is_recording.return_value = False
+
+        for process_span in [INVALID_SPAN, NonRecordingSpan(INVALID_SPAN_CONTEXT)]:
+            get_messaging_ack_nack_span(mock_tracer, "ack", process_span)
+
+            mock_tracer.start_span.assert_called_with(name="ack UNKNOWN", kind=SpanKind.CONSUMER)
+
+    def test_get_messaging_ack_nack_span_from_message(self):
+        """Test that the ack span reads the destination and conversation id from the message record"""
+        mock_tracer = MagicMock()
+        message = MessageTelemetry("test-destination", "test-correlation-id", 10)
+
+        get_messaging_ack_nack_span(mock_tracer, "nack", INVALID_SPAN, message=message)
+
+        mock_tracer.start_span.assert_called_once_with(name="nack test-destination", kind=SpanKind.CONSUMER)
+        attributes = mock_tracer.start_span.return_value.set_attributes.call_args_list[0][0][0]
+        self.assertEqual(attributes[MESSAGING_MESSAGE_CONVERSATION_ID], "test-correlation-id")
+
+
+class MessageTelemetryTestCase(TestCase):
+    def test_from_message_reads_the_headers_and_the_encoded_body_size(self):
+        """Test that the record keeps the values of the span attributes"""
+        message = MessageTelemetry.from_message(
+            "test-destination", {"dop-correlation-id": "test-correlation-id"}, '{"test": "body"}', "publish"
+        )
+
+        self.assertEqual(
+            message.attributes(),
+            {
+                MESSAGING_DESTINATION_NAME: "test-destination",
+                MESSAGING_MESSAGE_CONVERSATION_ID: "test-correlation-id",
+                MESSAGING_MESSAGE_BODY_SIZE: 16,
+                MESSAGING_OPERATION_TYPE: "publish",
+            },
+        )
+        self.assertFalse(hasattr(message, "__dict__"))
+
+    def test_body_size_counts_the_encoded_bytes(self):
+        """Test that the size is the one of the UTF-8 bytes sent to the broker, not of the Python object"""
+        self.assertEqual(body_size('{"name": "café"}'), 17)
+        self.assertEqual(body_size(b'{"name": "cafe"}'), 16)
+
+    def test_start_message_span_starts_at_the_record_time(self):
+        """Test that the span is started with the record start time and enriched with the broker attributes"""
+        mock_tracer = MagicMock()
+        message = MessageTelemetry("test-destination", "test-correlation-id", 10, started_ns=123)
+
+        span = start_message_span(mock_tracer, message, SpanKind.CONSUMER, "process test-destination")
+
+        mock_tracer.start_span.assert_called_once_with(
+            name="process test-destination", kind=SpanKind.CONSUMER, start_time=123
+        )
+        span.set_attributes.assert_any_call(message.attributes())
+        span.set_attributes.assert_any_call(get_host_attributes())
+
+    def test_span_name_is_memoized(self):
+        """Test that the name of a destination is built once"""
+        self.assertIs(span_name("process", "topic:memoized"), span_name("process", "topic:memoized"))
+
+    def test_host_attributes_follow_the_settings(self):
+        """Test that the cached broker attributes are read again when the settings change"""
+        attributes = get_host_attributes()
+
+        with override_settings(STOMP_SYSTEM="test-system"):
+            self.assertEqual(get_host_attributes()[MESSAGING_SYSTEM], "test-system")
+
+        self.assertEqual(get_host_attributes(), attributes)
+        self.assertIs(get_host_attributes(), get_host_attributes())
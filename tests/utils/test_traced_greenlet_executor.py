@@ -0,0 +1,135 @@
+import threading
+
+from django.test import TestCase
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.trace import NonRecordingSpan
+from opentelemetry.trace import SpanContext
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.traced_greenlet_executor import TracedGreenletExecutor
+
+
+class GreenletExit(BaseException):
+    """Stand-in of gevent.GreenletExit, raised in a greenlet that is killed"""
+
+
+class FakeSpawn:
+    """Stand-in of gevent.spawn, each greenlet is a thread that starts with an empty context like a new greenlet"""
+
+    def __init__(self):
+        self.greenlets = []
+
+    def __call__(self, function, *args):
+        greenlet = threading.Thread(target=self._run, args=(function, *args), daemon=True)
+        self.greenlets.append(greenlet)
+        greenlet.start()
+        return greenlet
+
+    @staticmethod
+    def _run(function, *args):
+        # gevent ends a killed greenlet quietly, GreenletExit is not reported as an error
+        try:
+            function(*args)
+        except GreenletExit:
+            pass
+
+
+class TracedGreenletExecutorTestCase(TestCase):
+    def setUp(self):
+        self.spawn = FakeSpawn()
+        self.executor = TracedGreenletExecutor(spawn=self.spawn, max_concurrency=2)
+        self.addCleanup(self.executor.shutdown, wait=False, cancel_futures=True)
+
+    def test_task_runs_in_a_copy_of_the_submitter_context(self):
+        """Test that the span of the listener follows the message and changes made by the task do not leak"""
+        span = NonRecordingSpan(SpanContext(trace_id=1, span_id=2, is_remote=False))
+
+        def leaky_task():
+            otel_context.attach(otel_context.set_value("leaked", True))
+            return trace.get_current_span()
+
+        token = otel_context.attach(trace.set_span_in_context(span))
+        try:
+            current_span = self.executor.submit(leaky_task).result(timeout=5)
+            leaked = self.executor.submit(otel_context.get_value, "leaked").result(timeout=5)
+        finally:
+            otel_context.detach(token)
+
+        self.assertIs(current_span, span)
+        self.assertIsNone(leaked)
+        self.assertIsNone(otel_context.get_value("leaked"))
+
+    def test_at_most_max_concurrency_tasks_run_at_a_time(self):
+        """Test that the waiting tasks run in submission order on the greenlets already started"""
+        release = threading.Event()
+        lock = threading.Lock()
+        running = []
+        peak = []
+        started = []
+
+        def task(index):
+            with lock:
+                running.append(index)
+                started.append(index)
+                peak.append(len(running))
+            release.wait(timeout=5)
+            with lock:
+                running.remove(index)
+
+        futures = [self.executor.submit(task, index) for index in range(6)]
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(len(self.spawn.greenlets), 2)
+        self.assertEqual(started[2:], [2, 3, 4, 5])
+
+    def test_exception_is_set_on_the_future(self):
+        """Test that a failing task does not stop the greenlet from taking the next task"""
+        executor = TracedGreenletExecutor(spawn=self.spawn, max_concurrency=1)
+
+        failed = executor.submit(lambda: {}["missing"])
+        succeeded = executor.submit(lambda: "done")
+
+        self.assertIsInstance(failed.exception(timeout=5), KeyError)
+        self.assertEqual(succeeded.result(timeout=5), "done")
+        executor.shutdown()
+
+    def test_next_task_gets_a_new_greenlet_when_one_is_killed(self):
+        """Test that killing a greenlet does not strand the tasks waiting behind it"""
+        executor = TracedGreenletExecutor(spawn=self.spawn, max_concurrency=1)
+        release = threading.Event()
+
+        def killed():
+            release.wait(timeout=5)
+            raise GreenletExit()
+
+        killed_future = executor.submit(killed)
+        next_future = executor.submit(lambda: "done")
+        release.set()
+
+        self.assertIsInstance(killed_future.exception(timeout=5), GreenletExit)
+        self.assertEqual(next_future.result(timeout=5), "done")
+        self.assertEqual(len(self.spawn.greenlets), 2)
+        executor.shutdown()
+
+    def test_shutdown(self):
+        """Test that the consumer gets the RuntimeError it expects and the waiting tasks can be cancelled"""
+        release = threading.Event()
+        running = self.executor.submit(release.wait, 5)
+        self.executor.submit(release.wait, 5)
+        waiting = self.executor.submit(release.wait, 5)
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        release.set()
+
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(release.wait, 5)
+        self.assertTrue(waiting.cancelled())
+        self.assertTrue(running.result(timeout=5))
+
+    def test_invalid_max_concurrency(self):
+        """Test that a concurrency below one task is rejected"""
+        with self.assertRaises(ValueError):
+            TracedGreenletExecutor(spawn=self.spawn, max_concurrency=0)
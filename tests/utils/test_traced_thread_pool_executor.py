@@ -38,6 +38,19 @@ class TestTracedThreadPoolExecutor(TestBase):
             test_fn.assert_called_once()
             self.assertEqual(result, "test_result")
 
+    def test_with_otel_context_detaches_when_function_raises(self):
+        """Test that with_otel_context restores the previous context of the worker thread"""
+        # Arrange
+        previous_context = otel_context.get_current()
+        test_fn = mock.MagicMock(side_effect=KeyError("fake exception"))
+
+        # Act
+        with self.assertRaises(KeyError):
+            with_otel_context(otel_context.set_value("key", "value"), test_fn)
+
+        # Assert
+        self.assertIs(otel_context.get_current(), previous_context)
+
     def test_traced_pool_executor_no_context_branch(self):
         """Test the else branch of submit when no context exists (line 29)"""
         # Arrange
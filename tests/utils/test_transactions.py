@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils import transactions
+from opentelemetry_instrumentation_django_outbox_pattern.utils.transactions import COMMITTED
+from opentelemetry_instrumentation_django_outbox_pattern.utils.transactions import ROLLED_BACK
+from opentelemetry_instrumentation_django_outbox_pattern.utils.transactions import TransactionWatcher
+
+
+class TransactionWatcherTestCase(TestCase):
+    def setUp(self):
+        self.watcher = TransactionWatcher()
+
+    def test_commit_is_reported_once(self):
+        """Test that a committed callback is not reported again as rolled back on the next exit"""
+        callback = MagicMock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.assertTrue(self.watcher.watch(callback))
+            self.watcher.resolve()
+            callback.assert_not_called()
+        self.watcher.resolve()
+
+        callback.assert_called_once_with(COMMITTED)
+        self.assertEqual(self.watcher.pending(), 0)
+
+    def test_rollback_of_the_savepoint_is_reported(self):
+        """Test that the callbacks registered in a rolled back savepoint are reported and the outer ones are kept"""
+        outer = MagicMock()
+        inner = MagicMock()
+
+        with transaction.atomic():
+            self.watcher.watch(outer)
+            try:
+                with transaction.atomic():
+                    self.watcher.watch(inner)
+                    raise KeyError("fake exception")
+            except KeyError:
+                self.watcher.resolve()
+
+            inner.assert_called_once_with(ROLLED_BACK)
+            outer.assert_not_called()
+            self.assertEqual(self.watcher.pending(), 1)
+
+    def test_failing_callback_is_logged(self):
+        """Test that a failing callback does not break the exit of the atomic block"""
+        with self.assertLogs(logger=transactions._logger, level="WARNING") as log:
+            try:
+                with transaction.atomic():
+                    self.watcher.watch(MagicMock(side_effect=KeyError("fake exception")))
+                    raise ValueError("fake exception")
+            except ValueError:
+                self.watcher.resolve()
+
+        self.assertIn("An exception occurred while reporting the outcome of a transaction.", log.output[0])
+
+    def test_no_transaction_in_progress(self):
+        """Test that the callback is not registered in autocommit"""
+        connection = transaction.get_connection()
+        connection.in_atomic_block = False
+        try:
+            watched = self.watcher.watch(MagicMock())
+        finally:
+            connection.in_atomic_block = True
+
+        self.assertFalse(watched)
+
+    def test_nothing_pending_is_resolved_without_the_connection(self):
+        """Test that the exits of atomic blocks without watched callbacks return right away"""
+        with patch.object(transactions.transaction, "get_connection") as get_connection:
+            self.watcher.resolve()
+
+        get_connection.assert_not_called()
@@ -0,0 +1,94 @@
+import threading
+
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from opentelemetry.semconv._incubating.attributes.messaging_attributes import MESSAGING_DESTINATION_NAME
+
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HANDLER_DEADLINE_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HANDLER_ELAPSED_MS
+from opentelemetry_instrumentation_django_outbox_pattern.utils.attributes import HANDLER_THREAD_NAME
+from opentelemetry_instrumentation_django_outbox_pattern.utils.watchdog import HandlerWatchdog
+from opentelemetry_instrumentation_django_outbox_pattern.utils.watchdog import _logger as watchdog_logger
+
+
+class HandlerWatchdogTestCase(TestCase):
+    def setUp(self):
+        self.counter = MagicMock()
+        self.watchdog = HandlerWatchdog(deadline_s=1, scan_interval_s=3600, counter=self.counter)
+        self.addCleanup(self.watchdog.shutdown)
+        self.span = MagicMock()
+
+    def test_stuck_handler_is_reported_once(self):
+        """Test that a handler over the deadline gets one span event, one count and one log"""
+        key = self.watchdog.track(self.span, "topic:consumer.v1")
+        started_ns = self.watchdog._in_flight[key].started_ns
+
+        with self.assertLogs(logger=watchdog_logger, level="WARNING") as log:
+            reported = [self.watchdog.scan(started_ns + offset) for offset in (500_000_000, 1_500_000_000, 3 << 30)]
+
+        self.assertEqual(reported, [0, 1, 0])
+        self.span.add_event.assert_called_once_with(
+            "handler.stuck",
+            {
+                HANDLER_ELAPSED_MS: 1500,
+                HANDLER_DEADLINE_MS: 1000,
+                HANDLER_THREAD_NAME: threading.current_thread().name,
+            },
+        )
+        self.counter.add.assert_called_once_with(1, {MESSAGING_DESTINATION_NAME: "topic:consumer.v1"})
+        self.assertEqual(len(log.output), 1)
+
+    def test_finished_handler_is_not_reported(self):
+        key = self.watchdog.track(self.span, "topic:consumer.v1")
+        started_ns = self.watchdog._in_flight[key].started_ns
+
+        self.watchdog.untrack(key)
+
+        self.assertEqual(self.watchdog.scan(started_ns + 2_000_000_000), 0)
+        self.assertEqual(self.watchdog.in_flight(), 0)
+
+    def test_stack_of_the_stuck_thread_is_logged(self):
+        """Test that dump_stack logs where the worker thread is waiting"""
+        self.watchdog.dump_stack = True
+        tracked = threading.Event()
+        release = threading.Event()
+
+        def stuck_callback():
+            self.watchdog.track(self.span, "topic:consumer.v1")
+            tracked.set()
+            release.wait(timeout=5)
+
+        worker = threading.Thread(target=stuck_callback, name="stuck-worker")
+        worker.start()
+        tracked.wait(timeout=5)
+        try:
+            with self.assertLogs(logger=watchdog_logger, level="WARNING") as log:
+                self.watchdog.scan(max(handler.started_ns for handler in self.watchdog._in_flight.values()) + (2 << 30))
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertIn("stuck-worker", log.output[0])
+        self.assertIn("in stuck_callback", log.output[0])
+
+    def test_stack_of_the_stuck_greenlet_is_logged(self):
+        """Test that in greenlet mode the stack is the one of the handler greenlet, not of the shared thread"""
+
+        def stuck_greenlet_callback():
+            yield
+
+        # A suspended generator stands in for a greenlet switched out while it waits
+        suspended = stuck_greenlet_callback()
+        next(suspended)
+        self.addCleanup(suspended.close)
+        greenlet = MagicMock(gr_frame=suspended.gi_frame)
+        self.watchdog.dump_stack = True
+        self.watchdog.current_greenlet = MagicMock(return_value=greenlet)
+        self.watchdog.track(self.span, "topic:consumer.v1")
+
+        with self.assertLogs(logger=watchdog_logger, level="WARNING") as log:
+            self.watchdog.scan(max(handler.started_ns for handler in self.watchdog._in_flight.values()) + (2 << 30))
+
+        self.assertIn("in stuck_greenlet_callback", log.output[0])
+        self.assertNotIn("in test_stack_of_the_stuck_greenlet_is_logged", log.output[0])